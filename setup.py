@@ -40,6 +40,7 @@ setup(name=name,
           "ffmpeg-python @ git+https://github.com/hdk5/ffmpeg-python@asyncio_support#egg=ffmpeg-python",
           "googletransx",
           "html2text",
+          "importlib_metadata; python_version < '3.8'",
           "instaloader == 4.5.5",
           "isodate",
           "lxml",
@@ -57,7 +58,6 @@ setup(name=name,
           "pyyaml",
           "pyyaml-include",
           "requests",
-          "stevedore",
           "streamlink>=0.11.0",
           "timeago",
           "tonyc_utils==1.0.1",
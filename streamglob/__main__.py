@@ -3,6 +3,7 @@ import logging
 import sys
 import os
 import traceback
+from . import startup
 from datetime import datetime, timedelta
 from collections import namedtuple
 import argparse
@@ -52,6 +53,10 @@ from . import session
 from . import providers
 from . import player
 from . import tasks
+from . import linkcheck
+from . import downloads
+from . import debounce
+from . import translation
 from .exceptions import *
 
 urwid.AsyncioEventLoop._idle_emulation_delay = 1/20
@@ -77,10 +82,17 @@ def load_palette():
     for k, v in config.settings.profile.attributes.items():
         state.palette_entries[k] = PaletteEntry.from_config(v)
 
-    for pname, p in providers.PROVIDERS.items():
-        if not hasattr(p.config, "attributes"):
+    for pname in providers.PROVIDERS.keys():
+        # read from the config so providers don't have to be loaded, unless
+        # they're loaded and have derived attributes of their own
+        attributes = (
+            providers.PROVIDERS[pname].config
+            if providers.PROVIDERS.is_loaded(pname)
+            else config.settings.profile.providers.get(pname) or {}
+        ).get("attributes")
+        if not attributes:
             continue
-        for gname, group in p.config.attributes.items():
+        for gname, group in attributes.items():
             for k, v in group.items():
                 ename = f"{pname}.{gname}.{k}"
                 state.palette_entries[ename] = PaletteEntry.from_config(v)
@@ -340,6 +352,19 @@ def run_gui(action, provider, **kwargs):
     state.listings_view = ListingsView()
     state.listings_view.set_provider(provider.IDENTIFIER)
     state.tasks_view = TasksView()
+    # only the TUI resumes the persisted download queue, since the CLI would
+    # kill the downloads when it exits
+    state.task_manager.restore()
+    # index the output directories in the background, so looking up
+    # downloaded files doesn't have to walk them on the UI loop
+    downloads.index.start(
+        [config.settings.profile.get_path("output.path") or "."] + [
+            path for path in (
+                config.settings.profile.get_path(f"providers.{name}.output.path")
+                for name in config.settings.profile.providers
+            ) if path
+        ]
+    )
 
     set_stdout_level(logging.CRITICAL)
 
@@ -427,19 +452,41 @@ def run_gui(action, provider, **kwargs):
         rpc = JsonRpc()
 
         methods = []
-        for pname, p in providers.PROVIDERS.items():
-            methods += [
-                (pname, func)
-                for name, func in p.RPC_METHODS
-            ]
+        for pname in providers.PROVIDERS.keys():
+            try:
+                methods += [
+                    (pname, func)
+                    for name, func in providers.PROVIDERS.rpc_methods(pname)
+                ]
+            except Exception:
+                logger.error(f"failed to load RPC methods for {pname}")
+                logger.error(traceback.format_exc())
 
         rpc.add_methods(*methods)
         app.router.add_route("*", "/", rpc.handle_request)
         asyncio.create_task(start_server_async())
 
+    def started(loop, user_data):
+        startup.profile.finish()
+        logger.info(f"startup profile:\n{startup.profile.report()}")
+
+    def start_preview_standby(loop, user_data):
+        state.task_manager.start_preview_standby()
+
+    state.loop.set_alarm_in(0, started)
     state.loop.set_alarm_in(0, start_server)
     state.loop.set_alarm_in(0, activate_view)
-    state.loop.run()
+    state.loop.set_alarm_in(0, start_preview_standby)
+    try:
+        state.loop.run()
+    finally:
+        # quitting only schedules TaskManager.stop, which won't get to run, so
+        # write out the queue changes that are still waiting to be flushed
+        state.task_manager.store.flush()
+        state.task_manager.stop_preview_standby()
+        translation.translator.stop()
+        if debounce.debouncer.latency:
+            logger.info(f"focus latency:\n{debounce.debouncer.report()}")
 
 
 async def run_tasks(tasks):
@@ -494,7 +541,13 @@ def main():
     init_parser = argparse.ArgumentParser()
     init_parser.add_argument("-c", "--config-file", help="use alternate config file")
     init_parser.add_argument("-p", "--profile", help="use alternate config profile")
+    init_parser.add_argument("--profile-startup", action="store_true",
+                             help="report how long each phase of startup takes")
     options, args = init_parser.parse_known_args()
+    profile_startup = options.profile_startup
+    startup.profile.record(
+        "import", "streamglob modules", time.perf_counter() - startup.STARTED
+    )
 
     # -c used to refer to a config dir
     config_file = None
@@ -507,11 +560,13 @@ def main():
                 f"using `{config_file}`"
             )
 
-    config.load(config_file, merge_default=True)
-    if options.profile:
-        for p in options.profile.split(","):
-            config.settings.include_profile(p)
-    player.Player.load()
+    with startup.profile.phase("config"):
+        config.load(config_file, merge_default=True)
+        if options.profile:
+            for p in options.profile.split(","):
+                config.settings.include_profile(p)
+    with startup.profile.phase("programs"):
+        player.Player.load()
 
     parser = argparse.ArgumentParser()
     group = parser.add_mutually_exclusive_group()
@@ -532,15 +587,21 @@ def main():
     state.logger = setup_logging(options.verbose - options.quiet, quiet_stdout=False)
 
     state.task_manager = tasks.TaskManager()
-    providers.load()
-    model.init()
-    providers.load_config(default=state.app_data.selected_provider)
+    state.link_checker = linkcheck.LinkChecker()
+    with startup.profile.phase("provider registry"):
+        providers.load()
+    with startup.profile.phase("database"):
+        model.init()
+    with startup.profile.phase("provider config"):
+        providers.load_config(default=state.app_data.selected_provider)
 
     spec = None
 
     logger.debug(f"{PACKAGE_NAME} starting")
 
-    state.task_manager_task = state.event_loop.create_task(state.task_manager.start())
+    state.task_manager_task = state.event_loop.create_task(
+        state.task_manager.start()
+    )
 
     log_file = os.path.join(config.settings.CONFIG_DIR, f"{PACKAGE_NAME}.log")
     fh = logging.FileHandler(log_file)
@@ -553,9 +614,12 @@ def main():
     action, provider, selection, opts = providers.parse_uri(options.uri)
 
     if selection:
+        startup.profile.finish()
         rc = run_cli(action, provider, selection, **opts)
     else:
         rc = run_gui(action, provider, **opts)
+    if profile_startup:
+        print(startup.profile.report(), file=sys.stderr)
     return rc
 
 if __name__ == "__main__":
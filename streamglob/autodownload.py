@@ -0,0 +1,143 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import itertools
+from datetime import datetime, date, time
+
+from pony.orm import db_session, count, ObjectNotFound
+
+from .state import *
+from . import model
+
+
+class AutoDownloader(object):
+    """
+    Queues downloads for new listings whose label matches a download rule.
+    Providers submit listings as they're fetched, and they're picked up in
+    batches in the background so fetching isn't held up.  Listings that are
+    already downloaded or queued are skipped, each rule's `quota` limits how
+    many of its listings are queued per day, and its `priority` is given to
+    the download tasks.  Queued listings are stamped with `auto_downloaded`,
+    so quotas are counted from the database and hold across restarts.
+    """
+
+    BATCH_SIZE = 50
+    BATCH_DELAY = 2
+
+    def __init__(self, task_manager):
+        self.task_manager = task_manager
+        self.queue = asyncio.Queue()
+        self.submitted = set()
+        self.run_task = None
+
+    def submit(self, provider, listing_id):
+        key = (provider.IDENTIFIER, listing_id)
+        if key in self.submitted:
+            return
+        self.submitted.add(key)
+        self.queue.put_nowait((provider, listing_id))
+
+    def start(self):
+        self.run_task = state.event_loop.create_task(self.run())
+
+    def stop(self):
+        if self.run_task:
+            self.run_task.cancel()
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            await asyncio.sleep(self.BATCH_DELAY)
+            while len(batch) < self.BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.process(batch)
+            except Exception as e:
+                logger.error("Exception: ", exc_info=e)
+            finally:
+                for provider, listing_id in batch:
+                    self.submitted.discard((provider.IDENTIFIER, listing_id))
+
+    def queued_listings(self):
+        tm = self.task_manager
+        return {
+            (task.provider_id, task.listing.media_listing_id)
+            for task in itertools.chain(
+                    tm.to_download, tm.active, tm.postprocessing, tm.failed
+            )
+            if getattr(task, "listing", None)
+        }
+
+    def queued_today(self, provider, label):
+        provider_id = provider.IDENTIFIER
+        today = datetime.combine(date.today(), time())
+        with db_session:
+            return count(
+                l for l in provider.LISTING_CLASS
+                if l.provider_id == provider_id
+                and l.label == label
+                and l.auto_downloaded >= today
+            )
+
+    def under_quota(self, provider, label, rule):
+        return not rule.quota or self.queued_today(provider, label) < rule.quota
+
+    async def load(self, provider, listing_id):
+        with db_session:
+            try:
+                listing = provider.LISTING_CLASS[listing_id].detach()
+            except ObjectNotFound:
+                return None
+        if isinstance(listing, model.InflatableMediaListingMixin) and not listing.is_inflated:
+            # inflating awaits the provider and opens its own session, so it
+            # can't happen inside ours
+            await listing.inflate()
+            with db_session:
+                # reload, since inflating replaces the sources
+                listing = listing.attach().detach()
+        return listing
+
+    async def process(self, batch):
+
+        queued = self.queued_listings()
+
+        with db_session:
+            entries = []
+            for provider, listing_id in batch:
+                try:
+                    listing = provider.LISTING_CLASS[listing_id]
+                except ObjectNotFound:
+                    continue
+                rule = provider.download_rules.get(listing.label)
+                if not rule or listing.downloaded:
+                    continue
+                entries.append((provider, listing_id, listing.label, rule))
+
+        # highest priority first, so quotas are spent on the listings that
+        # matter most
+        entries.sort(key=lambda e: -(e[3].priority or 0))
+
+        for provider, listing_id, label, rule in entries:
+            if (provider.IDENTIFIER, listing_id) in queued:
+                continue
+            if not self.under_quota(provider, label, rule):
+                logger.info(f"download quota reached for {label}")
+                continue
+            listing = await self.load(provider, listing_id)
+            if not listing or not listing.sources:
+                continue
+            missing = [
+                i for i, source in enumerate(listing.sources)
+                if not source.local_path
+            ]
+            if not missing:
+                continue
+            logger.info(f"auto-downloading {label}: {listing.title}")
+            for index in (
+                    [None] if len(missing) == len(listing.sources) else missing
+            ):
+                for task in provider.create_download_tasks(listing, index=index):
+                    self.task_manager.download(task, priority=rule.priority)
+            with db_session:
+                provider.LISTING_CLASS[listing_id].auto_downloaded = datetime.now()
@@ -10,6 +10,7 @@ except ImportError:
 import yaml
 from yamlinclude import YamlIncludeConstructor
 import functools
+from collections import OrderedDict
 from orderedattrdict import Tree
 import orderedattrdict.yamlutils
 from orderedattrdict.yamlutils import AttrDictYAMLLoader
@@ -23,6 +24,17 @@ PACKAGE_NAME="streamglob"
 
 settings = None
 
+# incremented whenever the loaded configuration or the active profiles change,
+# so that anything derived from the configuration can tell when it's stale
+_generation = 0
+
+def generation():
+    return _generation
+
+def invalidate():
+    global _generation
+    _generation += 1
+
 def from_yaml_for_type(dict_type, loader, node):
     'Load mapping as AttrDict, preserving order'
     # Based on yaml.constructor.SafeConstructor.construct_mapping()
@@ -94,6 +106,35 @@ class ConfigTree(Tree):
             self
         )
 
+class FrozenConfigTree(ConfigTree):
+    """
+    A read-only copy of a ConfigTree.  Missing keys still read as empty trees,
+    so lookups like `cfg.foo.bar or default` keep working, but nothing is
+    stored, and assigning to the tree raises TypeError.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        for k, v in OrderedDict(*args, **kwargs).items():
+            if isinstance(v, Mapping) and not isinstance(v, FrozenConfigTree):
+                v = FrozenConfigTree(v)
+            super().__setitem__(k, v)
+
+    def __missing__(self, key):
+        return FrozenConfigTree()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("configuration is read-only")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def copy(self):
+        return ConfigTree(self)
+
+    def __reduce__(self):
+        return (self.__class__, (OrderedDict(self),))
+
 
 def dict_merge(dct, merge_dct):
     # via https://gist.github.com/angstwad/bf22d1822c38a92ec0a9
@@ -115,6 +156,8 @@ class ProfileTree(ConfigTree):
         self._merge_default = merge_default
         self._default_profile_name = profile
         self._profile_names = [self._default_profile_name]
+        self._profile = None
+        self._profile_generation = None
         self.__exclude_keys__ |= {"profile_names", "foo", "_default_profile_name",
                                   "_merge_default", "profile"}
         self.include_profile(self._default_profile_name)
@@ -122,10 +165,15 @@ class ProfileTree(ConfigTree):
 
     @property
     def profile(self):
-        d = ConfigTree()
-        for pn in self._profile_names:
-            d = dict_merge(d, self[pn])
-        return d
+        # merged once per change to the loaded configuration or active
+        # profiles, and frozen so it can't be changed by accident
+        if self._profile is None or self._profile_generation != generation():
+            d = ConfigTree()
+            for pn in self._profile_names:
+                d = dict_merge(d, self[pn])
+            self._profile = FrozenConfigTree(d)
+            self._profile_generation = generation()
+        return self._profile
 
     @property
     def profile_names(self):
@@ -137,6 +185,7 @@ class ProfileTree(ConfigTree):
         logger.debug(f"include_profile: {profile}")
         if not profile in self._profile_names:
             self._profile_names.append(profile)
+            invalidate()
         logger.debug(f"profiles: {self.profile_names}")
 
     def exclude_profile(self, profile):
@@ -145,6 +194,7 @@ class ProfileTree(ConfigTree):
         logger.debug(f"exclude_profile: {profile}")
         try:
             self.profile_names.remove(profile)
+            invalidate()
         except ValueError:
             pass
         logger.debug(f"profiles: {self.profile_names}")
@@ -157,6 +207,7 @@ class ProfileTree(ConfigTree):
 
     def reset_profiles(self):
         self._profile_names = [ self._default_profile_name ]
+        invalidate()
 
     def __setattr__(self, name, value):
         if not name.startswith("_"):
@@ -242,6 +293,7 @@ class Config(ConfigTree):
         loader = yaml_loader(ConfigTree, self._config_dir)
         config = yaml.load(open(self.config_file), Loader=loader)
         self.update(config.items())
+        invalidate()
 
     def save(self):
 
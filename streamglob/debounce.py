@@ -0,0 +1,138 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import time
+import asyncio
+import bisect
+import collections
+
+from .state import *
+
+
+class Histogram(object):
+    """
+    Counts latencies in buckets that double in width, from 1ms up to about
+    a minute.
+    """
+
+    BOUNDS = [2**i / 1000 for i in range(17)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, elapsed):
+        self.counts[bisect.bisect_left(self.BOUNDS, elapsed)] += 1
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        n = p * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= n:
+                return self.BOUNDS[i] if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def __str__(self):
+        if not self.count:
+            return "no samples"
+        return (
+            f"n={self.count} mean={self.total/self.count*1000:.1f}ms "
+            f"p50<={self.percentile(0.5)*1000:.0f}ms "
+            f"p90<={self.percentile(0.9)*1000:.0f}ms "
+            f"p99<={self.percentile(0.99)*1000:.0f}ms "
+            f"max={self.max*1000:.1f}ms"
+        )
+
+
+class Debouncer(object):
+    """
+    Runs async work triggered by the UI, such as previewing the focused row.
+    Work is scheduled under a key of (owner, name), and scheduling it again
+    cancels whatever is still pending or running under the same key, so
+    scrolling quickly through a list only does the work for the row that
+    focus stops on.
+
+    The time from scheduling to completion is recorded per name, along with
+    how often work was cancelled before it finished.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.triggered = {}
+        self.latency = collections.defaultdict(Histogram)
+        self.cancelled = collections.Counter()
+
+    def schedule(self, key, fn, *args, delay=None, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` after `delay` seconds, replacing any work
+        already scheduled under `key`.
+        """
+        self.cancel_key(key)
+        triggered = time.perf_counter()
+
+        async def run():
+            try:
+                if delay:
+                    await asyncio.sleep(delay)
+                result = await fn(*args, **kwargs)
+                self.latency[key[1]].observe(time.perf_counter() - triggered)
+                return result
+            except asyncio.CancelledError:
+                self.cancelled[key[1]] += 1
+                raise
+            finally:
+                if self.tasks.get(key) is task:
+                    del self.tasks[key]
+                    del self.triggered[key]
+
+        task = state.event_loop.create_task(run())
+        self.tasks[key] = task
+        self.triggered[key] = triggered
+        return task
+
+    def elapsed(self, key):
+        """
+        Return the time since the work under `key` was scheduled, for
+        recording intermediate milestones from within the work itself.
+        """
+        if key not in self.triggered:
+            return None
+        return time.perf_counter() - self.triggered[key]
+
+    def observe(self, key, name):
+        elapsed = self.elapsed(key)
+        if elapsed is not None:
+            self.latency[name].observe(elapsed)
+
+    def cancel_key(self, key):
+        task = self.tasks.pop(key, None)
+        self.triggered.pop(key, None)
+        if task and not task.done():
+            task.cancel()
+
+    def cancel(self, owner, name=None):
+        """
+        Cancel the work scheduled by `owner`, or just its work named `name`.
+        """
+        for key in [
+                k for k in self.tasks
+                if k[0] is owner and (name is None or k[1] == name)
+        ]:
+            self.cancel_key(key)
+
+    def report(self):
+        return "\n".join(
+            f"{name:>16} {histogram} cancelled={self.cancelled[name]}"
+            for name, histogram in sorted(self.latency.items())
+        )
+
+
+debouncer = Debouncer()
@@ -0,0 +1,182 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import threading
+import concurrent.futures
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+URI_TOKEN_PREFIX = "uri="
+URI_TOKEN_SUFFIX = "="
+
+def uri_token(uri):
+    return uri.replace("/", "+")
+
+def uri_tokens(filename):
+    """
+    Yield every candidate URI token in a filename.  Tokens are written as
+    `uri=<token>=`, but since titles and locators can contain "=", we can't
+    tell which "=" terminates the token, so we yield them all.
+    """
+    start = filename.find(URI_TOKEN_PREFIX)
+    while start >= 0:
+        begin = start + len(URI_TOKEN_PREFIX)
+        end = filename.find(URI_TOKEN_SUFFIX, begin)
+        while end > begin:
+            yield filename[begin:end]
+            end = filename.find(URI_TOKEN_SUFFIX, end+1)
+        start = filename.find(URI_TOKEN_PREFIX, start+1)
+
+
+class DownloadIndexEventHandler(FileSystemEventHandler):
+
+    def __init__(self, index):
+        self.index = index
+        super().__init__()
+
+    def on_created(self, event):
+        if event.is_directory:
+            self.index.scan(event.src_path)
+        else:
+            self.index.add(event.src_path)
+
+    def on_deleted(self, event):
+        self.index.remove(event.src_path)
+
+    def on_moved(self, event):
+        self.index.remove(event.src_path)
+        if event.is_directory:
+            self.index.scan(event.dest_path)
+        else:
+            self.index.add(event.dest_path)
+
+
+class DownloadIndex(object):
+    """
+    Maps the URI tokens embedded in downloaded filenames to their paths.  Each
+    output directory is scanned once in the background, at startup or when
+    it's first looked up, then kept current by a filesystem observer and by
+    download tasks as they finish.  Lookups under a directory return nothing
+    until its scan has finished.
+    """
+
+    def __init__(self):
+        self._roots = set()
+        self._ready = set()
+        self._paths = {}
+        self._tokens = {}
+        self._lock = threading.RLock()
+        self._observer = None
+        self._executor = None
+
+    @property
+    def executor(self):
+        if not self._executor:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="download-index"
+            )
+        return self._executor
+
+    @property
+    def observer(self):
+        if not self._observer:
+            self._observer = Observer()
+            self._observer.start()
+        return self._observer
+
+    @staticmethod
+    def is_under(path, roots):
+        path = os.path.abspath(path)
+        return any(
+            path == root or path.startswith(root + os.path.sep)
+            for root in roots
+        )
+
+    def is_watched(self, path):
+        return self.is_under(path, self._roots)
+
+    def is_ready(self, path):
+        """
+        Whether the directory containing `path` has been scanned, so the
+        index can answer for it.
+        """
+        with self._lock:
+            return self.is_under(path, self._ready)
+
+    def start(self, roots):
+        for root in roots:
+            self.watch(root)
+
+    def watch(self, root):
+        root = os.path.abspath(root)
+        with self._lock:
+            if self.is_watched(root) or not os.path.isdir(root):
+                return
+            self._roots.add(root)
+        self.executor.submit(self.index_root, root)
+
+    def index_root(self, root):
+        try:
+            # watch before scanning so nothing created during the scan is missed
+            self.observer.schedule(
+                DownloadIndexEventHandler(self), root, recursive=True
+            )
+        except OSError as e:
+            logger.warning(f"can't watch {root} for changes: {e}")
+        try:
+            self.scan(root)
+        except Exception as e:
+            logger.exception(e)
+        with self._lock:
+            self._ready.add(root)
+        logger.debug(f"indexed {root}")
+
+    def scan(self, path):
+        logger.debug(f"scanning {path}")
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                self.add(os.path.join(dirpath, filename))
+
+    def add(self, path):
+        path = os.path.abspath(path)
+        tokens = list(uri_tokens(os.path.basename(path)))
+        if not tokens:
+            return
+        with self._lock:
+            self._tokens[path] = tokens
+            for token in tokens:
+                self._paths[token] = path
+
+    def remove(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._tokens:
+                paths = [path]
+            else:
+                # directory removed or moved away
+                prefix = path + os.path.sep
+                paths = [p for p in self._tokens if p.startswith(prefix)]
+            for p in paths:
+                for token in self._tokens.pop(p):
+                    if self._paths.get(token) == p:
+                        del self._paths[token]
+
+    def lookup(self, root, uri):
+        """
+        The path of the file downloaded from `uri` under `root`, or None if
+        there isn't one or `root` hasn't been scanned yet.
+        """
+        self.watch(root)
+        if not self.is_ready(root):
+            return None
+        path = self._paths.get(uri_token(uri))
+        if path and not os.path.exists(path):
+            # missed a filesystem event
+            self.remove(path)
+            return None
+        return path
+
+
+index = DownloadIndex()
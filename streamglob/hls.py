@@ -0,0 +1,327 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import collections
+import re
+import time
+from dataclasses import dataclass, field
+import typing
+from urllib.parse import urljoin
+
+import aiohttp
+
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+LIVE_EDGE = 3
+
+
+@dataclass
+class Key:
+
+    method: str
+    uri: typing.Optional[str] = None
+    iv: typing.Optional[bytes] = None
+
+
+@dataclass
+class Segment:
+
+    uri: str
+    duration: float
+    sequence: int
+    key: typing.Optional[Key] = None
+
+
+@dataclass
+class Variant:
+
+    uri: str
+    bandwidth: int = 0
+    height: typing.Optional[int] = None
+    frame_rate: typing.Optional[float] = None
+    name: typing.Optional[str] = None
+
+
+@dataclass
+class MediaPlaylist:
+
+    segments: typing.List[Segment] = field(default_factory=list)
+    target_duration: float = 6
+    init_uri: typing.Optional[str] = None
+    ended: bool = False
+
+
+def parse_attributes(value):
+    return {
+        k: v[1:-1] if v.startswith('"') else v
+        for k, v in ATTRIBUTE_RE.findall(value)
+    }
+
+def is_master(text):
+    return "#EXT-X-STREAM-INF" in text
+
+def parse_master(text, base_url):
+
+    variants = []
+    attrs = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+        elif line and not line.startswith("#") and attrs is not None:
+            resolution = attrs.get("RESOLUTION")
+            variants.append(Variant(
+                uri=urljoin(base_url, line),
+                bandwidth=int(attrs.get("BANDWIDTH", 0)),
+                height=int(resolution.split("x")[1]) if resolution else None,
+                frame_rate=float(attrs["FRAME-RATE"]) if "FRAME-RATE" in attrs else None
+            ))
+            attrs = None
+
+    # name variants the way streamlink does, so that configured resolutions
+    # like "720p_alt" work with either downloader
+    counts = collections.Counter()
+    for v in sorted(variants, key=lambda v: v.bandwidth, reverse=True):
+        if not v.height:
+            continue
+        name = f"{v.height}p"
+        if v.frame_rate and v.frame_rate > 30:
+            name += str(int(round(v.frame_rate)))
+        counts[name] += 1
+        if counts[name] > 1:
+            name += "_alt" + (str(counts[name]-1) if counts[name] > 2 else "")
+        v.name = name
+    return variants
+
+def select_variant(variants, name=None):
+    by_bandwidth = sorted(variants, key=lambda v: v.bandwidth)
+    if name == "worst":
+        return by_bandwidth[0]
+    if name and name != "best":
+        try:
+            return next(v for v in variants if v.name == name)
+        except StopIteration:
+            logger.warning(f"no {name} variant, using best")
+    return by_bandwidth[-1]
+
+def parse_media(text, base_url):
+
+    playlist = MediaPlaylist()
+    sequence = 0
+    duration = None
+    key = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            playlist.target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-KEY:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            method = attrs.get("METHOD", "NONE")
+            if method == "NONE":
+                key = None
+            else:
+                iv = attrs.get("IV")
+                key = Key(
+                    method=method,
+                    uri=urljoin(base_url, attrs["URI"]) if "URI" in attrs else None,
+                    iv=bytes.fromhex(iv[2:]) if iv else None
+                )
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            playlist.init_uri = urljoin(base_url, attrs["URI"])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",")[0])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            playlist.ended = True
+        elif not line.startswith("#"):
+            playlist.segments.append(Segment(
+                uri=urljoin(base_url, line),
+                duration=duration or 0,
+                sequence=sequence,
+                key=key
+            ))
+            sequence += 1
+            duration = None
+    return playlist
+
+
+def decrypt(data, key, iv):
+    try:
+        from Crypto.Cipher import AES
+    except ImportError:
+        from Cryptodome.Cipher import AES
+    data = AES.new(key, AES.MODE_CBC, iv).decrypt(data)
+    # strip PKCS7 padding
+    return data[:-data[-1]] if data else data
+
+
+class HLSFetcher(object):
+    """
+    Downloads an HLS stream in-process.  Up to `concurrency` segments are
+    fetched at a time, but they're written out strictly in order, so the
+    output can be a file or a pipe to a player.  Live playlists are reloaded
+    until the stream ends.
+
+    `offset` is a timedelta from the start of the stream, or, if negative,
+    from the live edge.
+    """
+
+    MAX_RETRIES = 3
+
+    def __init__(self, session, url, write, resolution=None, offset=None,
+                 concurrency=8, progress=None):
+        self.session = session
+        self.url = url
+        self.write = write
+        self.resolution = resolution
+        self.offset = offset
+        self.concurrency = concurrency
+        self.progress = progress
+        self.limit = asyncio.Semaphore(concurrency)
+        self.keys = {}
+        self.written = 0
+        self.segments_written = 0
+        self.segments_total = None
+
+    async def get(self, url):
+        for attempt in range(self.MAX_RETRIES):
+            try:
+                async with self.session.get(url) as res:
+                    res.raise_for_status()
+                    return await res.read()
+            except aiohttp.ClientError as e:
+                logger.warning(f"fetching {url} failed: {e}")
+                if attempt == self.MAX_RETRIES-1:
+                    raise
+                await asyncio.sleep(2**attempt)
+
+    async def get_text(self, url):
+        return (await self.get(url)).decode("utf-8")
+
+    async def get_key(self, uri):
+        if uri not in self.keys:
+            self.keys[uri] = asyncio.ensure_future(self.get(uri))
+        return await self.keys[uri]
+
+    async def load_playlist(self, url):
+        return parse_media(await self.get_text(url), url)
+
+    async def fetch_segment(self, segment):
+        async with self.limit:
+            data = await self.get(segment.uri)
+        if segment.key:
+            if segment.key.method != "AES-128":
+                raise NotImplementedError(f"unsupported encryption: {segment.key.method}")
+            key = await self.get_key(segment.key.uri)
+            iv = segment.key.iv or segment.sequence.to_bytes(16, "big")
+            data = decrypt(data, key, iv)
+        return data
+
+    def start_index(self, playlist):
+        segments = playlist.segments
+        if self.offset is None:
+            return 0 if playlist.ended else max(0, len(segments) - LIVE_EDGE)
+        seconds = self.offset.total_seconds()
+        if seconds < 0:
+            # offset from the live edge
+            remaining = -seconds
+            for i in range(len(segments)-1, -1, -1):
+                remaining -= segments[i].duration
+                if remaining <= 0:
+                    return i
+            return 0
+        elapsed = 0
+        for i, segment in enumerate(segments):
+            if elapsed + segment.duration > seconds:
+                return i
+            elapsed += segment.duration
+        return len(segments)
+
+    def update_progress(self, started):
+        if not self.progress:
+            return
+        elapsed = time.monotonic() - started
+        self.progress.dled = self.written
+        if elapsed:
+            self.progress.rate = self.written / elapsed
+        if self.segments_total:
+            self.progress.pct = self.segments_written / self.segments_total
+            # estimated from the average segment size so far
+            self.progress.total = (
+                self.written * self.segments_total / self.segments_written
+            )
+            self.progress.status = f"downloading {self.segments_written}/{self.segments_total}"
+        else:
+            self.progress.status = f"live {self.segments_written}"
+
+    async def run(self):
+
+        text = await self.get_text(self.url)
+        url = self.url
+        if is_master(text):
+            variant = select_variant(parse_master(text, url), self.resolution)
+            logger.info(f"variant: {variant}")
+            url = variant.uri
+            playlist = await self.load_playlist(url)
+        else:
+            playlist = parse_media(text, url)
+
+        if playlist.init_uri:
+            await self.write(await self.get(playlist.init_uri))
+
+        queued = collections.deque(playlist.segments[self.start_index(playlist):])
+        last_sequence = playlist.segments[-1].sequence if playlist.segments else -1
+        if playlist.ended:
+            self.segments_total = len(queued)
+
+        pending = collections.deque()
+        started = time.monotonic()
+        reload_at = time.monotonic() + playlist.target_duration
+        try:
+            while True:
+                # keep a window of segments in flight ahead of the writer
+                while queued and len(pending) < self.concurrency * 2:
+                    pending.append(asyncio.ensure_future(
+                        self.fetch_segment(queued.popleft())
+                    ))
+
+                if pending:
+                    data = await pending.popleft()
+                    await self.write(data)
+                    self.written += len(data)
+                    self.segments_written += 1
+                    self.update_progress(started)
+
+                if playlist.ended:
+                    if not (queued or pending):
+                        break
+                    continue
+
+                # live stream: follow the playlist as it grows
+                if queued or (pending and time.monotonic() < reload_at):
+                    continue
+                delay = reload_at - time.monotonic()
+                if delay > 0 and not pending:
+                    await asyncio.sleep(delay)
+                playlist = await self.load_playlist(url)
+                new = [s for s in playlist.segments if s.sequence > last_sequence]
+                if new:
+                    last_sequence = new[-1].sequence
+                    queued.extend(new)
+                    reload_at = time.monotonic() + playlist.target_duration
+                else:
+                    reload_at = time.monotonic() + playlist.target_duration / 2
+        finally:
+            # let cancelled fetches finish before the caller closes the
+            # session and the output
+            unfinished = list(pending) + [
+                f for f in self.keys.values() if not f.done()
+            ]
+            for f in unfinished:
+                f.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
@@ -0,0 +1,157 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import time
+from dataclasses import dataclass
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from . import config
+
+
+@dataclass
+class LinkStatus:
+
+    alive: bool  # None if the check failed
+    checked: float
+    error: str = None
+
+
+class LinkChecker(object):
+    """
+    Checks media sources for liveness concurrently, with a global limit on
+    in-flight checks and a separate limit per host.  Results are cached by URL
+    for `linkcheck.ttl` seconds so that views can ask about every visible row
+    without re-checking sources that were checked recently.  A check that
+    fails with an error says nothing about the source, so its status is
+    unknown (None) and it's only cached for `linkcheck.error_ttl` seconds.
+    """
+
+    DEFAULT_TTL = 60*60
+    DEFAULT_ERROR_TTL = 60
+    DEFAULT_MAX_CONCURRENT = 20
+    DEFAULT_MAX_PER_HOST = 4
+
+    def __init__(self):
+        self._results = {}
+        self._pending = {}
+        self._limit = None
+        self._host_limits = defaultdict(
+            lambda: asyncio.Semaphore(self.max_per_host)
+        )
+
+    @property
+    def ttl(self):
+        return config.settings.profile.linkcheck.ttl or self.DEFAULT_TTL
+
+    @property
+    def error_ttl(self):
+        return config.settings.profile.linkcheck.error_ttl or self.DEFAULT_ERROR_TTL
+
+    @property
+    def max_concurrent(self):
+        return (config.settings.profile.linkcheck.max_concurrent
+                or self.DEFAULT_MAX_CONCURRENT)
+
+    @property
+    def max_per_host(self):
+        return (config.settings.profile.linkcheck.max_per_host
+                or self.DEFAULT_MAX_PER_HOST)
+
+    @property
+    def limit(self):
+        if not self._limit:
+            self._limit = asyncio.Semaphore(self.max_concurrent)
+        return self._limit
+
+    @staticmethod
+    def key(source):
+        # use the stored URL rather than the locator, which may be computed
+        # with a network request for some providers
+        return getattr(source, "url", None)
+
+    def expired(self, result, now=None):
+        ttl = self.error_ttl if result.error else self.ttl
+        return (now or time.monotonic()) - result.checked > ttl
+
+    def result(self, key):
+        result = self._results.get(key)
+        if not result:
+            return None
+        if self.expired(result):
+            del self._results[key]
+            return None
+        return result
+
+    def status(self, source):
+        key = self.key(source)
+        if not key:
+            return None
+        result = self.result(key)
+        return result.alive if result else None
+
+    def is_dead(self, source):
+        return self.status(source) is False
+
+    def invalidate(self, sources=None):
+        if sources is None:
+            self._results.clear()
+            return
+        for source in sources:
+            self._results.pop(self.key(source), None)
+
+    def purge(self):
+        now = time.monotonic()
+        for key in [k for k, v in self._results.items()
+                    if self.expired(v, now)]:
+            del self._results[key]
+
+    async def _check(self, key, source):
+        host = urlparse(key).netloc
+        try:
+            async with self.limit, self._host_limits[host]:
+                alive = bool(await source.check())
+            result = LinkStatus(alive=alive, checked=time.monotonic())
+        except Exception as e:
+            logger.warning(f"check failed for {key}: {e}")
+            result = LinkStatus(alive=None, checked=time.monotonic(), error=str(e))
+        self._results[key] = result
+        return result.alive
+
+    async def check(self, source, force=False):
+        key = self.key(source)
+        if not key:
+            return True
+        if not force:
+            result = self.result(key)
+            if result:
+                return result.alive
+        if key not in self._pending:
+            task = asyncio.create_task(self._check(key, source))
+            task.add_done_callback(lambda t: self._pending.pop(key, None))
+            self._pending[key] = task
+        # the check is shared, so one caller being cancelled mustn't cancel it
+        # for the others
+        return await asyncio.shield(self._pending[key])
+
+    async def check_many(self, sources, force=False):
+        return await asyncio.gather(*[
+            self.check(s, force=force) for s in sources
+        ])
+
+    async def check_listings(self, listings, force=False):
+        """
+        Check all sources of the given listings, returning the listings that
+        have at least one dead source.  Sources that couldn't be checked
+        aren't counted as dead.
+        """
+        listings = [l for l in listings if hasattr(l, "check")]
+        results = await asyncio.gather(*[
+            self.check_many(getattr(l, "sources", None) or [], force=force)
+            for l in listings
+        ])
+        return [
+            listing for listing, alive in zip(listings, results)
+            if False in alive
+        ]
@@ -2,6 +2,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
+import errno
 from datetime import datetime, timedelta
 import typing
 import types
@@ -10,10 +11,12 @@ import dateutil.parser
 import abc
 import asyncio
 import shutil
+import sqlite3
 import unicodedata
 import tempfile
 import traceback
 import glob
+import string
 
 import pony.options
 pony.options.CUT_TRACEBACK = False
@@ -30,6 +33,7 @@ from pydantic import BaseModel, Field, validator
 from marshmallow import fields as mm_fields
 
 from . import config
+from . import downloads
 from . import providers
 from . import utils
 from .exceptions import *
@@ -93,6 +97,10 @@ def parse_attr(attr):
     if attr.is_discriminator:
         return (None, None, None)
 
+    if attr.is_collection and attr.lazy:
+        # loading these would cost a query for every object we detach
+        return (None, None, None)
+
     if attr.is_collection:
         # It's not always possible to use the type of the collection, which may
         # not be defined yet, in which case we settle for db.Entity
@@ -164,9 +172,16 @@ class attrclass(object):
             # if there are type annotations for other class attributes that (a)
             # aren't entity attributes, (b) have type annotations, and (c)
             # aren't already members of the attr class, we copy these
-            # attributes and annotations into the attr class
+            # attributes and annotations into the attr class.  Annotations
+            # are collected from the whole hierarchy, since mixins declare
+            # them too, and since Python 3.10 an unannotated class no longer
+            # inherits its bases' annotations.
 
-            for attr, annotation in getattr(cls, "__annotations__", {}).items():
+            annotations = {}
+            for c in reversed(cls.mro()):
+                annotations.update(c.__dict__.get("__annotations__", {}))
+
+            for attr, annotation in annotations.items():
                 if attr in cls._attrs_ or attr in ns:
                     continue
                 ns[attr] = getattr(cls, attr, None)
@@ -283,9 +298,88 @@ class MediaChannel(MediaChannelMixin, db.Entity):
     listings = Set(lambda: ChannelMediaListing, reverse="channel")
     attrs = Required(Json, default={})
 
-class SafeDict(dict):
-    def __missing__(self, key):
-        return '{' + key + '}'
+class FilenameTemplate(object):
+    """
+    A download filename template compiled from the output configuration.
+    Fields are resolved once at compile time into two format strings: one for
+    generating filenames, and one for generating glob patterns that match any
+    file generated from the template.
+    """
+
+    DEFAULT_TEMPLATE = "{listing.provider}.{self.default_name}.{self.timestamp}.{self.ext}"
+
+    FIELDS = {"self", "listing", "uri", "index", "num", "ext"}
+
+    GLOB_FIELDS = {"uri", "ext"}
+
+    FIELD_ROOT_RE = re.compile(r"[.\[]")
+
+    def __init__(self, outpath, template=None, normalization=None):
+        self.outpath = outpath or "."
+        self.template = (template or self.DEFAULT_TEMPLATE).replace(
+            "{listing.title", "{listing.safe_title"
+        )
+        self.normalization = normalization
+        self.has_uri = False
+        self.has_ext = False
+
+        def escape(s):
+            return s.replace("{", "{{").replace("}", "}}")
+
+        fmt = []
+        glob_fmt = []
+        try:
+            for literal, field, spec, conversion in string.Formatter().parse(self.template):
+                fmt.append(escape(literal))
+                glob_fmt.append(escape(literal))
+                if field is None:
+                    continue
+                root = self.FIELD_ROOT_RE.split(field, 1)[0]
+                if root == "uri":
+                    self.has_uri = True
+                elif root == "ext":
+                    self.has_ext = True
+                if root not in self.FIELDS:
+                    if root != field:
+                        raise SGInvalidFilenameTemplate(
+                            f"unknown template field: {field}"
+                        )
+                    # leave unknown fields for the provider to translate
+                    fmt.append(escape(f"{{{field}}}"))
+                    glob_fmt.append("*")
+                    continue
+                expr = "{" + field + (f"!{conversion}" if conversion else "") + (
+                    f":{spec}" if spec else ""
+                ) + "}"
+                fmt.append(expr)
+                glob_fmt.append("*" if root in self.GLOB_FIELDS else expr)
+        except ValueError as e:
+            raise SGInvalidFilenameTemplate(str(e))
+
+        self.format_string = "".join(fmt)
+        self.glob_string = "".join(glob_fmt)
+
+    def format(self, source, listing=None, num=0, glob=False, translate=None):
+
+        values = dict(
+            self=source,
+            listing=listing,
+            index=source.rank+1,
+            num=num or len(listing.sources) if listing else 0
+        )
+        if glob:
+            outfile = self.glob_string.format_map(values)
+        else:
+            if self.has_uri:
+                values["uri"] = "uri=" + downloads.uri_token(source.uri) + "="
+            if self.has_ext:
+                values["ext"] = source.ext
+            outfile = self.format_string.format_map(values)
+            if translate:
+                outfile = translate(outfile)
+        if self.normalization:
+            outfile = unicodedata.normalize(self.normalization, outfile)
+        return os.path.join(self.outpath, outfile)
 
 class MediaSourceMixin(object):
 
@@ -358,59 +452,44 @@ class MediaSourceMixin(object):
         if not self.provider:
             return None
 
-        if isinstance(index, int):
-            index += 1
-
         if "outfile" in kwargs:
             return kwargs.get("outfile")
 
-        outpath = (
-            self.provider.config.get_path("output.path")
-            or
-            config.settings.profile.get_path("output.path")
-            or
-            "."
-        )
-
-        template = (
-            self.provider.config.get_path("output.template")
-            or
-            config.settings.profile.get_path("output.template")
-        )
+        try:
+            return self.provider.filename_template.format(
+                self, listing=listing or self.listing, # FIXME
+                num=num, glob=glob,
+                translate=self.provider.translate_template
+            )
+        except SGInvalidFilenameTemplate:
+            raise
+        except Exception as e:
+            logger.exception("".join(traceback.format_exc()))
+            raise SGInvalidFilenameTemplate(str(e))
 
-        if template:
-            # template = self.TEMPLATE_RE.sub(r"{self.\1}", template)
-            template = template.replace("{listing.title", "{listing.safe_title")
-            try:
-                outfile = template.format_map(
-                    SafeDict(
-                        self=self, listing=listing or self.listing, # FIXME
-                        uri="uri=" + self.uri.replace("/", "+") +"=" if not glob else "*",
-                        index=self.rank+1, num=num or len(listing.sources) if listing else 0
-                    )
-                )
-                if not glob:
-                    outfile = outfile.format_map(SafeDict(ext=self.ext))
-                    outfile = self.provider.translate_template(outfile)
-                if config.settings.profile.unicode_normalization:
-                    outfile = unicodedata.normalize(config.settings.profile.unicode_normalization, outfile)
-            except Exception as e:
-                # import ipdb; ipdb.set_trace()
-                logger.exception("".join(traceback.format_exc()))
-                raise SGInvalidFilenameTemplate(str(e))
-        else:
-            template = "{listing.provider}.{self.default_name}.{self.timestamp}.{self.ext}"
-            outfile = template.format(self=self)
-        if glob:
-            outfile = re.sub("({[^}]+})", "*", outfile)
-        # logger.info(f"template: {template}, outfile: {outfile}")
-        return os.path.join(outpath, outfile)
+    async def check(self):
+        return True
 
     def __str__(self):
         return self.locator
 
     @property
     def local_path(self):
+        uri = getattr(self, "uri", None)
+        if self.provider and uri:
+            try:
+                template = self.provider.filename_template
+            except SGInvalidFilenameTemplate as e:
+                logger.error(e)
+                return None
+            path = downloads.index.lookup(template.outpath, uri)
+            if path:
+                return path
+            if template.has_uri and downloads.index.is_ready(template.outpath):
+                # the index has every file with a URI token, so there's
+                # nothing left to find
+                return None
+
         with db_session:
             listing = (
                 self.provider.LISTING_CLASS.orm_class[self.listing.media_listing_id]
@@ -429,10 +508,10 @@ class MediaSourceMixin(object):
                     return glob.glob(filename)[0]
                 except IndexError:
                     pass
-                if not getattr(self, "uri", None):
+                if not uri:
                     return None
                 dirname = os.path.dirname(filename)
-                filename=os.path.join(dirname, f"*{self.uri}*")
+                filename=os.path.join(dirname, f"*{uri}*")
                 try:
                     return glob.glob(filename)[0]
                 except IndexError:
@@ -498,9 +577,11 @@ class MediaListing(MediaListingMixin, db.Entity):
     media_listing_id = PrimaryKey(int, auto=True)
     provider_id = Required(str, index=True)
     attrs = Required(Json, default={})
-    task = Optional(lambda: MediaTask, reverse="listing")
+    tasks = Set(lambda: MediaTask, reverse="listing", lazy=True)
     downloaded = Optional(datetime)
     viewed = Optional(datetime)
+    label = Optional(str, index=True)
+    auto_downloaded = Optional(datetime)
 
 
 class ContentMediaListingMixin(object):
@@ -588,13 +669,17 @@ class InflatableMediaListing(InflatableMediaListingMixin, MediaListing):
 @attrclass()
 class MediaTask(db.Entity):
 
+    media_task_id = PrimaryKey(int, auto=True)
     title =  Required(str)
     sources = Set(lambda: MediaSource, reverse="task")
     listing = Optional(lambda: MediaListing)
     provider = Optional(str)
+    provider_id = Optional(str)
     task_id =  Optional(int)
     args = Required(Json, default=[])
     kwargs = Required(Json, default={})
+    priority = Required(int, default=0)
+    status = Optional(str)
 
 
 class ProgramMediaTaskMixin(object):
@@ -653,13 +738,33 @@ class PlayMediaTask(PlayMediaTaskMixin, ProgramMediaTask):
 
 class DownloadMediaTaskMixin(object):
 
-    tempdir_ :typing.Optional[str] = None
+    resume: typing.Optional[bool] = False
+    stage_times: typing.Optional[list] = None
+    piped_stages: typing.Optional[int] = 0
+
+    @property
+    def staging_root(self):
+        # stage next to the destination so finalizing is a rename, not a copy
+        root = config.settings.tasks.staging_dir or (
+            os.path.dirname(self.dest) if self.dest else None
+        )
+        if root:
+            try:
+                os.makedirs(root, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"can't stage in {root}: {e}")
+                root = None
+        return root
 
     @property
     def tempdir(self):
-        if not self.tempdir_:
-            self.tempdir_ = tempfile.mkdtemp(prefix="streamglob")
-        return self.tempdir_
+        if not self.staging_dir:
+            self.staging_dir = tempfile.mkdtemp(
+                prefix=".streamglob-", dir=self.staging_root
+            )
+        elif not os.path.isdir(self.staging_dir):
+            os.makedirs(self.staging_dir)
+        return self.staging_dir
 
     @property
     def stage(self):
@@ -676,6 +781,9 @@ class DownloadMediaTaskMixin(object):
     def stage_outfile(self):
         if len(self.postprocessors):
             return os.path.join(self.tempdir, f"{self.stage}.tmp")
+        elif self.dest:
+            # the destination only appears once the download has succeeded
+            return os.path.join(self.tempdir, os.path.basename(self.dest))
         else:
             return self.dest
 
@@ -688,8 +796,16 @@ class DownloadMediaTaskMixin(object):
             d = os.path.dirname(self.dest)
             if not os.path.isdir(d):
                 os.makedirs(d)
-            shutil.move(self.stage_results[-1], self.dest)
-        shutil.rmtree(self.tempdir)
+            try:
+                os.replace(self.stage_results[-1], self.dest)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(self.stage_results[-1], self.dest)
+        if self.staging_dir:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+        if self.dest:
+            downloads.index.add(self.dest)
         with db_session:
             now = datetime.now()
             for s in self.sources:
@@ -704,6 +820,7 @@ class DownloadMediaTask(DownloadMediaTaskMixin, ProgramMediaTask):
     dest = Optional(str)
     postprocessors = Required(Json, default=[])
     stage_results = Required(Json, default=[])
+    staging_dir = Optional(str)
 
 
 class CacheEntry(db.Entity):
@@ -720,6 +837,15 @@ class CacheEntry(db.Entity):
             lambda e: e.last_seen < datetime.now() - timedelta(seconds=age)
         ).delete()
 
+class TranslationEntry(db.Entity):
+
+    digest = Required(str)
+    src = Required(str)
+    dest = Required(str)
+    text = Required(str)
+    created = Required(datetime, default=datetime.now)
+    composite_key(digest, src, dest)
+
 class ApplicationData(db.Entity):
     """
     Providers can use this entity to cache data that doesn't belong in the
@@ -737,10 +863,88 @@ class ProviderData(db.Entity):
     settings = Required(Json, default={})
 
 
+# Schema changes that can be applied to an existing database in place.
+# generate_mapping creates missing tables (e.g. TranslationEntry) and their
+# indexes, but not missing columns, so those are added here first.
+SCHEMA_RENAMED_COLUMNS = [
+    ("MediaTask", "id", "media_task_id"),
+]
+
+SCHEMA_ADDED_COLUMNS = [
+    ("MediaListing", "label", "TEXT NOT NULL DEFAULT ''"),
+    ("MediaListing", "auto_downloaded", "DATETIME"),
+    ("MediaTask", "listing",
+     'INTEGER REFERENCES "MediaListing" ("media_listing_id") ON DELETE SET NULL'),
+    ("MediaTask", "provider_id", "TEXT NOT NULL DEFAULT ''"),
+    ("MediaTask", "priority", "INTEGER NOT NULL DEFAULT 0"),
+    ("MediaTask", "status", "TEXT NOT NULL DEFAULT ''"),
+    ("MediaTask", "staging_dir", "TEXT"),
+]
+
+SCHEMA_ADDED_INDEXES = [
+    ("MediaListing", "label"),
+    ("MediaTask", "listing"),
+]
+
+
+def migrate(filename):
+    """
+    Bring an existing database file up to date with the schema changes above,
+    keeping its contents.
+    """
+
+    if filename == ":memory:" or not os.path.exists(filename):
+        return
+
+    conn = sqlite3.connect(filename)
+
+    def columns(table):
+        return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+    try:
+        with conn:
+            for table, old, new in SCHEMA_RENAMED_COLUMNS:
+                existing = columns(table)
+                if old in existing and new not in existing:
+                    logger.info(f"renaming {table}.{old} to {new}")
+                    conn.execute(f'ALTER TABLE "{table}" RENAME COLUMN "{old}" TO "{new}"')
+
+            added = set()
+            for table, column, definition in SCHEMA_ADDED_COLUMNS:
+                existing = columns(table)
+                if existing and column not in existing:
+                    logger.info(f"adding {table}.{column}")
+                    conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}')
+                    added.add((table, column))
+
+            for table, column in SCHEMA_ADDED_INDEXES:
+                if column in columns(table):
+                    conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS "idx_{table.lower()}__{column}" '
+                        f'ON "{table}" ("{column}")'
+                    )
+
+            if ("MediaTask", "listing") in added and "task" in columns("MediaListing"):
+                # a listing used to point to its task, and now tasks point to
+                # their listing
+                conn.execute(
+                    'UPDATE "MediaTask" SET "listing" = ('
+                    'SELECT "media_listing_id" FROM "MediaListing" '
+                    'WHERE "MediaListing"."task" = "MediaTask"."media_task_id")'
+                )
+                conn.execute('UPDATE "MediaListing" SET "task" = NULL')
+    except sqlite3.Error as e:
+        # generate_mapping will find the schema out of date
+        logger.warning(f"couldn't migrate database file {filename}: {e}")
+    finally:
+        conn.close()
+
+
 def init(filename=None, *args, **kwargs):
 
     if not filename:
         filename = os.path.join(config.settings.CONFIG_DIR, f"{config.PACKAGE_NAME}.sqlite")
+    migrate(filename)
     db.bind("sqlite", filename, create_db=True, *args, **kwargs)
     try:
         db.generate_mapping(create_tables=True)
@@ -0,0 +1,199 @@
+import logging
+logger = logging.getLogger(__name__)
+
+from orderedattrdict import AttrDict, Tree
+
+from . import config
+
+ELEMENTS = ["playlist", "title"]
+
+
+def ffmpeg_escape(s):
+    # for option values inside a filter graph, which are unescaped twice
+    return s.replace(":", "\\:").replace("'", "'\\\\\\''") # yikes
+
+def ffmpeg_quote(s):
+    # for option values passed straight to a filter, which are unescaped once
+    return "'" + s.replace("'", "'\\''") + "'"
+
+
+class Overlay(object):
+    """
+    Draws the playlist and title overlay on the preview player.  The filter
+    chain is built from `display.overlay` once per configuration and only
+    added to the player when its structure changes.  Moving to another item
+    just sends the new text and colors to the existing filters with
+    `vf-command`, so mpv doesn't have to rebuild its filter graph.
+    """
+
+    def __init__(self):
+        self._generation = None
+        self._settings = None
+        self.player = None
+        self.applied = None
+        self.labels = []
+        # the last update, and whether it was only sent with vf-command
+        self.current = None
+        self.stale = False
+
+    @property
+    def settings(self):
+        if self._settings is None or self._generation != config.generation():
+            self._settings = self.load_settings()
+            self._generation = config.generation()
+        return self._settings
+
+    @staticmethod
+    def load_settings():
+
+        cfg = config.settings.profile.display.overlay
+
+        ox = str(cfg.x or 0)
+        oy = str(cfg.y or 0)
+        padding = cfg.text.padding or 0
+
+        settings = AttrDict(
+            upscale=cfg.upscale or 1280,
+            fps=cfg.fps or 30,
+            box=None,
+            elements=AttrDict()
+        )
+
+        if cfg.box:
+            settings.box = AttrDict(
+                colors=AttrDict(
+                    default=cfg.box.color.default or "000000@0.5",
+                ),
+                x=ox,
+                y=oy,
+                h=f"(ih/{cfg.text.size or 50}*2)+{padding}"
+            )
+            settings.box.colors.end = cfg.box.color.end or settings.box.colors.default
+
+        for element in ELEMENTS:
+            el_cfg = cfg.get(element) or Tree()
+
+            default = el_cfg.text.color.default or cfg.text.color.default or "white"
+            colors = AttrDict(
+                default=default,
+                end=el_cfg.text.color.end or cfg.text.color.end or default,
+                downloaded=el_cfg.text.color.downloaded or cfg.text.color.downloaded or default
+            )
+
+            x = el_cfg.x or ox
+            if isinstance(x, int):
+                x = str(x)
+            if isinstance(x, dict):
+                scroll_speed = x.scroll or 5
+                pause = x.scroll_pause or 3
+                x=f"w-w/{scroll_speed}*mod(if(lt(t, {pause}), 0, if(gt(text_w, w), t-{pause}, 0) ),{scroll_speed}*(w+tw/2)/w)-w"
+            x = x.format(x=ox, y=oy, padding=padding)
+            y = str(el_cfg.y or cfg.y).format(x=ox, y=oy, padding=padding)
+
+            settings.elements[element] = AttrDict(
+                colors=colors,
+                font=el_cfg.text.font or cfg.text.font or "sans",
+                # everything but the text and color, which change per item
+                options=(
+                    f"x='{x}':y='{y}':fontsize=(h/{el_cfg.text.size or cfg.text.size or 50}):"
+                    f"bordercolor={el_cfg.text.border.color or cfg.text.border.color or 'black'}:"
+                    f"borderw={el_cfg.text.border.width or cfg.text.border.width or 1}:"
+                    f"shadowx={el_cfg.text.shadow.x or cfg.text.shadow.x or 1}:"
+                    f"shadowy={el_cfg.text.shadow.y or cfg.text.shadow.y or 1}:"
+                    f"shadowcolor={el_cfg.text.shadow.color or cfg.text.shadow.color or 'black'}:"
+                    f"expansion=none"
+                )
+            )
+        return settings
+
+    def filters(self, is_image, texts, status):
+
+        settings = self.settings
+        filters = [
+            f"@upscale:lavfi=[scale=w=max(iw\\,{settings.upscale}):h=-2]"
+        ]
+
+        if is_image:
+            filters.append(f"@framerate:framerate=fps={settings.fps}")
+
+        if settings.box:
+            box = settings.box
+            filters.append(
+                f"@box:drawbox=x={box.x}:y={box.y}:w=iw:h={box.h}:"
+                f"color={self.box_color(status)}:t=fill"
+            )
+
+        for element, text in texts.items():
+            el = settings.elements[element]
+            filters.append(
+                f"@{element}:lavfi=[drawtext=text='{ffmpeg_escape(text)}':"
+                f"fontfile='{ffmpeg_escape(el.font)}':"
+                f"fontcolor={el.colors.get(status, el.colors.default)}:"
+                f"{el.options}]"
+            )
+        return filters
+
+    def box_color(self, status):
+        colors = self.settings.box.colors
+        return colors.end if status == "end" else colors.default
+
+    def text_options(self, element, text, status):
+        el = self.settings.elements[element]
+        return (
+            f"text={ffmpeg_quote(text)}:fontfile={ffmpeg_quote(el.font)}:"
+            f"fontcolor={el.colors.get(status, el.colors.default)}:{el.options}"
+        )
+
+    async def update(self, player, media_type, texts, status="default",
+                     rebuild=False):
+        """
+        Show `texts`, a mapping of overlay element to text, on `player`.
+        `status` is "end" for the last playlist item, "downloaded" for items
+        that have been downloaded, or "default".
+
+        `vf-command` changes aren't kept in mpv's `vf` property, so if mpv
+        may rebuild the filter graph after this update, pass `rebuild` to
+        replace the whole chain instead.
+        """
+        signature = (config.generation(), media_type == "image", tuple(texts.keys()))
+
+        if rebuild or player is not self.player or signature != self.applied:
+            filters = self.filters(media_type == "image", texts, status)
+            if player is self.player and self.labels:
+                await player.command("vf", "del", ",".join(self.labels))
+            await player.command("vf", "add", ",".join(filters))
+            self.player = player
+            self.applied = signature
+            self.labels = [f.split(":", 1)[0] for f in filters]
+            self.current = (media_type, texts, status)
+            self.stale = False
+            return
+
+        self.current = (media_type, texts, status)
+        self.stale = True
+        await self.send_commands(player, texts, status)
+
+    async def send_commands(self, player, texts, status):
+        if self.settings.box:
+            await player.command(
+                "vf-command", "box", "color", self.box_color(status)
+            )
+        for element, text in texts.items():
+            await player.command(
+                "vf-command", element, "reinit",
+                self.text_options(element, text, status)
+            )
+
+    async def on_video_reconfig(self, *args):
+        # mpv rebuilt the filter graph from its vf property, which doesn't
+        # have the changes sent with vf-command, so send them again
+        if self.stale and self.player and self.current:
+            (media_type, texts, status) = self.current
+            await self.send_commands(self.player, texts, status)
+
+    def invalidate(self):
+        self.player = None
+        self.applied = None
+        self.labels = []
+        self.current = None
+        self.stale = False
@@ -5,6 +5,7 @@ import sys
 import os
 from itertools import chain
 import functools
+import collections
 import shlex
 import subprocess
 import pipes
@@ -23,6 +24,8 @@ import tempfile
 import shutil
 import json
 import time
+import aiohttp
+import urllib.parse
 from aio_mpv_jsonipc import MPV
 from aio_mpv_jsonipc.MPV import MPVError
 if platform.system() != "Windows":
@@ -30,21 +33,74 @@ if platform.system() != "Windows":
 
 from orderedattrdict import AttrDict, Tree
 import bitmath
-import youtube_dl
-import streamlink
 
 from . import config
 from . import model
 from . import tasks
+from . import hls
 from .state import *
 from .utils import *
 from .exceptions import *
 
 PACKAGE_NAME=__name__.split('.')[0]
 
+PROGRESS_LINE_SPLIT_RE = re.compile(rb"[\r\n]")
+
 bitmath.format_string = "{value:.1f}{unit}"
 bitmath.bestprefix = True
 
+class ExecutableCache(object):
+    """
+    Remembers where commands were found on the PATH between runs, so startup
+    doesn't have to search every PATH directory for every known program.  The
+    cache is discarded when PATH changes or any directory on it is modified,
+    which is what happens when a program is installed or removed.
+    """
+
+    FILENAME = "programs.json"
+
+    def __init__(self):
+        self.filename = os.path.join(config.settings.CONFIG_DIR, self.FILENAME)
+        self.fingerprint = self.get_fingerprint()
+        self.paths = {}
+        self.dirty = False
+        try:
+            with open(self.filename) as f:
+                cache = json.load(f)
+            if cache.get("fingerprint") == self.fingerprint:
+                self.paths = cache.get("paths", {})
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def get_fingerprint():
+        dirs = os.environ.get("PATH", os.defpath).split(os.pathsep)
+        def mtime(d):
+            try:
+                return os.stat(d).st_mtime
+            except OSError:
+                return None
+        return [[d, mtime(d)] for d in dirs]
+
+    def which(self, name):
+        if name not in self.paths:
+            self.paths[name] = distutils.spawn.find_executable(name)
+            self.dirty = True
+        return self.paths[name]
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = f"{self.filename}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(dict(fingerprint=self.fingerprint, paths=self.paths), f)
+            os.replace(tmp, self.filename)
+        except OSError as e:
+            logger.warning(f"couldn't save program cache: {e}")
+        self.dirty = False
+
+
 @dataclass
 class ProgramDef:
 
@@ -57,42 +113,64 @@ class ProgramDef:
     def media_types(self):
         return self.cls.MEDIA_TYPES - set(getattr(self.cfg, "exclude_types", []))
 
+SIZE_RE = re.compile(r"([\d.]+)\s*([KMGTP]?)(i?)B?", re.IGNORECASE)
+
+def parse_size(value):
+    """
+    Parse a human-readable size like "12.3MiB" or "1.2 MB" into bytes, without
+    the overhead of creating bitmath objects for every progress update.
+    """
+    m = SIZE_RE.match(value.strip()) if value else None
+    if not m:
+        return None
+    (number, prefix, binary) = m.groups()
+    base = 1024 if binary else 1000
+    return float(number) * base ** " KMGTP".index(prefix.upper() or " ")
+
 @dataclass
 class ProgressStats:
-
-    dled: typing.Optional[bitmath.Byte] = None
-    total: typing.Optional[bitmath.Byte] = None
-    remaining: typing.Optional[bitmath.Byte] = None
+    """
+    Progress counters for a running program, kept as plain numbers (sizes in
+    bytes, rate in bytes per second) and only converted to bitmath values for
+    display.
+    """
+
+    dled: typing.Optional[float] = None
+    total: typing.Optional[float] = None
+    remaining: typing.Optional[float] = None
     pct: typing.Optional[float] = None
-    rate: typing.Optional[bitmath.Byte] = None
-    eta: typing.Optional[timedelta] = None
+    rate: typing.Optional[float] = None
+    eta: typing.Optional[str] = None
     dest: typing.Optional[str] = None
     status: typing.Optional[str] = None
 
     @property
     def size_downloaded(self):
+        if self.dled is not None:
+            dled = self.dled
+        elif self.total and self.pct:
+            dled = self.total * self.pct
+        else:
+            return None
         if not self.size_total:
-            return self.dled
+            return bitmath.Byte(dled).best_prefix(system=bitmath.SI)
 
         # ensure downloaded size is expressed in the same units as total
-        total_cls = type(self.size_total)
-        if self.dled:
-            return total_cls.from_other(self.dled)
-        elif self.total and self.pct:
-            return total_cls.from_other((self.total * self.pct))
-        return None
+        return type(self.size_total).from_other(bitmath.Byte(dled))
 
     @property
     def size_remaining(self):
         if self.remaining:
-            return self.remaining
+            return bitmath.Byte(self.remaining).best_prefix(system=bitmath.SI)
         if self.total and self.pct:
-            return self.total * (1.0-self.pct)
+            return bitmath.Byte(
+                self.total * (1.0-self.pct)
+            ).best_prefix(system=bitmath.SI)
         return None
 
     @property
     def size_total(self):
-        return self.total.best_prefix(system=bitmath.SI) if self.total else None
+        return bitmath.Byte(self.total).best_prefix(system=bitmath.SI) if self.total else None
 
     @property
     def percent_downloaded(self):
@@ -100,7 +178,7 @@ class ProgressStats:
 
     @property
     def transfer_rate(self):
-        return self.rate.best_prefix(system=bitmath.SI) if self.rate else None
+        return bitmath.Byte(self.rate).best_prefix(system=bitmath.SI) if self.rate else None
 
 class Program(object):
 
@@ -114,6 +192,15 @@ class Program(object):
 
     FOREGROUND = False
 
+    # runs in-process rather than as an external command
+    NATIVE = False
+
+    # can write its output to a player's stdin
+    supports_pipe = True
+
+    # can be started without a source and have sources loaded into it later
+    supports_idle = False
+
     PROGRAM_CMD_RE = re.compile(
         '.+?(?:(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|$)'
     )
@@ -122,7 +209,8 @@ class Program(object):
 
     with_progress = False
 
-    progress_sample = 1
+    # some programs only report progress when writing to a terminal
+    progress_pty = False
 
     default_args = []
 
@@ -173,7 +261,6 @@ class Program(object):
         self.progress = ProgressStats()
         self.progress_stream = None
         self.progress_task = None
-        self.progress_queue = asyncio.Queue()
 
 
     @classproperty
@@ -190,44 +277,45 @@ class Program(object):
     @classmethod
     def __init_subclass__(cls, **kwargs):
         if cls.__base__ != Program:
-            cls.SUBCLASSES[cls.__base__.__name__.lower()][cls.cmd] = cls
+            # register under the program type, e.g. "downloader", even if
+            # this is a subclass of another downloader
+            ptype = next(c for c in cls.__mro__ if c.__base__ == Program)
+            cls.SUBCLASSES[ptype.__name__.lower()][cls.cmd] = cls
             for k, v in kwargs.items():
                 setattr(cls, k, v)
         super().__init_subclass__()
 
 
     @classmethod
-    def get(cls, spec, *args, **kwargs):
+    def defs(cls, spec):
+        """
+        Return the definitions of the known programs matching a spec, without
+        creating instances of them.
+        """
 
-        logger.info(f"get: {spec}")
         ptype = cls.__name__.lower()
         if spec is None:
-            return None
+            return iter([])
         elif spec is True:
             # get all known programs
-            return (
-                p.cls(p.path, **dict(p.cfg, **kwargs))
-                for n, p in state.PROGRAMS[ptype].items()
-            )
+            return iter(state.PROGRAMS[ptype].values())
 
         elif callable(spec):
             return (
-                p.cls(p.path, **dict(p.cfg, **kwargs))
-                for n, p in state.PROGRAMS[ptype].items()
+                p for p in state.PROGRAMS[ptype].values()
                 if spec(p.cls)
             )
 
         elif isinstance(spec, str):
             # get a program by name
             try:
-                p = state.PROGRAMS[ptype][spec]
-                return iter([p.cls(p.path, **dict(p.cfg, **kwargs))])
+                return iter([state.PROGRAMS[ptype][spec]])
             except KeyError:
                 raise SGException(f"Program {spec} not found")
 
         elif isinstance(spec, list):
-            # get the listed programs by name
-            return [ cls.get(p) for p in spec ]
+            # get the listed programs by name, in order
+            return chain.from_iterable(cls.defs(p) for p in spec)
 
         elif isinstance(spec, dict):
             # get a program with a given configuration
@@ -244,8 +332,7 @@ class Program(object):
                 else:
                     return cfg == v
             return (
-                p.cls(p.path, **dict(p.cfg, **kwargs))
-                for p in state.PROGRAMS[ptype].values()
+                p for p in state.PROGRAMS[ptype].values()
                 if not spec or all([
                     check_cfg_key(getattr(p, k, None), v)
                     for k, v in spec.items()
@@ -254,7 +341,17 @@ class Program(object):
 
         else:
             raise Exception(f"invalid program spec: {spec}")
-        raise SGException(f"Program for {spec} not found")
+
+    @classmethod
+    def get(cls, spec, *args, **kwargs):
+
+        logger.info(f"get: {spec}")
+        if spec is None:
+            return None
+        return (
+            p.cls(p.path, **dict(p.cfg, **kwargs))
+            for p in cls.defs(spec)
+        )
 
     @classmethod
     def from_config(cls, cfg):
@@ -265,6 +362,7 @@ class Program(object):
     def load(cls):
 
         state.PROGRAMS = Tree()
+        executables = ExecutableCache()
 
         # Add configured players
 
@@ -273,12 +371,17 @@ class Program(object):
             ptype = pcls.__name__.lower()
             cfgkey = ptype + "s"
             for name, cfg in config.settings.profile[cfgkey].items():
-                if not cfg:
-                    cfg = AttrDict()
-                path = cfg.pop("path", None) or cfg.get(
-                    "command",
-                    distutils.spawn.find_executable(name)
-                )
+                cfg = AttrDict(cfg or {})
+                if cfg.get("disabled") == True:
+                    logger.info(f"player {name} is disabled")
+                    continue
+                path = cfg.pop("path", None) or cfg.get("command")
+                if not path and getattr(
+                        cls.SUBCLASSES[ptype].get(name), "NATIVE", False
+                ):
+                    path = name
+                if not path:
+                    path = executables.which(name)
                 if not path:
                     logger.warning(f"couldn't find command for {name}")
                     continue
@@ -299,9 +402,6 @@ class Program(object):
                     except StopIteration:
                         # Give up and make it a generic program
                         klass = pcls
-                if cfg.get("disabled") == True:
-                    logger.info(f"player {name} is disabled")
-                    continue
                 state.PROGRAMS[ptype][name] = ProgramDef(
                     cls=klass,
                     name=name,
@@ -315,7 +415,10 @@ class Program(object):
                 cfg = config.settings.profile[cfgkey][name]
                 if name in state.PROGRAMS[ptype] or (cfg and cfg.disabled == True):
                     continue
-                path = distutils.spawn.find_executable(name)
+                path = (
+                    name if klass.NATIVE
+                    else executables.which(name)
+                )
                 if path:
                     state.PROGRAMS[ptype][name] = ProgramDef(
                         cls=klass,
@@ -323,6 +426,7 @@ class Program(object):
                         path=path,
                         cfg = AttrDict()
                     )
+        executables.save()
 
     @property
     def source(self):
@@ -467,10 +571,13 @@ class Program(object):
 
                 if self.with_progress:
                     logger.info(f"opening progress stream: {self.__class__.__name__}")
-                    self.progress_stream, pty_stream = pty.openpty()
-                    fcntl.ioctl(pty_stream, termios.TIOCSWINSZ,
-                                struct.pack('HHHH', 50, 100, 0, 0)
-                    )
+                    if self.progress_pty:
+                        self.progress_stream, pty_stream = pty.openpty()
+                        fcntl.ioctl(pty_stream, termios.TIOCSWINSZ,
+                                    struct.pack('HHHH', 50, 100, 0, 0)
+                        )
+                    else:
+                        self.progress_stream, pty_stream = os.pipe()
                     if self.with_progress == "stderr":
                         self.stderr = pty_stream
                     else:
@@ -498,24 +605,31 @@ class Program(object):
 
                 if pty_stream is not None:
                     async def read_progress():
-                        i = 0
                         reader = asyncio.StreamReader()
                         protocol = asyncio.StreamReaderProtocol(reader)
                         await state.event_loop.connect_read_pipe(
                             lambda: protocol,
                              os.fdopen(self.progress_stream)
                         )
-                        while not self.proc.returncode:
-                            line = await reader.readline()
-                            i += 1
-                            if i % self.progress_sample:
-                                continue
-                            if not line:
+                        buf = b""
+                        while True:
+                            try:
+                                data = await reader.read(65536)
+                            except OSError:
+                                # pty closed
+                                break
+                            if not data:
                                 break
-                            line = line.strip()
-                            if not line:
-                                continue
-                            await self.update_progress_line(line.decode("utf-8"))
+                            # progress bars redraw with carriage returns, so
+                            # treat those as line breaks too
+                            lines = PROGRESS_LINE_SPLIT_RE.split(buf + data)
+                            buf = lines.pop()
+                            for line in lines:
+                                line = line.strip()
+                                if line:
+                                    await self.update_progress_line(
+                                        line.decode("utf-8", "replace")
+                                    )
 
                     self.progress_task = state.event_loop.create_task(
                         read_progress()
@@ -566,7 +680,8 @@ class Player(Program):
                 return
 
             if downloader:
-                if downloader.cmd in player.INTEGRATED_DOWNLOADERS:
+                if (downloader.cmd in player.INTEGRATED_DOWNLOADERS
+                    or not downloader.supports_pipe):
                     downloader = None
                 else:
                     downloader.source = source
@@ -616,12 +731,17 @@ class MPVPlayer(Player, MEDIA_TYPES={"audio", "image", "video"}):
         "playlist_position": "playlist-start"
     }
 
+    SOCKET_TIMEOUT = 10
+
+    supports_idle = True
+
     def __init__(self, *args, **kwargs):
         self._initialized = False
         self.ready = asyncio.Future()
         super().__init__(*args, **kwargs)
         self.ipc_socket_name = None
         self._ipc_socket = None
+        self.idle = False
         self.create_socket()
 
     @property
@@ -650,6 +770,25 @@ class MPVPlayer(Player, MEDIA_TYPES={"audio", "image", "video"}):
         return rc
         # state.event_loop.call_later(5, self.test)
 
+    async def run_idle(self, **kwargs):
+        """
+        Start without any media, so the player is ready to go as soon as
+        sources are loaded into it.  No window is opened until then.
+        """
+        self.idle = True
+        return await self.run(**kwargs)
+
+    @property
+    def full_command(self):
+        if self.idle and not self.source:
+            return (
+                self.executable_path
+                + self.extra_args_pre
+                + ["--idle=yes", "--force-window=no"]
+                + self.extra_args_post
+            )
+        return super().full_command
+
     async def log(self, level, prefix, text):
         if not len(text):
             return
@@ -677,8 +816,13 @@ class MPVPlayer(Player, MEDIA_TYPES={"audio", "image", "video"}):
 
     async def wait_for_socket(self):
 
+        deadline = time.monotonic() + self.SOCKET_TIMEOUT
         while not os.path.exists(self.ipc_socket_name):
-            time.sleep(0.5)
+            if self.proc and self.proc.returncode is not None:
+                raise SGException(f"player exited with {self.proc.returncode}")
+            if time.monotonic() > deadline:
+                raise SGException(f"timed out waiting for {self.ipc_socket_name}")
+            await asyncio.sleep(0.01)
 
     async def load_source(self, sources, **options):
         await self.ready
@@ -735,12 +879,18 @@ class ElinksPlayer(Player, cmd="elinks", MEDIA_TYPES={"text"}, FOREGROUND=True):
 
 class Downloader(Program):
 
+    RESUMABLE = False
+
+    RESOLVED_MAX = 1024
+    _resolved = collections.OrderedDict()
+
     def __init__(self, path,
                  player_integrated=False,
                  use_fifo=False, *args, **kwargs):
         super().__init__(path, *args, **kwargs)
         self.player_integrated = player_integrated
         self.use_fifo = use_fifo
+        self.piped = False
 
     @property
     def fifo(self):
@@ -751,10 +901,16 @@ class Downloader(Program):
             self._fifo = fifo_name
         return self._fifo
 
+    @property
+    def can_pipe(self):
+        # progress read from stdout can't share it with the output
+        return self.supports_pipe and self.with_progress is not True
+
     @classmethod
-    async def download(cls, task, outfile, downloader_spec=None, **kwargs):
+    async def download(cls, task, outfile, downloader_spec=None, resume=False,
+                       pipe=None, **kwargs):
         # FIXME: downloader may handle file naming
-        if os.path.exists(outfile):
+        if os.path.exists(outfile) and not resume:
             raise SGFileExists(f"File {outfile} already exists")
         source = task.sources[0] # FIXME
 
@@ -763,46 +919,81 @@ class Downloader(Program):
         try:
             downloader = Downloader.get(downloader_spec, source.locator, **kwargs)
         except SGStreamNotFound as e:
-            downloader = next(Downloader.get(downloader_spec, **kwargs))
             logger.warn(e)
             return
 
-        downloader.process_args(task, outfile, **kwargs)
+        if resume and os.path.exists(outfile):
+            if downloader.RESUMABLE:
+                logger.info(f"resuming download of {outfile}")
+                downloader.resume()
+            else:
+                os.remove(outfile)
+
+        if pipe is not None and downloader.can_pipe:
+            downloader.pipe_to_dst()
+            downloader.stdout = pipe
+            downloader.piped = True
+        else:
+            downloader.process_args(task, outfile, **kwargs)
         downloader.source = source
         downloader.listing = task.listing
 
         task.program.set_result(downloader)
-        logger.info(f"downloader: {downloader.cmd}, downloading {source} to {outfile}")
+        logger.info(f"downloader: {downloader.cmd}, downloading {source} to {'pipe' if downloader.piped else outfile}")
         proc = await downloader.run(**kwargs)
         return proc
 
     async def update_progress_line(self, line):
         pass
 
-    @classmethod
-    def get(cls, spec, url=None, **kwargs):
-        def sort_key(p):
-            if isinstance(spec, MutableMapping):
-                return spec.index(h.cmd) if h.cmd in spec else len(spec)+1
-            else:
-                return 0
+    def resume(self):
+        pass
 
-        # logger.error(
-        #     [ d for d in super().get(spec, **kwargs)
-        #       if d.supports_url(url)
-        # ])
+    @staticmethod
+    def resolver_key(spec, url):
+        if isinstance(spec, list):
+            spec = tuple(spec)
+        elif isinstance(spec, dict):
+            spec = tuple(sorted(spec.items()))
+        key = (spec, url)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    @classmethod
+    def resolve(cls, spec, url=None):
+        """
+        Pick the definition of the first downloader matching the spec that
+        supports the URL, or the first matching downloader if none do.
+        Decisions are cached until the program definitions are reloaded.
+        """
         if not spec:
             spec = True
-        try:
-            return next(iter(
-                sorted((
-                    h for h in super().get(spec, **kwargs)
-                    if h.supports_url(url)),
-                    key = sort_key
-            )))
-        except (TypeError, StopIteration) as e:
-            logger.error(e)
-            return next(iter(super().get(spec, **kwargs)))
+        key = cls.resolver_key(spec, url)
+        pdef = cls._resolved.get(key) if key else None
+        if pdef and state.PROGRAMS.downloader.get(pdef.name) is pdef:
+            cls._resolved.move_to_end(key)
+            return pdef
+
+        defs = list(cls.defs(spec))
+        if not defs:
+            raise SGException(f"Program for {spec} not found")
+        pdef = next(
+            (p for p in defs if url and p.cls.supports_url(url)),
+            defs[0]
+        )
+        if key:
+            cls._resolved[key] = pdef
+            if len(cls._resolved) > cls.RESOLVED_MAX:
+                cls._resolved.popitem(last=False)
+        return pdef
+
+    @classmethod
+    def get(cls, spec, url=None, **kwargs):
+        p = cls.resolve(spec, url)
+        return p.cls(p.path, **dict(p.cfg, **kwargs))
 
     @property
     def is_simple(self):
@@ -815,6 +1006,8 @@ class Downloader(Program):
 class YouTubeDLDownloader(Downloader):
 
     CMD = "youtube-dl"
+    # continues from its .part files by default
+    RESUMABLE = True
     PROGRESS_RE = re.compile(
         r"(\d+\.\d+)% of ~?(\d+.\d+\S+)(?: at\s+(\d+\.\d{2}\d*\S+) ETA (\d+:\d+))?"
     )
@@ -827,14 +1020,11 @@ class YouTubeDLDownloader(Downloader):
         r'''Merging formats into "([^"]+)"'''
     )
 
-    FORMATS =  AttrDict({
-        k: AttrDict(video=v.get("vcodec"), audio=v.get("acodec"))
-        for k, v in youtube_dl.extractor.youtube.YoutubeIE._formats.items()
-    })
+    _formats = None
 
     with_progress = True
 
-    progress_sample = 5
+    _extractors = None
 
     def __init__(self, path, *args, **kwargs):
         super().__init__(path, *args, **kwargs)
@@ -857,14 +1047,32 @@ class YouTubeDLDownloader(Downloader):
         self.extra_args_post += ["-o", "-"]
 
 
+    @classproperty
+    def FORMATS(cls):
+        # importing youtube_dl is slow, so wait until a format is looked up
+        if cls._formats is None:
+            import youtube_dl.extractor.youtube
+            cls._formats = AttrDict({
+                k: AttrDict(video=v.get("vcodec"), audio=v.get("acodec"))
+                for k, v in youtube_dl.extractor.youtube.YoutubeIE._formats.items()
+            })
+        return cls._formats
+
+    @classmethod
+    def extractors(cls):
+        # building these is expensive, so only do it once
+        if cls._extractors is None:
+            import youtube_dl.extractor
+            cls._extractors = [
+                ie for ie in youtube_dl.extractor.gen_extractor_classes()
+                if ie.IE_NAME != "generic"
+            ]
+        return cls._extractors
+
     @classmethod
     def supports_url(cls, url):
-        ies = youtube_dl.extractor.gen_extractors()
-        for ie in ies:
-            if ie.suitable(url) and ie.IE_NAME != 'generic':
-                # Site has dedicated extractor
-                return True
-        return False
+        # Site has dedicated extractor
+        return any(ie.suitable(url) for ie in cls.extractors())
 
     async def update_progress_line(self, line):
         if not line:
@@ -902,27 +1110,228 @@ class YouTubeDLDownloader(Downloader):
         else:
             try:
                 (pct, total, rate, eta) = self.PROGRESS_RE.search(line).groups()
-                self.progress.pct = float(pct)/100
-                self.progress.total = bitmath.parse_string(
-                        total
-                )
-                self.progress.dled = (self.progress.pct * self.progress.total)
-                self.progress.rate = bitmath.parse_string(rate.split("/")[0]) if rate else None
-                self.progress.eta = eta
             except AttributeError as e:
                 return
+            self.progress.pct = float(pct)/100
+            self.progress.total = parse_size(total)
+            self.progress.dled = (
+                self.progress.pct * self.progress.total
+                if self.progress.total else None
+            )
+            self.progress.rate = parse_size(rate.split("/")[0]) if rate else None
+            self.progress.eta = eta
+
+
+class YTDLPDownloader(YouTubeDLDownloader):
+    """
+    yt-dlp can print progress with a template, so we ask for the raw byte
+    counts instead of parsing the human-readable progress line.
+    """
+
+    CMD = "yt-dlp"
+
+    PROGRESS_PREFIX = "sgprogress"
+
+    PROGRESS_TEMPLATE = " ".join([PROGRESS_PREFIX] + [
+        f"%(progress.{field})s" for field in [
+            "downloaded_bytes", "total_bytes", "total_bytes_estimate",
+            "speed", "eta"
+        ]
+    ])
+
+    def __init__(self, path, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        if self.with_progress:
+            self.extra_args_pre += [
+                "--progress-template", f"download:{self.PROGRESS_TEMPLATE}"
+            ]
+
+    @staticmethod
+    def parse_number(value):
+        try:
+            return float(value)
+        except ValueError:
+            # "NA" or "None" for fields that aren't known (yet)
+            return None
+
+    async def update_progress_line(self, line):
+        if not line.startswith(self.PROGRESS_PREFIX):
+            return await super().update_progress_line(line)
+        (dled, total, estimate, rate, eta) = [
+            self.parse_number(v) for v in line.split()[1:6]
+        ]
+        self.progress.dled = dled
+        self.progress.total = total or estimate
+        self.progress.pct = dled / self.progress.total if dled and self.progress.total else None
+        self.progress.rate = rate
+        self.progress.eta = str(timedelta(seconds=int(eta))) if eta is not None else None
+
+
+class NativeProcess(object):
+    """
+    Stands in for an asyncio subprocess when a program runs in-process, so the
+    task manager can wait on and terminate it the same way.
+    """
+
+    def __init__(self, coro):
+        self.pid = None
+        self.returncode = None
+        self.task = state.event_loop.create_task(self._run(coro))
+
+    async def _run(self, coro):
+        try:
+            self.returncode = await coro
+        except asyncio.CancelledError:
+            self.returncode = -signal.SIGTERM
+        except Exception as e:
+            logger.exception(e)
+            self.returncode = 1
+
+    async def wait(self):
+        await asyncio.shield(self.task)
+        return self.returncode
+
+    def terminate(self):
+        self.task.cancel()
+
+    def kill(self):
+        self.task.cancel()
+
+
+class HLSDownloader(Downloader):
+    """
+    Built-in downloader for HLS streams, which fetches segments concurrently
+    instead of at playback speed.  Output goes to a file, or to a pipe when
+    feeding a player.  URLs that aren't playlists are resolved with
+    streamlink's plugins first.
+    """
+
+    CMD = "hls"
+    NATIVE = True
+
+    DEFAULT_CONCURRENCY = 8
+
+    def __init__(self, path, concurrency=None, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        self.concurrency = concurrency or self.DEFAULT_CONCURRENCY
+        self.outfile = None
+        self.pipe = False
+        self.resolution = None
+        self.offset = None
+        self.headers = None
+        self.cookies = None
+
+    @property
+    def is_simple(self):
+        return False
+
+    @classmethod
+    def supports_url(cls, url):
+        return bool(url) and urllib.parse.urlparse(url).path.endswith(".m3u8")
+
+    def process_args(self, task, outfile, **kwargs):
+        self.outfile = outfile
+
+    def process_kwargs(self, kwargs):
+        self.resolution = kwargs.pop("resolution", "best")
+        self.offset = kwargs.pop("offset", None)
+        self.headers = kwargs.pop("headers", None)
+        self.cookies = kwargs.pop("cookies", None)
+
+    def pipe_to_dst(self):
+        self.pipe = True
+
+    @property
+    def full_command(self):
+        return [self.cmd] + self.source_args + [
+            "-" if self.pipe else self.outfile
+        ]
+
+    async def resolve(self, url):
+        if self.supports_url(url):
+            return url
+
+        import streamlink.stream
+
+        def get_stream():
+            if self.headers or self.cookies:
+                # keep credentials off the shared session
+                import streamlink.api
+                session = streamlink.api.Streamlink()
+                session.set_option("http-headers", self.headers or {})
+                session.set_option("http-cookies", self.cookies or {})
+            else:
+                session = StreamlinkDownloader.session()
+            streams = session.streams(url)
+            return streams.get(self.resolution) or streams.get("best")
+
+        stream = await state.event_loop.run_in_executor(None, get_stream)
+        if not isinstance(stream, streamlink.stream.HLSStream):
+            raise SGStreamNotFound(f"no HLS stream for {url}")
+        return stream.url
+
+    async def fetch(self, output):
+
+        try:
+            url = await self.resolve(self.source_args[0])
+            loop = state.event_loop
+
+            async def write(data):
+                await loop.run_in_executor(None, output.write, data)
+
+            async with aiohttp.ClientSession(
+                    headers=self.headers,
+                    cookies=self.cookies,
+                    timeout=aiohttp.ClientTimeout(sock_read=60)
+            ) as session:
+                fetcher = hls.HLSFetcher(
+                    session, url, write,
+                    resolution=self.resolution,
+                    offset=self.offset,
+                    concurrency=self.concurrency,
+                    progress=self.progress
+                )
+                await fetcher.run()
+        except BrokenPipeError:
+            logger.info("player closed the stream")
+        finally:
+            try:
+                output.close()
+            except BrokenPipeError:
+                pass
+        return 0
+
+    async def run(self, source=None, **kwargs):
+        if source:
+            self.source = source
+        self.process_kwargs(kwargs)
+        logger.info(f"full cmd: {' '.join(self.full_command)}")
+        if self.pipe:
+            # the caller closes its end of the pipe as soon as we return
+            output = os.fdopen(os.dup(self.stdout), "wb")
+        else:
+            d = os.path.dirname(self.outfile)
+            if d and not os.path.isdir(d):
+                os.makedirs(d)
+            output = open(self.outfile, "wb")
+        self.proc = NativeProcess(self.fetch(output))
+        return self.proc
 
 
 class StreamlinkDownloader(Downloader):
 
     PLAYER_INTEGRATED=True
 
+    progress_pty = True
+
     PROGRESS_RE = re.compile(
         r"Written (\d+.\d+ \S+) \((\d+\S+) @ (\d+.\d+ \S+)\)"
     )
 
     with_progress = True
 
+    _session = None
+
     @property
     def is_simple(self):
         return False
@@ -961,8 +1370,8 @@ class StreamlinkDownloader(Downloader):
         if cookies:
             self.extra_args_pre += list(
                 chain.from_iterable([
-                    ("--http-cookie", f"{c.name}={c.value}")
-                for c in cookies
+                    ("--http-cookie", f"{name}={value}")
+                for name, value in cookies.items()
             ]))
         # super().process_kwargs(kwargs)
 
@@ -973,10 +1382,20 @@ class StreamlinkDownloader(Downloader):
         self.extra_args_pre += ["-o", self.fifo]
 
 
+    @classmethod
+    def session(cls):
+        # plugins are loaded when the session is created, and importing
+        # streamlink is slow, so wait until it's needed
+        if cls._session is None:
+            import streamlink.api
+            cls._session = streamlink.api.Streamlink()
+        return cls._session
+
     @classmethod
     def supports_url(cls, url):
+        import streamlink.exceptions
         try:
-            return streamlink.api.Streamlink().resolve_url(url) is not None
+            return cls.session().resolve_url(url) is not None
         except streamlink.exceptions.NoPluginError:
             return False
 
@@ -988,17 +1407,232 @@ class StreamlinkDownloader(Downloader):
             (dled, elapsed, rate) = self.PROGRESS_RE.search(line).groups()
         except AttributeError:
             return
-        self.progress.dled = bitmath.parse_string(dled)
-        self.progress.rate = bitmath.parse_string(rate.split("/")[0]) if rate else None
+        self.progress.dled = parse_size(dled)
+        self.progress.rate = parse_size(rate.split("/")[0]) if rate else None
+
+
+class HTTPDownloader(Downloader):
+    """
+    Built-in downloader for plain HTTP(S) URLs.  Large files are fetched over
+    several ranged connections at once, each writing its segment into place in
+    a preallocated output file.  Segment progress is kept in a sidecar state
+    file so an interrupted download can pick up where it left off.
+    """
+
+    CMD = "http"
+    NATIVE = True
+    RESUMABLE = True
+
+    supports_pipe = False
+
+    DEFAULT_CONNECTIONS = 4
+    DEFAULT_MIN_SEGMENT_SIZE = 4*1024*1024
+    CHUNK_SIZE = 256*1024
+    MAX_RETRIES = 3
+    STATE_INTERVAL = 1
+    STATE_SUFFIX = ".sgdl"
+
+    def __init__(self, path, connections=None, min_segment_size=None,
+                 *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        self.connections = connections or self.DEFAULT_CONNECTIONS
+        self.min_segment_size = min_segment_size or self.DEFAULT_MIN_SEGMENT_SIZE
+        self.outfile = None
+        self.resuming = False
+
+    @property
+    def is_simple(self):
+        return True
+
+    @classmethod
+    def supports_url(cls, url):
+        return bool(url) and url.split(":", 1)[0].lower() in ["http", "https"]
+
+    def resume(self):
+        self.resuming = True
+
+    def process_args(self, task, outfile, **kwargs):
+        self.outfile = outfile
+
+    @property
+    def full_command(self):
+        return [self.cmd] + self.source_args + [self.outfile]
+
+    @property
+    def state_file(self):
+        return self.outfile + self.STATE_SUFFIX
+
+    def load_state(self, url):
+        if not self.resuming or not os.path.exists(self.outfile):
+            return None
+        try:
+            with open(self.state_file) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("url") != url:
+            return None
+        return saved
+
+    def save_state(self, url, size, segments):
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(url=url, size=size, segments=segments), f)
+        os.replace(tmp, self.state_file)
+
+    def split(self, size):
+        count = max(1, min(self.connections, size // self.min_segment_size))
+        length = size // count
+        return [
+            # [start, end (inclusive), bytes written]
+            [i*length, size-1 if i == count-1 else (i+1)*length-1, 0]
+            for i in range(count)
+        ]
+
+    async def probe(self, session, url):
+        async with session.get(url, headers={"Range": "bytes=0-0"}) as res:
+            res.raise_for_status()
+            if res.status == 206:
+                try:
+                    return (int(res.headers["Content-Range"].split("/")[-1]), True)
+                except (KeyError, ValueError):
+                    pass
+            return (res.content_length, False)
+
+    async def fetch_segment(self, session, url, fd, segment):
+        for attempt in range(self.MAX_RETRIES):
+            (start, end, written) = segment
+            if start + written > end:
+                return
+            try:
+                async with session.get(
+                        url, headers={"Range": f"bytes={start+written}-{end}"}
+                ) as res:
+                    res.raise_for_status()
+                    async for chunk in res.content.iter_chunked(self.CHUNK_SIZE):
+                        os.pwrite(fd, chunk, start + segment[2])
+                        segment[2] += len(chunk)
+                        self.downloaded += len(chunk)
+                return
+            except aiohttp.ClientError as e:
+                logger.warning(f"segment {start}-{end} failed: {e}")
+                if attempt == self.MAX_RETRIES-1:
+                    raise
+                await asyncio.sleep(2**attempt)
+
+    async def fetch_stream(self, session, url, fd):
+        async with session.get(url) as res:
+            res.raise_for_status()
+            async for chunk in res.content.iter_chunked(self.CHUNK_SIZE):
+                os.pwrite(fd, chunk, self.downloaded)
+                self.downloaded += len(chunk)
+
+    def update_progress(self, size, elapsed, last):
+        self.progress.dled = self.downloaded
+        if elapsed:
+            rate = (self.downloaded - last) / elapsed
+            self.progress.rate = rate
+            if size and rate:
+                self.progress.eta = str(
+                    timedelta(seconds=int((size - self.downloaded) / rate))
+                )
+        if size:
+            self.progress.pct = self.downloaded / size
+
+    async def fetch(self):
+
+        url = self.source_args[0]
+        self.downloaded = 0
+        d = os.path.dirname(self.outfile)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+
+        async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(sock_read=60)
+        ) as session:
+
+            (size, ranged) = await self.probe(session, url)
+            self.progress.total = size
+            self.progress.dest = self.outfile
+
+            saved = self.load_state(url) if ranged else None
+            if saved and saved["size"] == size:
+                segments = saved["segments"]
+                self.downloaded = sum(s[2] for s in segments)
+                mode = "r+b"
+            else:
+                segments = self.split(size) if ranged else None
+                mode = "wb"
+
+            with open(self.outfile, mode) as f:
+                fd = f.fileno()
+                if size and mode == "wb":
+                    try:
+                        os.posix_fallocate(fd, 0, size)
+                    except (AttributeError, OSError):
+                        f.truncate(size)
+
+                if segments:
+                    logger.info(f"downloading {url} in {len(segments)} segments")
+                    self.progress.status = f"downloading ({len(segments)}x)"
+                    workers = [
+                        asyncio.ensure_future(
+                            self.fetch_segment(session, url, fd, segment)
+                        )
+                        for segment in segments
+                    ]
+                else:
+                    workers = [
+                        asyncio.ensure_future(self.fetch_stream(session, url, fd))
+                    ]
+                fetch = asyncio.gather(*workers)
+
+                try:
+                    last = self.downloaded
+                    while True:
+                        try:
+                            await asyncio.wait_for(
+                                asyncio.shield(fetch), self.STATE_INTERVAL
+                            )
+                            break
+                        except asyncio.TimeoutError:
+                            pass
+                        self.update_progress(size, self.STATE_INTERVAL, last)
+                        last = self.downloaded
+                        if segments:
+                            self.save_state(url, size, segments)
+                except BaseException:
+                    # a failed segment fails the gather but leaves the others
+                    # running, and none of them can write once fd is closed
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+                    if segments:
+                        self.save_state(url, size, segments)
+                    raise
+
+        self.update_progress(size, 0, self.downloaded)
+        self.progress.pct = 1.0
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        return 0
+
+    async def run(self, source=None, **kwargs):
+        if source:
+            self.source = source
+        logger.info(f"full cmd: {' '.join(self.full_command)}")
+        self.proc = NativeProcess(self.fetch())
+        return self.proc
 
 
 class WgetDownloader(Downloader):
 
+    RESUMABLE = True
+
     with_progress = "stderr"
 
     default_args = [
-        "--show-progress", "--progress=bar:force",
-        "--limit-rate=1000"
+        "--show-progress", "--progress=bar:force"
     ]
 
     SIZE_LINE_RE=re.compile(
@@ -1025,7 +1659,7 @@ class WgetDownloader(Downloader):
 
         try:
             (total,) = self.SIZE_LINE_RE.search(line).groups()
-            self.progress.total = bitmath.parse_string(total + "b")
+            self.progress.total = int(total)
         except AttributeError:
             pass
 
@@ -1036,11 +1670,11 @@ class WgetDownloader(Downloader):
 
         try:
             (pct, dled, rate, eta) = self.PROGRESS_LINE_RE.search(line).groups()
-            rate = rate.replace("K", "k")
             self.progress.pct = float(pct)/100
-            self.progress.dled = (self.progress.pct * self.progress.total)
+            if self.progress.total:
+                self.progress.dled = (self.progress.pct * self.progress.total)
             if not "-" in rate:
-                self.progress.rate = bitmath.parse_string(rate.split("/")[0]) if rate else None
+                self.progress.rate = parse_size(rate.split("/")[0]) if rate else None
             if eta:
                 self.progress.eta = eta
 
@@ -1055,11 +1689,19 @@ class WgetDownloader(Downloader):
     def supports_url(cls, url):
         return True
 
+    def resume(self):
+        self.extra_args_pre += ["-c"]
+
     def process_args(self, task, outfile, **kwargs):
         self.extra_args_post += ["-O", outfile]
 
+    def pipe_to_dst(self):
+        self.extra_args_post += ["-O", "-"]
+
 class CurlDownloader(Downloader):
 
+    RESUMABLE = True
+
     @property
     def is_simple(self):
         return True
@@ -1068,9 +1710,16 @@ class CurlDownloader(Downloader):
     def supports_url(cls, url):
         return True
 
+    def resume(self):
+        self.extra_args_pre += ["-C", "-"]
+
     def process_args(self, task, outfile, **kwargs):
         self.extra_args_post += ["-o", outfile]
 
+    def pipe_to_dst(self):
+        # writes to stdout by default
+        pass
+
 
 
 class Postprocessor(Program):
@@ -0,0 +1,164 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+
+
+class PlaylistSync(object):
+    """
+    Keeps the preview player's playlist in step with a view's play items.
+    Once a view's items have been loaded into the player, later changes are
+    applied as individual playlist edits instead of reloading the whole
+    playlist, so paging through a long feed doesn't reset playback.
+    """
+
+    def __init__(self):
+        self.owner = None
+        self.player = None
+        self.entries = []
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def key(item):
+        return (item.get("media_listing_id"), item.get("index"))
+
+    def entries_for(self, items):
+        return [(self.key(item), item.locator) for item in items]
+
+    def loaded(self, owner, player, items):
+        """
+        Record that the player's playlist was just replaced with `items`.
+        """
+        self.owner = owner
+        self.player = player
+        self.entries = self.entries_for(items)
+
+    def invalidate(self):
+        self.owner = None
+        self.player = None
+        self.entries = []
+
+    @staticmethod
+    def diff(old, new):
+        """
+        Return the player commands that turn playlist `old` into `new`, where
+        both are lists of (key, locator) pairs.
+        """
+        commands = []
+        current = list(old)
+        wanted = set(key for key, locator in new)
+
+        for i in range(len(current)-1, -1, -1):
+            if current[i][0] not in wanted:
+                commands.append(("playlist-remove", i))
+                del current[i]
+
+        for i, (key, locator) in enumerate(new):
+            if i < len(current) and current[i][0] == key:
+                j = i
+            else:
+                j = next(
+                    (n for n in range(i+1, len(current)) if current[n][0] == key),
+                    None
+                )
+
+            if j is None:
+                commands.append(("loadfile", locator, "append"))
+                current.append((key, locator))
+                j = len(current)-1
+            if j != i:
+                commands.append(("playlist-move", j, i))
+                current.insert(i, current.pop(j))
+
+            if current[i][1] != locator:
+                # add the replacement after the old entry before removing it,
+                # so that if the old entry is playing, the player moves on to
+                # its replacement
+                commands.append(("loadfile", locator, "append"))
+                if len(current) != i+1:
+                    commands.append(("playlist-move", len(current), i+1))
+                commands.append(("playlist-remove", i))
+                current[i] = (key, locator)
+
+        return commands
+
+    async def sync(self, owner, player, items):
+        """
+        Apply the changes since the last sync to the player's playlist.
+        Returns False if the playlist has to be reloaded instead, because it
+        belongs to another view, the player was restarted, or the player's
+        playlist no longer matches what we last loaded.
+        """
+        async with self.lock:
+            if not player or owner is not self.owner or player is not self.player:
+                return False
+            count = await player.command("get_property", "playlist-count")
+            if count != len(self.entries):
+                logger.debug(f"playlist out of sync: {count} != {len(self.entries)}")
+                return False
+
+            entries = self.entries_for(items)
+            commands = self.diff(self.entries, entries)
+            logger.debug(f"syncing playlist: {len(commands)} commands")
+            for command in commands:
+                await player.command(*command)
+            self.entries = entries
+            return True
+
+
+class PlayItems(list):
+    """
+    A view's playlist entries, indexed by row so that mapping between table
+    rows and playlist positions doesn't scan the playlist.  Items are added a
+    row at a time with `add_row`, changed with `replace_row`, and removed with
+    `truncate`, all of which keep the index current.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.row_keys = []
+
+    def add_row(self, key, items):
+        """
+        Add the items for the next row.  `key` identifies the row's contents,
+        so callers can tell whether the row has changed since.
+        """
+        start = len(self)
+        self.extend(items)
+        self.rows.append(range(start, len(self)))
+        self.row_keys.append(key)
+
+    def replace_row(self, row, key, items):
+        """
+        Replace the items for `row`, shifting the positions of the rows after
+        it if the number of items changed.
+        """
+        positions = self.rows[row]
+        self[positions.start:positions.stop] = items
+        self.rows[row] = range(positions.start, positions.start + len(items))
+        shift = len(items) - len(positions)
+        if shift:
+            for n in range(row+1, len(self.rows)):
+                self.rows[n] = range(self.rows[n].start + shift, self.rows[n].stop + shift)
+        self.row_keys[row] = key
+
+    def row_positions(self, row):
+        try:
+            return self.rows[row]
+        except IndexError:
+            return range(0)
+
+    def row_of(self, position):
+        return self[position].get("row_num")
+
+    def truncate(self, row):
+        """
+        Remove the items for `row` and every row after it.
+        """
+        if row >= len(self.rows):
+            return
+        start = self.rows[row].start
+        del self[start:]
+        del self.rows[row:]
+        del self.row_keys[row:]
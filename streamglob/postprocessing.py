@@ -0,0 +1,222 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import asyncio
+import time
+
+from .state import *
+from .exceptions import *
+from . import config
+from . import player
+
+
+class PipelineProcess(object):
+    """
+    Waits on and terminates a chain of piped processes as if they were one.
+    """
+
+    def __init__(self, procs):
+        self.procs = procs
+        self.pid = procs[-1].pid
+        self.returncode = None
+
+    async def wait(self):
+        returncodes = [await p.wait() for p in self.procs]
+        self.returncode = next((r for r in returncodes if r), 0)
+        return self.returncode
+
+    def terminate(self):
+        for p in self.procs:
+            try:
+                p.terminate()
+            except ProcessLookupError:
+                pass
+
+    def kill(self):
+        for p in self.procs:
+            try:
+                p.kill()
+            except ProcessLookupError:
+                pass
+
+
+class PostprocessingExecutor(object):
+    """
+    Runs the postprocessing stages of download tasks.  Stages from all tasks
+    share a pool of workers sized to the number of CPU cores, and each task
+    starts its next stage as soon as the previous one exits.
+
+    Postprocessors configured with `streaming: true` read their input from
+    stdin and write their output to stdout, so a run of them is piped straight
+    into the stage that follows without an intermediate file, and the whole
+    run takes a single worker.
+    """
+
+    def __init__(self):
+        self._workers = None
+        self._size = None
+
+    @property
+    def max_workers(self):
+        return (config.settings.tasks.postprocess.workers
+                or os.cpu_count() or 1)
+
+    @property
+    def workers(self):
+        if not self._workers or self._size != self.max_workers:
+            self._size = self.max_workers
+            self._workers = asyncio.Semaphore(self._size)
+        return self._workers
+
+    @staticmethod
+    def is_streaming(spec):
+        try:
+            program = state.PROGRAMS.postprocessor[spec]
+        except (KeyError, TypeError):
+            return False
+        return bool(getattr(program, "cfg", {}).get("streaming"))
+
+    def next_group(self, task):
+        group = []
+        for spec in task.postprocessors:
+            group.append(spec)
+            if not self.is_streaming(spec):
+                break
+        return group
+
+    async def spawn_group(self, task, group, infile, outfile, stdin=None):
+
+        postprocessors = []
+        procs = []
+        read = stdin
+        for i, spec in enumerate(group):
+            last = (i == len(group)-1)
+            postprocessor = next(player.Postprocessor.get(spec))
+            postprocessor.listing = task.listing
+            if read is None:
+                postprocessor.source = infile
+            else:
+                postprocessor.source = "-"
+                postprocessor.stdin = read
+            if last:
+                postprocessor.process_args(task, outfile)
+            else:
+                (next_read, write) = os.pipe()
+                postprocessor.with_progress = False
+                postprocessor.stdout = write
+                postprocessor.process_args(task, "-")
+            logger.debug(f"postprocessor: {postprocessor.cmd}, stage {task.stage}.{i}")
+            proc = await postprocessor.run()
+            # the children hold their own copies of the pipe ends
+            if read is not None:
+                os.close(read)
+            if not last:
+                os.close(write)
+                read = next_read
+            postprocessors.append(postprocessor)
+            procs.append(proc)
+
+        return (postprocessors, procs)
+
+    async def start_group(self, task, group, infile, outfile):
+
+        (postprocessors, procs) = await self.spawn_group(task, group, infile, outfile)
+        task.program.set_result(postprocessors[-1])
+        task.proc.set_result(procs[-1])
+        task.pid = procs[-1].pid
+        return procs
+
+    def can_pipe_download(self, task):
+        return (
+            len(task.postprocessors) > 0
+            and not task.resume
+            and not len(task.stage_results)
+            and self.is_streaming(task.postprocessors[0])
+        )
+
+    async def pipe_download(self, task, *args, **kwargs):
+        """
+        Start a download with its output piped straight into the task's
+        leading streaming postprocessors, so the raw download is never
+        written to disk.  Falls back to downloading to a file if the
+        downloader can't write to a pipe.  Returns the process to wait on and
+        the file it writes, which is the same either way.
+        """
+        group = self.next_group(task)
+        if len(group) == len(task.postprocessors) and task.dest:
+            # staged like any other output, so the destination only appears
+            # once the task has finished
+            outfile = os.path.join(task.tempdir, os.path.basename(task.dest))
+        else:
+            outfile = task.stage_outfile
+
+        (read, write) = os.pipe()
+        try:
+            proc = await player.Downloader.download(
+                task, outfile, *args, pipe=write, **kwargs
+            )
+        except Exception:
+            os.close(read)
+            raise
+        finally:
+            os.close(write)
+
+        if not proc or not task.program.result().piped:
+            os.close(read)
+            return (proc, outfile)
+
+        (postprocessors, procs) = await self.spawn_group(
+            task, group, None, outfile, stdin=read
+        )
+        task.piped_stages = len(group)
+        logger.info(f"{task.title}: piping download into {'|'.join(str(spec) for spec in group)}")
+        return (PipelineProcess([proc] + procs), outfile)
+
+    async def run_group(self, task, group):
+
+        infile = task.stage_infile
+        outfile = task.stage_outfile
+        if os.path.exists(outfile):
+            # left behind by an interrupted run
+            os.remove(outfile)
+
+        async with self.workers:
+            started = time.monotonic()
+            procs = await self.start_group(task, group, infile, outfile)
+            returncodes = [await p.wait() for p in procs]
+            elapsed = time.monotonic() - started
+
+        name = "|".join(str(spec) for spec in group)
+        task.stage_times = (task.stage_times or []) + [(name, elapsed)]
+        logger.info(f"{task.title}: stage {task.stage} ({name}) took {elapsed:.1f}s")
+        if any(returncodes):
+            # whatever was written is incomplete
+            if os.path.exists(outfile):
+                os.remove(outfile)
+            raise SGException(
+                f"processing stage {task.stage} ({name}) exited with {returncodes}"
+            )
+        return outfile
+
+    async def run(self, task, on_stage=None):
+        """
+        Run the remaining postprocessors of a task, calling `on_stage` after
+        each stage completes.  Raises SGException if a stage fails, leaving
+        the failed stage and the ones after it in `task.postprocessors`.
+        """
+        while len(task.postprocessors):
+            group = self.next_group(task)
+            outfile = await self.run_group(task, group)
+
+            if not os.path.isfile(outfile):
+                raise SGException(
+                    f"processing stage {task.stage} didn't write {outfile}"
+                )
+            task.stage_results.append(outfile)
+            del task.postprocessors[:len(group)]
+            if len(task.postprocessors):
+                task.reset()
+            if on_stage:
+                on_stage(task)
+
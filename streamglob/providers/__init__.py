@@ -3,17 +3,102 @@ logger = logging.getLogger(__name__)
 
 import abc
 import re
+import functools
 from functools import wraps
 import traceback
+from collections.abc import Mapping
+try:
+    from importlib.metadata import entry_points
+except ImportError:
+    from importlib_metadata import entry_points
 
-from stevedore import extension
 from orderedattrdict import AttrDict, Tree
 
 # from .. import session
 from .. import config
+from .. import startup
 from ..exceptions import *
 
-PROVIDERS = AttrDict()
+ENTRY_POINT_GROUP = "streamglob.providers"
+
+
+class ProviderRegistry(Mapping):
+    """
+    Maps provider names to providers.  Providers are registered by name from
+    their entry points, and each one is only imported and instantiated the
+    first time it's looked up.
+    """
+
+    def __init__(self, entry_points=None):
+        self._entry_points = AttrDict(
+            (ep.name, ep) for ep in entry_points or []
+        )
+        self._providers = AttrDict()
+        self.configured = False
+
+    def __getitem__(self, name):
+        if name not in self._providers:
+            self._providers[name] = self.instantiate(self._entry_points[name])
+        return self._providers[name]
+
+    def __iter__(self):
+        return iter(self._entry_points)
+
+    def __len__(self):
+        return len(self._entry_points)
+
+    def __contains__(self, name):
+        return name in self._entry_points
+
+    def instantiate(self, ep):
+        with startup.profile.phase(ep.value, "import"):
+            cls = ep.load()
+        with startup.profile.phase(f"{ep.name} provider"):
+            provider = cls()
+            if self.configured:
+                provider.init_config()
+        return provider
+
+    def title(self, name):
+        """
+        The provider's display name, without loading it if it isn't loaded.
+        """
+        if name in self._providers:
+            return self._providers[name].NAME
+        return self._entry_points[name].value.split(":")[-1].replace("Provider", "")
+
+    def is_loaded(self, name):
+        return name in self._providers
+
+    def rpc_methods(self, name):
+        """
+        The provider's RPC methods.  If the provider isn't loaded, its class
+        is imported to find them, and each one loads the provider the first
+        time it's called.
+        """
+        if name in self._providers:
+            return list(self._providers[name].RPC_METHODS)
+        cls = self._entry_points[name].load()
+        if not isinstance(cls.RPC_METHODS, (list, tuple)):
+            # a property, so only known once the provider is instantiated
+            return list(self[name].RPC_METHODS)
+
+        def lazy(func):
+            @functools.wraps(func)
+            async def method(*args, **kwargs):
+                return await getattr(self[name], func.__name__)(*args, **kwargs)
+            return method
+
+        return [
+            (method_name, lazy(func))
+            for method_name, func in cls.RPC_METHODS
+        ]
+
+    def loaded(self):
+        return self._providers.items()
+
+
+PROVIDERS = ProviderRegistry()
 DEFAULT_PROVIDER=None
 
 # FOO=1
@@ -26,6 +111,10 @@ def get(provider, *args, **kwargs):
         return PROVIDERS.get(provider)
     except TypeError:
         raise Exception(provider, PROVIDERS)
+    except Exception:
+        logger.error(f"failed to load provider {provider}")
+        logger.error(traceback.format_exc())
+        raise
 
 URI_SPEC_RE=re.compile(r"(?:(\w+)://)?([^:/]*)(.*)")
 
@@ -65,24 +154,20 @@ def load_config(default=None):
         # first loaded
         DEFAULT_PROVIDER = list(PROVIDERS.keys())[0]
 
-    for p in PROVIDERS.values():
+    # providers loaded after this are configured as they're loaded
+    PROVIDERS.configured = True
+    for name, p in PROVIDERS.loaded():
         p.init_config()
 
 
-def log_plugin_exception(manager, entrypoint, exception):
-    logger.error("Failed to load {entrypoint}")
-    logger.error("".join(traceback.format_exc(exception)))
-
 def load():
     global PROVIDERS
 
-    mgr = extension.ExtensionManager(
-        namespace='streamglob.providers',
-        on_load_failure_callback=log_plugin_exception,
-    )
-    PROVIDERS = AttrDict(
-        (x.name, x.plugin())
-        for x in mgr
-    )
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    PROVIDERS = ProviderRegistry(eps)
 
     # load_config()
@@ -23,6 +23,7 @@ from .. import player
 from .. import config
 from .. import model
 from .. import utils
+from ..playlist import PlayItems
 
 from .base import *
 from .filters import *
@@ -1260,7 +1261,7 @@ class BAMMediaSourceMixin(object):
 
     @property
     def download_helper(self):
-        return "streamlink"
+        return "hls"
 
     @property
     def milestones(self):
@@ -1668,7 +1669,7 @@ class BAMProviderDataTable(SynchronizedPlayerProviderMixin, ProviderDataTable):
 
     @property
     def play_items(self):
-        return []
+        return PlayItems()
 
     @property
     def empty_message(self):
@@ -1808,15 +1809,31 @@ class BAMProviderMixin(BackgroundTasksMixin, abc.ABC):
     def VIEW(self):
         return SimpleProviderView(self, BAMProviderDataTable(self))
 
+    def derive_config(self, cfg):
+        # set alternate team color attributes
+        teams = cfg.attributes.teams
+        if not teams:
+            return cfg
+
+        def derive(name, fn):
+            return AttrDict(
+                cfg.attributes.get(name) or {},
+                **{teamname: fn(attr) for teamname, attr in teams.items()}
+            )
+
+        attributes = AttrDict(
+            cfg.attributes,
+            teams_primary=derive("teams_primary", lambda attr: {"fg": attr["bg"]}),
+            teams_alternate=derive("teams_alternate", lambda attr: {"fg": attr["fg"]}),
+            teams_full=derive("teams_full", lambda attr: attr),
+            teams_inverse=derive(
+                "teams_inverse", lambda attr: {"fg": attr["bg"], "bg": attr["fg"]}
+            )
+        )
+        return AttrDict(cfg, attributes=attributes)
+
     def init_config(self):
         super().init_config()
-        # set alternate team color attributes
-        for teamname, attr in self.config.attributes.teams.items():
-            self.config.attributes.teams_primary[teamname] = {"fg": attr["bg"]}
-            self.config.attributes.teams_alternate[teamname] = {"fg": attr["fg"]}
-            self.config.attributes.teams_full[teamname] = attr
-            self.config.attributes.teams_inverse[teamname] = {"fg": attr["bg"], "bg": attr["fg"]}
-            # del self.config.attributes.teams[teamname]
         if not "last_team_update" in self.provider_data:
             self.provider_data["last_team_update"] = None
         if (self.provider_data["last_team_update"]is None
@@ -2290,8 +2307,11 @@ class BAMProviderMixin(BackgroundTasksMixin, abc.ABC):
             kwargs["offset"] = offset_delta
 
         if source.requires_auth:
-            kwargs["headers"] = self.session.headers
-            kwargs["cookies"] = self.session.cookies
+            # plain dicts, so they can be stored with download tasks
+            kwargs["headers"] = dict(self.session.headers)
+            kwargs["cookies"] = requests.utils.dict_from_cookiejar(
+                self.session.cookies
+            )
 
         return (source, kwargs)
 
@@ -5,6 +5,7 @@ import os
 import abc
 import asyncio
 import dataclasses
+from collections.abc import Mapping
 import re
 from itertools import chain
 # import textwrap
@@ -23,6 +24,9 @@ from ..state import *
 from ..player import Player, Downloader
 from .. import model
 from .. import config
+from ..debounce import debouncer
+from ..playlist import PlayItems
+from ..rules import RuleSet
 from  ..utils import *
 
 # @keymapped()
@@ -192,6 +196,8 @@ class BaseProvider(abc.ABC, Observable):
     ATTRIBUTES = AttrDict(title={"width": ("weight", 1)})
     MEDIA_TYPES = None
     RPC_METHODS = []
+    # whether listings are labeled by the rules when they're stored
+    LABEL_ON_FETCH = False
 
     def __init__(self, *args, **kwargs):
         self._view = None
@@ -200,33 +206,6 @@ class BaseProvider(abc.ABC, Observable):
         self._filters = AttrDict({n: f(provider=self, name=n)
                                   for n, f in self.FILTERS.items() })
 
-        rules = AttrDict(
-            self.config.rules.label or {},
-            **config.settings.profile.rules.label or {}
-        )
-
-        labels = AttrDict(
-            self.config.labels,
-            **config.settings.profile.labels
-        )
-
-        self.rule_map = AttrDict([
-            (re.compile(k, re.IGNORECASE), v)
-            for k, v in
-            [(r, rules[r])
-             for r in rules.keys()]
-        ])
-
-        self.highlight_map = AttrDict([
-            (re.compile(k, re.IGNORECASE), labels[v])
-            for k, v in rules.items()
-        ])
-
-        self.highlight_re = re.compile(
-            "("
-            + "|".join([k.pattern for k in self.highlight_map.keys()])
-            + ")", re.IGNORECASE
-        )
         # print(self.filters)
         self.filters["search"].connect("changed", self.on_search_change)
 
@@ -479,6 +458,22 @@ class BaseProvider(abc.ABC, Observable):
     def translate_template(self, template):
         return template
 
+    @property
+    def filename_template(self):
+        generation = config.generation()
+        if getattr(self, "_filename_template_generation", None) != generation:
+            self._filename_template = model.FilenameTemplate(
+                self.output_path,
+                (
+                    self.config.get_path("output.template")
+                    or
+                    config.settings.profile.get_path("output.template")
+                ),
+                normalization=config.settings.profile.unicode_normalization or None
+            )
+            self._filename_template_generation = generation
+        return self._filename_template
+
     # def new_listing_attr(self, **kwargs):
     #     return self.LISTING_CLASS.attr_class(
     #         provider_id = self.IDENTIFIER,
@@ -492,34 +487,91 @@ class BaseProvider(abc.ABC, Observable):
     def listings(self, filters=None):
         pass
 
+    @property
+    def download_rules(self):
+        """
+        Labels whose listings are downloaded automatically, from the provider
+        and profile `rules.download` settings.  These are either a list of
+        labels, or a mapping of labels to an optional `priority` for the
+        download tasks and a `quota` of downloads per day.
+        """
+        generation = config.generation()
+        if getattr(self, "_download_rules_generation", None) != generation:
+            rules = AttrDict()
+            for cfg in [
+                    self.config.rules.download,
+                    config.settings.profile.rules.download
+            ]:
+                if isinstance(cfg, Mapping):
+                    items = cfg.items()
+                else:
+                    items = [(label, None) for label in cfg or []]
+                for label, rule in items:
+                    rule = rule if isinstance(rule, Mapping) else {}
+                    rules[label] = AttrDict(
+                        priority=rule.get("priority"),
+                        quota=rule.get("quota")
+                    )
+            self._download_rules = rules
+            self._download_rules_generation = generation
+        return self._download_rules
+
     def should_download(self, listing):
-        return listing.label in (
-            list(self.config.rules)
-            + list(config.settings.profile.rules.download)
-        )
+        return listing.label in self.download_rules
 
     def on_new_listing(self, listing):
-        try:
-            label = next(
-                l
-                for r, l in self.rule_map.items()
-                if r.search(listing.title)
+        if listing.label is None:
+            listing.label = self.rules.label(listing.title)
+        if listing.label and self.should_download(listing):
+            state.task_manager.auto_downloader.submit(
+                self, listing.media_listing_id
             )
-            listing.label = label
-            if self.should_download(listing):
-                self.download(listing)
 
-        except StopIteration:
-            pass
+    def create_download_tasks(self, listing, index=None, **kwargs):
+        return DownloadListingMixin.create_download_tasks(
+            self, listing, index=index,
+            downloader_spec=getattr(self.config, "helpers"),
+            **kwargs
+        )
 
+    @property
+    def rules(self):
+        generation = config.generation()
+        if getattr(self, "_rules_generation", None) != generation:
+            self._rules = RuleSet(
+                AttrDict(
+                    self.config.rules.label or {},
+                    **config.settings.profile.rules.label or {}
+                ),
+                AttrDict(
+                    self.config.labels,
+                    **config.settings.profile.labels
+                )
+            )
+            self._rules_generation = generation
+        return self._rules
 
     @property
     def config(self):
-        return config.ConfigTree(
-            config.settings.profile.providers.get(
-                self.IDENTIFIER, {}
+        generation = config.generation()
+        if getattr(self, "_config_generation", None) != generation:
+            cfg = (
+                config.settings.profile.providers.get(self.IDENTIFIER)
+                or config.FrozenConfigTree()
             )
-        )
+            derived = self.derive_config(cfg)
+            self._config = (
+                cfg if derived is cfg else config.FrozenConfigTree(derived)
+            )
+            self._config_generation = generation
+        return self._config
+
+    def derive_config(self, cfg):
+        """
+        Providers can override this to add settings derived from their
+        configuration, which is read-only, by returning an updated mapping.
+        """
+        return cfg
 
     @property
     def config_is_valid(self):
@@ -775,10 +827,8 @@ class SynchronizedPlayerMixin(object):
         # self.player = None
         self.player_task = None
         self.queued_task = None
-        self.pending_event_tasks = []
         self.on_focus_handler = None
         self.sync_player_playlist = False
-        self.video_filters = []
         self.playlist_lock = asyncio.Lock()
 
     def on_requery(self, source, count):
@@ -788,9 +838,7 @@ class SynchronizedPlayerMixin(object):
         self.enable_focus_handler()
 
     def load_more(self, position):
-        while len(self.pending_event_tasks):
-            t = self.pending_event_tasks.pop()
-            t.cancel()
+        debouncer.cancel(self)
         super().load_more(position)
         state.event_loop.create_task(self.preview_all())
 
@@ -802,9 +850,7 @@ class SynchronizedPlayerMixin(object):
         if not len(self.body):
             return
 
-        while len(self.pending_event_tasks):
-            t = self.pending_event_tasks.pop()
-            t.cancel()
+        debouncer.cancel(self)
 
         path = self.selected_source.local_path
 
@@ -822,7 +868,7 @@ class SynchronizedPlayerMixin(object):
 
     @property
     def play_items(self):
-        return []
+        return PlayItems()
 
     def new_listing(self, **kwargs):
         return model.TitledMediaListing.attr_class(**kwargs)
@@ -849,12 +895,25 @@ class SynchronizedPlayerMixin(object):
     @keymap_command()
     async def preview_all(self, playlist_position=None):
 
+        explicit_position = playlist_position is not None
         if not playlist_position:
             try:
                 playlist_position = self.playlist_position
             except AttributeError:
                 playlist_position = 0
 
+        player = (
+            state.task_manager.preview_player
+            if state.task_manager._preview_player.done()
+            else None
+        )
+        if len(self.play_items) and await state.task_manager.playlist.sync(
+                self, player, self.play_items
+        ):
+            if explicit_position:
+                await player.command("set_property", "playlist-pos", playlist_position)
+            return
+
         if len(self.play_items):
             listing = state.task_manager.make_playlist(self.playlist_title, self.play_items)
         else:
@@ -862,112 +921,56 @@ class SynchronizedPlayerMixin(object):
 
         await self.preview_listing(listing, playlist_position=playlist_position)
         # await self.preview_listing(listing)
+        if listing and state.task_manager._preview_player.done():
+            state.task_manager.playlist.loaded(
+                self, state.task_manager.preview_player, self.play_items
+            )
+        else:
+            state.task_manager.playlist.invalidate()
 
     def playlist_pos_to_row(self, pos):
-        return self.play_items[pos].row_num
+        return self.play_items.row_of(pos)
 
     def row_to_playlist_pos(self, row):
-        try:
-            media_listing_id = self[row].data.media_listing_id
-        except IndexError:
-            return 0
-        try:
-            return next(
-                n for n, i in enumerate(self.play_items)
-                if i.media_listing_id == media_listing_id
-            )
-        except StopIteration:
-            return 0
+        positions = self.play_items.row_positions(row)
+        return positions.start if positions else 0
 
     async def set_playlist_pos(self, pos):
 
-        def ffmpeg_escape(s):
-            return s.replace(":", "\\:").replace("'", "'\\\\\\''") # yikes
-
-        if not state.task_manager.preview_player:
-            return
-
-        if self.video_filters:
-            await state.task_manager.preview_player.command(
-                "vf", "del", ",".join([f"@{f}" for f in self.video_filters])
-            )
-
         if not (state.task_manager.preview_player and len(self)):
             return
 
         await state.task_manager.preview_player.command(
             "set_property", "playlist-pos", pos
         )
-        # try to ensure video filters aren't lost by waiting for next track
+        # mpv rebuilds the filter graph for the new track, so wait for it
+        # before updating the overlay.  If it hasn't happened yet, the
+        # overlay has to go into the filter chain itself, or the rebuild will
+        # bring back the previous item's text.
         try:
-            event = await state.task_manager.preview_player.wait_for_event(
+            await state.task_manager.preview_player.wait_for_event(
                 "playback-restart", 0.5
             )
-        except StopAsyncIteration:
-            pass
-
-
-        cfg = config.settings.profile.display.overlay
-
-        upscale = cfg.upscale or 1280
-        vf_scale = f"@upscale:lavfi=[scale=w=max(iw\\,{upscale}):h=-2]"
-
-        ox = str(cfg.x or 0)
-        oy = str(cfg.y or 0)
-
-        padding = cfg.text.padding or 0
-
-        filters = [
-            vf_scale
-        ]
-
-        if self.selected_source.media_type == "image":
-            vf_framerate = f"@framerate:framerate=fps={cfg.fps or 30}"
-            filters.append(vf_framerate)
-
-        if cfg.box:
-            box_color = cfg.box.color.default or "000000@0.5"
-            if self.playlist_position == len(self.play_items)-1:
-                box_color = cfg.box.color.end or box_color
-            vf_box = f"@box:drawbox=x={ox}:y={oy}:w=iw:h=(ih/{cfg.text.size or 50}*2)+{padding}:color={box_color}:t=fill"
-            filters.append(vf_box)
+            restarted = True
+        except (StopAsyncIteration, asyncio.TimeoutError):
+            restarted = False
+
+        if self.playlist_position == len(self.play_items)-1:
+            status = "end"
+        elif self.active_table.selected_source.local_path:
+            status = "downloaded"
+        else:
+            status = "default"
 
-        for element, text in dict(
+        await state.task_manager.overlay.update(
+            state.task_manager.preview_player,
+            self.selected_source.media_type,
+            dict(
                 playlist=f"{self.playlist_title} {self.playlist_position_text}",
-                title= self.play_items[pos].title
-            ).items():
-            text = ffmpeg_escape(text)
-            el_cfg = cfg.get(element)
-            color = el_cfg.text.color.default or cfg.text.color.default or "white"
-            if self.playlist_position == len(self.play_items)-1:
-                color = el_cfg.text.color.end or cfg.text.color.end or color
-            elif self.active_table.selected_source.local_path:
-                color = el_cfg.text.color.downloaded or cfg.text.color.downloaded or color
-
-            font = ffmpeg_escape(el_cfg.text.font or cfg.text.font or "sans")
-            size = el_cfg.text.size or cfg.text.size or 50
-            shadow_color = el_cfg.text.shadow.color or cfg.text.shadow.color or "black"
-            border_color = el_cfg.text.border.color or cfg.text.border.color or "black"
-            border_width = el_cfg.text.border.width or cfg.text.border.width or 1
-            shadow_x = el_cfg.text.shadow.x or cfg.text.shadow.x or 1
-            shadow_y = el_cfg.text.shadow.y or cfg.text.shadow.y or 1
-
-            x = el_cfg.x or ox
-            if isinstance(x, int):
-                x = str(x)
-            if isinstance(x, dict):
-                scroll_speed = x.scroll or 5
-                pause = x.scroll_pause or 3
-                x=f"w-w/{scroll_speed}*mod(if(lt(t, {pause}), 0, if(gt(text_w, w), t-{pause}, 0) ),{scroll_speed}*(w+tw/2)/w)-w"
-            x = x.format(x=ox, y=oy, padding=padding)
-            y = str(el_cfg.y or cfg.y).format(x=ox, y=oy, padding=padding)
-            vf_text=f"""@{element}:lavfi=[drawtext=text='{text}':fontfile='{font}':\
-x='{x}':y='{y}':fontsize=(h/{size}):fontcolor={color}:bordercolor={border_color}:\
-borderw={border_width}:shadowx={shadow_x}:shadowy={shadow_y}:shadowcolor={shadow_color}:expansion=none]"""
-            filters.append(vf_text)
-
-        await state.task_manager.preview_player.command(
-            "vf", "add", ",".join(filters)
+                title=self.play_items[pos].title
+            ),
+            status=status,
+            rebuild=not restarted
         )
 
     @property
@@ -1003,11 +1006,8 @@ borderw={border_width}:shadowx={shadow_x}:shadowy={shadow_y}:shadowcolor={shadow
         source = self.selected_source
         position = self.playlist_position
 
-        if self.config.auto_preview.delay:
-            logger.debug(f"sleeping: {self.config.auto_preview.delay}")
-            await asyncio.sleep(self.config.auto_preview.delay)
-
         await self.set_playlist_pos(position)
+        debouncer.observe((self, "preview"), "preview shown")
 
         if self.config.auto_preview.duration:
             await asyncio.sleep(self.config.auto_preview.duration)
@@ -1036,7 +1036,8 @@ borderw={border_width}:shadowx={shadow_x}:shadowy={shadow_y}:shadowcolor={shadow
     # FIXME: inner_focus comes from MultiSourceListingMixin
     async def sync_playlist_position(self):
 
-        await state.task_manager._preview_player
+        # shielded, since focus changes cancel this while it waits
+        await asyncio.shield(state.task_manager._preview_player)
         if len(self):
 
             try:
@@ -1046,41 +1047,41 @@ borderw={border_width}:shadowx={shadow_x}:shadowy={shadow_y}:shadowcolor={shadow
             # if position is None:
             #     return
 
-            while len(self.pending_event_tasks):
-                t = self.pending_event_tasks.pop()
-                t.cancel()
-
-            self.pending_event_tasks.append(
-                asyncio.create_task(
-                    self.preview_content()
-                )
+            debouncer.schedule(
+                (self, "preview"), self.preview_content,
+                delay=self.config.auto_preview.delay
             )
             await self.playlist_position_changed(position)
 
+    async def inflate_focused(self, position):
+        with db_session:
+            try:
+                listing = self[position].data_source#.attach()
+            except (TypeError, IndexError): # FIXME
+                return
+            # listing.on_focus()
+            if not (hasattr(listing, "on_focus") and listing.on_focus()):
+                return
+            listing_id = listing.media_listing_id
+        self.invalidate_rows([listing_id])
+        self.selection.close_details()
+        self.selection.open_details()
+        self.refresh()
+        await self.preview_all(playlist_position=self.playlist_position)
+
     def on_focus(self, source, position):
         if self.provider.auto_preview_enabled:
-            state.event_loop.create_task(self.sync_playlist_position())
+            debouncer.schedule((self, "focus"), self.sync_playlist_position)
         if len(self):
-            with db_session:
-                try:
-                    listing = self[position].data_source#.attach()
-                except (TypeError, IndexError): # FIXME
-                    return
-                # listing.on_focus()
-                if hasattr(listing, "on_focus") and listing.on_focus():
-                    async def reload(listing_id):
-                        self.invalidate_rows([listing_id])
-                        self.selection.close_details()
-                        self.selection.open_details()
-                        self.refresh()
-                        await self.preview_all(playlist_position=self.playlist_position)
-                    state.event_loop.create_task(reload(listing.media_listing_id))
+            # only inflate the listing that focus settles on
+            debouncer.schedule(
+                (self, "inflate"), self.inflate_focused, position,
+                delay=self.config.auto_preview.delay
+            )
         # state.loop.draw_screen()
 
     def on_deactivate(self):
-        while len(self.pending_event_tasks):
-            t = self.pending_event_tasks.pop()
-            t.cancel()
+        debouncer.cancel(self)
         super().on_deactivate()
 
     def on_player_load_failed(self, url):
@@ -1097,11 +1098,9 @@ borderw={border_width}:shadowx={shadow_x}:shadowy={shadow_y}:shadowcolor={shadow
                 failed_listing_id = play_item.media_listing_id
                 with db_session(optimistic=False):
                     listing = self.provider.LISTING_CLASS[failed_listing_id]
+                    state.link_checker.invalidate(listing.sources)
                     if not await listing.check():
-                        logger.debug("listing broken, fixing...")
-                        listing.refresh()
-                        # have to force a reload here since sources may have changed
-                        listing = listing.attach().detach()
+                        listing = self.repair_listing(listing)
                         source = next(
                             s for s in listing.sources
                             if s.rank == source_rank
@@ -1118,6 +1117,14 @@ borderw={border_width}:shadowx={shadow_x}:shadowy={shadow_y}:shadowcolor={shadow
 
         asyncio.create_task(async_handler())
 
+    @db_session(optimistic=False)
+    def repair_listing(self, listing):
+        logger.debug("listing broken, fixing...")
+        listing = self.provider.LISTING_CLASS[listing.media_listing_id]
+        listing.refresh()
+        # have to force a reload here since sources may have changed
+        return listing.attach().detach()
+
     async def playlist_replace(self, url, idx=None, pos=None):
 
         async with self.playlist_lock:
@@ -1161,9 +1168,20 @@ class SynchronizedPlayerProviderMixin(SynchronizedPlayerMixin):
             self.load_play_items()
         return self._play_items
 
-    def load_play_items(self):
+    @staticmethod
+    def row_sources(row):
+        if hasattr(row.data_source, "sources"):
+            return row.data_source.sources
+        return [
+            model.MediaSource.attr_class(
+                locator=row.data_source.cover,
+                media_type="image"
+            )
+        ]
+
+    def row_play_items(self, row_num, row):
         # FIXME: this is gross...
-        self._play_items = [
+        return [
             AttrDict(
                 media_listing_id=row.data.media_listing_id,
                 title=sanitize_filename(row.data_source.title),
@@ -1183,27 +1201,96 @@ class SynchronizedPlayerProviderMixin(SynchronizedPlayerMixin):
                 # locator=source.locator or getattr(source, "locator_thumbnail", None)
                 locator=source.locator_for_preview(state.listings_view.preview_mode)
             )
-            for (row_num, row, index, source) in [
-                    (row_num, row, index, source) for row_num, row in enumerate(self)
-                    for index, source in enumerate(
-                            row.data_source.sources
-                            if hasattr(row.data_source, "sources")
-                            else [
-                                model.MediaSource.attr_class(
-                                    locator=row.data_source.cover,
-                                    media_type="image"
-                                )
-                            ]
-                    )
-                    # if not source.is_bad
-            ]
+            for index, source in enumerate(self.row_sources(row))
+            # if not source.is_bad
         ]
-        # raise Exception(self.play_items)
+
+    @staticmethod
+    def row_key(row):
+        return (
+            row.data.media_listing_id,
+            len(row.data_source.sources) if hasattr(row.data_source, "sources") else 1
+        )
+
+    def load_play_items(self, incremental=False):
+        """
+        Build the play items for the table's rows.  If `incremental` is set,
+        items for the leading rows that haven't changed since the last load
+        are kept, so loading another page only adds items for the new rows.
+        """
+        preview_mode = state.listings_view.preview_mode
+        items = getattr(self, "_play_items", None)
+        if (not incremental or not items
+            or self._play_items_mode != preview_mode):
+            items = PlayItems()
+
+        rows = [(self.row_key(row), row) for row in self]
+        start = next(
+            (n for n, (key, row) in enumerate(rows)
+             if n >= len(items.row_keys) or items.row_keys[n] != key),
+            len(rows)
+        )
+        items.truncate(start)
+        for row_num, (key, row) in enumerate(rows[start:], start):
+            items.add_row(key, self.row_play_items(row_num, row))
+
+        self._play_items = items
+        self._play_items_mode = preview_mode
+
+    def reload_play_items(self, listing_ids):
+        """
+        Rebuild the play items for the rows of the listings in `listing_ids`,
+        leaving the items for every other row alone.
+        """
+        items = getattr(self, "_play_items", None)
+        if not items or self._play_items_mode != state.listings_view.preview_mode:
+            self.load_play_items()
+            return
+        for row_num, row in enumerate(self):
+            if row.data.media_listing_id not in listing_ids:
+                continue
+            if row_num >= len(items.rows):
+                break
+            items.replace_row(
+                row_num, self.row_key(row), self.row_play_items(row_num, row)
+            )
 
 
     def on_requery(self, source, count):
-        self.load_play_items()
+        self.load_play_items(incremental=True)
         super().on_requery(source, count)
+        self.check_sources()
+
+    def check_sources(self):
+
+        if getattr(self, "check_sources_task", None):
+            self.check_sources_task.cancel()
+
+        async def check():
+            dead = await state.link_checker.check_listings(
+                [row.data_source for row in self]
+            )
+            if not dead:
+                return
+            # repairing refreshes each listing from its provider, so it's
+            # done in worker threads instead of on the UI loop
+            results = await asyncio.gather(*(
+                state.event_loop.run_in_executor(None, self.repair_listing, listing)
+                for listing in dead
+            ), return_exceptions=True)
+            repaired = []
+            for listing, result in zip(dead, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"couldn't repair {listing.media_listing_id}: {result}")
+                    continue
+                repaired.append(listing.media_listing_id)
+            if not repaired:
+                return
+            self.invalidate_rows(repaired)
+            self.reload_play_items(set(repaired))
+            await self.preview_all()
+
+        self.check_sources_task = state.event_loop.create_task(check())
 
 
     def create_play_task(self, listing, *args, **kwargs):
@@ -1369,7 +1456,7 @@ class MultiSourceListingMixin(object):
 
 
     def on_inner_focus(self, position):
-        state.event_loop.create_task(self.sync_playlist_position())
+        debouncer.schedule((self, "focus"), self.sync_playlist_position)
 
     @property
     def playlist_position(self):
@@ -9,6 +9,7 @@ import functools
 import textwrap
 from itertools import chain
 import asyncio
+import time
 
 from orderedattrdict import AttrDict
 from panwid.datatable import *
@@ -22,6 +23,7 @@ import timeago
 
 from .. import model
 from .. import utils
+from ..debounce import debouncer
 
 from .base import *
 
@@ -68,6 +70,7 @@ class FeedMediaChannel(model.MediaChannel):
                     for i, s in enumerate(item["sources"])
                 ]
 
+                item["label"] = self.provider.rules.label(item.get("title"))
                 listing = self.provider.new_listing(
                     **item
                 ).attach()
@@ -93,6 +96,17 @@ class FeedMediaChannel(model.MediaChannel):
         await self.provider.view.channels.find_node(self.locator).refresh()
 
 
+    @db_session
+    def save_error(self, error=None):
+        channel = self.orm_class[self.channel_id]
+        if error:
+            channel.attrs["error"] = error
+        elif "error" in channel.attrs:
+            del channel.attrs["error"]
+        else:
+            return
+        commit()
+
     @db_session
     def mark_all_items_read(self):
         for i in self.items.select():
@@ -216,7 +230,7 @@ class FeedMediaListingMixin(object):
         return self.title
 
     async def check(self):
-        return all([await s.check() for s in self.sources])
+        return False not in await state.link_checker.check_many(self.sources)
 
     def refresh(self):
         pass
@@ -394,11 +408,27 @@ class CachedFeedProviderDataTable(SynchronizedPlayerProviderMixin, ProviderDataT
         # self.mark_read_on_focus = False
         # self.mark_read_task = None
         self.update_count = True
+        self.loading_more = False
         # urwid.connect_signal(self, "requery", self.on_requery)
 
-    def on_requery(self, source, count):
-        super().on_requery(source, count)
+    def reset(self, *args, **kwargs):
         self.update_count = True
+        self.provider.discard_prefetched()
+        super().reset(*args, **kwargs)
+
+    def requery(self, *args, **kwargs):
+        # loading another page doesn't change the count, but any other
+        # requery may be for different results
+        if not self.loading_more:
+            self.update_count = True
+        return super().requery(*args, **kwargs)
+
+    def load_more(self, *args, **kwargs):
+        self.loading_more = True
+        try:
+            return super().load_more(*args, **kwargs)
+        finally:
+            self.loading_more = False
 
     # def detail_box(self):
     #    return CachedFeedProviderDetailBox(self)
@@ -462,6 +492,8 @@ class CachedFeedProviderDataTable(SynchronizedPlayerProviderMixin, ProviderDataT
             if not item:
                 return
             item.mark_read()
+            # moves the item in or out of a filter on its status
+            self.update_count = True
             row.clear_attr("unread")
             self.set_value(position, "read", item.read)
             self.invalidate_rows([self[position].data.media_listing_id])
@@ -476,6 +508,8 @@ class CachedFeedProviderDataTable(SynchronizedPlayerProviderMixin, ProviderDataT
             if not item:
                 return
             item.mark_unread()
+            # moves the item in or out of a filter on its status
+            self.update_count = True
             row.set_attr("unread")
             self.set_value(position, "read", item.read)
             self.invalidate_rows([self[position].data.media_listing_id])
@@ -901,6 +935,11 @@ class CachedFeedProviderBodyView(urwid.WidgetWrap):
         urwid.connect_signal(self.channels, "change",
                              lambda s, *args: self._emit("feed_change", *args))
 
+    def reset(self, *args, **kwargs):
+        # listings may have been read, fetched or deleted
+        self.channels.refresh()
+        self.body.reset(*args, **kwargs)
+
     def mark_all_read(self):
         with db_session:
             for f in self.provider.selected_channels:
@@ -920,7 +959,12 @@ class CachedFeedProviderBodyView(urwid.WidgetWrap):
 
     def mark_feed_read(self):
         with db_session:
-            self.channels.listbox.focus.channel.mark_all_items_read()
+            feed = self.provider.FEED_CLASS.get(
+                provider_id=self.provider.IDENTIFIER,
+                locator=self.channels.selection.locator
+            )
+            if feed:
+                feed.mark_all_items_read()
         self.reset()
 
     def on_unread_change(self, source, listing):
@@ -1089,6 +1133,11 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
 
     DEFAULT_FETCH_LIMIT = 50
 
+    PREFETCH_DELAY = 0.5
+    PREFETCH_MAX_AGE = 60
+
+    LABEL_ON_FETCH = True
+
     TASKS = [
         # ("update", UPDATE_INTERVAL, [], {"force": True})
         ("update", UPDATE_INTERVAL)
@@ -1104,6 +1153,7 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
         self.filters["status"].connect("changed", self.on_status_change)
         self.filters["filters"].connect("changed", self.on_custom_change)
         self.pagination_cursor = None
+        self.prefetched = None
         self.limiter = get_limiter(rate=self.RATE_LIMIT, capacity=self.BURST_LIMIT)
         self.listing_lock = asyncio.Lock()
 
@@ -1120,6 +1170,28 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
                     max_items = config.settings.profile.cache.max_items,
                     max_age = config.settings.profile.cache.max_age
                 )
+        self.relabel_listings()
+
+    def relabel_listings(self):
+        # stored labels only need updating when the rules have changed
+        rules = self.rules
+        if self.provider_data.get("label_rules") == rules.fingerprint:
+            return
+        with db_session:
+            rows = select(
+                (l.media_listing_id, l.title, l.label)
+                for l in self.LISTING_CLASS
+                if l.provider_id == self.IDENTIFIER
+            )[:]
+            labels = rules.label_all([title for _, title, _ in rows])
+            changed = 0
+            for (listing_id, _, old), label in zip(rows, labels):
+                if label != old:
+                    self.LISTING_CLASS[listing_id].label = label
+                    changed += 1
+            logger.info(f"relabeled {changed} of {len(rows)} listings")
+            self.provider_data["label_rules"] = rules.fingerprint
+            self.save_provider_data()
 
     def format_feed(feed):
         return feed.name if hasattr(feed, "name") else ""
@@ -1176,6 +1248,7 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
     def create_feeds(self):
 
         all_channels = list(self.view.all_channels)
+        changed = False
         with db_session:
             for channel in all_channels:
 
@@ -1188,6 +1261,7 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
                         provider_id=self.IDENTIFIER,
                         locator=channel.locator
                     )
+                    changed = True
                 feed.name=channel.name
                 feed.attrs.update(channel.attrs)
 
@@ -1195,6 +1269,10 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
             for channel in self.FEED_CLASS.select():
                 if channel.locator not in [ c.get_key() for c in  all_channels ]:
                     self.FEED_CLASS[channel.channel_id].delete()
+                    changed = True
+
+        if changed:
+            self.view.channels.reload()
 
 
     def feed_attrs(self, feed_name):
@@ -1271,10 +1349,18 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
                     datetime.now() - feed.updated > timedelta(seconds=feed.update_interval)
                 ):
                     logger.info(f"updating {feed.locator}")
-                    with limit(self.limiter):
-                        await feed.update(resume=resume, replace=replace)
-                        # f.updated = datetime.now()
-                    # commit()
+                    try:
+                        with limit(self.limiter):
+                            await feed.update(resume=resume, replace=replace)
+                            # f.updated = datetime.now()
+                        # commit()
+                    except Exception as e:
+                        # shown in the channel tree until the next update succeeds
+                        logger.error(f"couldn't update {feed.locator}: {e}")
+                        feed.save_error(str(e) or type(e).__name__)
+                        self.view.channels.refresh()
+                    else:
+                        feed.save_error()
 
     def refresh(self):
         logger.info("+feed provider refresh")
@@ -1285,6 +1371,7 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
 
     def reset(self):
         logger.info("provider reset")
+        self.relabel_listings()
         self.pagination_cursor = None
         self.update_query()
         super().reset()
@@ -1313,50 +1400,58 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
     def update_query(self, sort=None, cursor=None):
 
         logger.info(f"update_query: {cursor}")
+        (self.all_items_query,
+         self.feed_items_query,
+         self.items_query) = self.build_query(sort=sort, cursor=cursor)
+
+    @db_session
+    def build_query(self, sort=None, cursor=None):
+
         status_filters =  {
             "all": lambda: True,
             "unread": lambda i: i.read is None,
             "not_downloaded": lambda i: i.downloaded is None
         }
 
-        self.all_items_query = (
+        all_items_query = (
             self.LISTING_CLASS.select()
         )
 
-        if self.selected_channels:
-            self.feed_items_query = self.all_items_query.filter(
-                lambda i: i.channel in self.selected_channels
+        selected_channels = self.selected_channels
+        if selected_channels:
+            feed_items_query = all_items_query.filter(
+                lambda i: i.channel in selected_channels
             )
         else:
-            self.feed_items_query = self.all_items_query
+            feed_items_query = all_items_query
 
-        self.items_query = self.feed_items_query
+        items_query = feed_items_query
         if self.feed_filters:
             for f in self.feed_filters:
-                self.items_query = self.items_query.filter(f)
+                items_query = items_query.filter(f)
 
-        self.items_query = self.items_query.filter(status_filters[self.filters.status.value])
+        items_query = items_query.filter(status_filters[self.filters.status.value])
 
         if self.search_filter:
             (field, query) = re.search("(?:(\w+):)?(.*)", self.search_filter).groups()
             if field and field in [a.name for a in self.LISTING_CLASS._attrs_]:
-                self.items_query = self.items_query.filter(
+                items_query = items_query.filter(
                     lambda i: getattr(i, field) == query
                 )
             else:
                 # raise Exception(query, self.pagination_cursor)
-                self.items_query = self.items_query.filter(
+                items_query = items_query.filter(
                     lambda i: query.lower() in i.title.lower()
                 )
 
         if self.custom_filters:
             for k, v in self.custom_filters.items():
-                self.items_query = self.items_query.filter(lambda i: v in getattr(i, k))
+                items_query = items_query.filter(lambda i: v in getattr(i, k))
 
         (sort_field, sort_desc) = sort if sort else self.view.sort_by
         if cursor:
             op = "<" if sort_desc else ">"
-            self.items_query = self.items_query.filter(
+            items_query = items_query.filter(
                 raw_sql(f"{sort_field} {op} '{cursor}'")
             )
 
@@ -1370,10 +1465,21 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
             pk_sort_attr = self.LISTING_CLASS._pk_
             if sort_desc:
                 pk_sort_attr = desc(pk_sort_attr)
-            # self.items_query = self.items_query.order_by(pk_sort_attr)
-            self.items_query = self.items_query.order_by(sort_fn)
-            # logger.info(self.items_query.get_sql())
-        self.view.update_count = True
+            # items_query = items_query.order_by(pk_sort_attr)
+            items_query = items_query.order_by(sort_fn)
+            # logger.info(items_query.get_sql())
+        return (all_items_query, feed_items_query, items_query)
+
+    def query_key(self, sort=None):
+        with db_session:
+            channels = tuple(c.channel_id for c in self.selected_channels)
+        return (
+            tuple(sort or self.view.sort_by),
+            channels,
+            self.filters.status.value,
+            self.search_filter,
+            repr(sorted(self.custom_filters.items()))
+        )
 
     async def apply_search_query(self, query):
         self.pagination_cursor=None
@@ -1387,47 +1493,85 @@ class CachedFeedProvider(BackgroundTasksMixin, TabularProviderMixin, FeedProvide
     def show_message(self, message):
         self.view.show_message(message)
 
-    def listings(self, sort=None, cursor=None, offset=None, limit=None, *args, **kwargs):
-
-        count = 0
-        # cursor = None
-
-        if not offset:
-            offset = 0
-
-        if not limit:
-            limit = self.limit
+    def fetch_listings(self, sort=None, cursor=None, limit=None):
 
         with db_session(optimistic=False):
 
-            self.update_query(sort=sort, cursor=cursor)
+            (_, _, items_query) = self.build_query(sort=sort, cursor=cursor)
 
-
-            for listing in self.items_query[:limit]:
+            listings = []
+            for listing in items_query.prefetch(self.LISTING_CLASS.sources)[:limit]:
                 sources = [
                     source.detach()
-                    for source in listing.sources.select().order_by(lambda s: s.rank)
+                    for source in sorted(listing.sources, key=lambda s: s.rank)
                 ]
                 listing = listing.detach()
                 listing.channel = listing.channel.detach()
                 listing.channel.listings = None
                 listing.sources = sources
 
-                # get last item's sort key and store it as our pagination cursor
-                # cursor = getattr(listing, self.view.sort_by[0])
-
                 # if not listing.check():
                 #     logger.debug("listing broken, fixing...")
                 #     listing.refresh()
                 #     # have to force a reload here since sources may have changed
                 #     listing = listing.attach().detach()
 
-                yield listing
+                listings.append(listing)
+            return listings
+
+    def take_prefetched(self, key):
+        if not self.prefetched:
+            return None
+        (prefetched_key, fetched, listings) = self.prefetched
+        self.prefetched = None
+        if (prefetched_key != key
+            or time.monotonic() - fetched > self.PREFETCH_MAX_AGE):
+            return None
+        logger.debug(f"using prefetched page: {key[1:]}")
+        return listings
+
+    def discard_prefetched(self):
+        debouncer.cancel(self, "prefetch")
+        self.prefetched = None
+
+    async def prefetch_listings(self, sort, cursor, limit):
+        key = (self.query_key(sort), cursor, limit)
+        # fetch_listings has its own db_session, so it can run in a worker
+        # thread instead of blocking the UI
+        listings = await state.event_loop.run_in_executor(
+            None, self.fetch_listings, sort, cursor, limit
+        )
+        self.prefetched = (key, time.monotonic(), listings)
+
+    def listings(self, sort=None, cursor=None, offset=None, limit=None, *args, **kwargs):
 
-        self.update_query(sort=sort, cursor=cursor)
+        if not limit:
+            limit = self.limit
 
+        # pages are fetched by keyset from the cursor, and the page after the
+        # one requested is fetched in the background while it's being viewed,
+        # so scrolling to it doesn't wait on the database.  Only one page is
+        # held in advance.
+        key = (self.query_key(sort), cursor, limit)
+        listings = self.take_prefetched(key)
+        if listings is None:
+            listings = self.fetch_listings(sort=sort, cursor=cursor, limit=limit)
+
+        # without the cursor, so the row count covers every page
+        self.update_query(sort=sort)
         self.pagination_cursor = cursor
-        # self.update_query(cursor, sort=sort)
+
+        yield from listings
+
+        if len(listings) == limit:
+            (sort_field, sort_desc) = sort if sort else self.view.sort_by
+            next_cursor = getattr(listings[-1], sort_field, None)
+            if sort_field and next_cursor is not None:
+                debouncer.schedule(
+                    (self, "prefetch"), self.prefetch_listings,
+                    sort, next_cursor, limit,
+                    delay=self.PREFETCH_DELAY
+                )
 
     @db_session
     async def mark_items_read(self, request):
@@ -70,8 +70,8 @@ class InstagramMediaSourceMixin(object):
     async def check(self):
         if self.created > datetime.now() - timedelta(hours=4):
             return True
-        res = await self.provider.session.head(self.locator)
-        return res.status == 200
+        async with self.provider.session.head(self.locator) as res:
+            return res.status == 200
 
     @property
     def download_helper(self):
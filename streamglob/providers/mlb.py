@@ -877,6 +877,7 @@ class MLBProvider(BAMProviderMixin,
             downloader_spec = downloader_spec or source.download_helper
             task = model.DownloadMediaTask.attr_class(
                 provider=self.NAME,
+                provider_id=self.IDENTIFIER,
                 title=utils.sanitize_filename(listing.title),
                 sources=[source],
                 listing=listing,
@@ -8,7 +8,6 @@ import urwid
 from panwid.datatable import *
 from panwid.keymap import *
 from pony.orm import *
-from pygoogletranslation import Translator
 
 from . import config
 from .. import utils
@@ -17,6 +16,7 @@ from ..widgets import *
 from .filters import *
 from ..state import *
 from .. import model
+from .. import translation
 
 class FilterToolbar(urwid.WidgetWrap):
 
@@ -164,6 +164,7 @@ class DownloadListingMixin(object):
             downloader_spec = downloader_spec or source.download_helper
             task = model.DownloadMediaTask.attr_class(
                 provider=self.NAME,
+                provider_id=self.IDENTIFIER,
                 title=utils.sanitize_filename(listing.title),
                 sources=[source],
                 listing=listing,
@@ -196,7 +197,6 @@ class ProviderDataTable(PlayListingMixin, DownloadListingMixin, BaseDataTable):
         self.provider = provider
         self.translate = self.provider.translate
         self.strip_emoji = self.provider.strip_emoji
-        self._translator = None
         super(ProviderDataTable,  self).__init__(*args, **kwargs)
 
 
@@ -239,12 +239,6 @@ class ProviderDataTable(PlayListingMixin, DownloadListingMixin, BaseDataTable):
     def listings(self, *args, **kwargs):
         yield from self.provider.listings(*args, **kwargs)
 
-    @property
-    def translator(self):
-        if not self._translator:
-            self._translator = Translator(sleep=1)
-        return self._translator
-
     def strip_emoji_selection(self):
         strip_emoji = self.strip_emoji
         index = getattr(self.selection.data_source, self.df.index_name)
@@ -265,12 +259,10 @@ class ProviderDataTable(PlayListingMixin, DownloadListingMixin, BaseDataTable):
         self.df.set(index, "_translate", translate)
         if translate:
             if "_title_translated" not in self.df.columns or not self.df.get(index, "_title_translated"):
-                translated = self.translator.translate(
-                    self.selection.data_source.title,
-                    src=self.selection.data_source.translate_src,
-                    dest=self.provider.translate_dest
-                ).text
-                self.df.set(index, "_title_translated", translated)
+                state.event_loop.create_task(self.translate_rows(
+                    [(index, self.selection.data_source.title)],
+                    src=self.selection.data_source.translate_src
+                ))
         self.invalidate_rows([index])
 
     def toggle_translate_all(self):
@@ -286,28 +278,34 @@ class ProviderDataTable(PlayListingMixin, DownloadListingMixin, BaseDataTable):
                 and isinstance(row.get("title"), str)
                 and len(row.get("title"))
             ]
-            # FIXME: bulk translate not working, so we improvise...
-            # translates = self.translator.translate(
-            #     [ t[1] for t in texts ],
-            #     src=self.provider.translate_src or "auto",
-            #     dest=self.provider.translate_dest
-            # )
-            translates = self.translator.translate(
-                "\N{VERTICAL LINE}".join(
-                    [ t[1].replace(
-                        "\N{VERTICAL LINE}", "|"
-                    ) for t in texts ]),
-                src=self.provider.translate_src or "auto",
-                dest=self.provider.translate_dest
-            ).text.split("\N{VERTICAL LINE}")
-            # raise Exception(translated)
-            for (i, _), t in zip(texts, translates):
-                self.df.set(i, "_translate", True)
-                self.df.set(i, "_title_translated", t)
+            if texts:
+                state.event_loop.create_task(self.translate_rows(
+                    texts, src=self.provider.translate_src or "auto"
+                ))
             self.invalidate_rows(
                 [ row.index for row in self if row.get("_title_translated") ]
             )
 
+    async def translate_rows(self, rows, src="auto"):
+        # rows are shown untranslated until their translations arrive
+        translated = await translation.translator.translate(
+            [ title for (index, title) in rows ],
+            src=src,
+            dest=self.provider.translate_dest
+        )
+        updated = []
+        for (index, _), t in zip(rows, translated):
+            if not t:
+                continue
+            try:
+                self.df.set(index, "_title_translated", t)
+            except ValueError:
+                # row went away in a requery
+                continue
+            updated.append(index)
+        if updated:
+            self.invalidate_rows(updated)
+
     def toggle_strip_emoji_all(self):
         self.strip_emoji = not self.strip_emoji
         self.invalidate_rows(
@@ -340,13 +338,15 @@ class ProviderDataTable(PlayListingMixin, DownloadListingMixin, BaseDataTable):
             if self.strip_emoji or row.get("_strip_emoji"):
                 value = utils.strip_emoji(value)
 
-            if self.provider.highlight_map:
-                markup = [
-                    ( next(v for k, v in self.provider.highlight_map.items()
-                           if k.search(x)), x)
-                    if self.provider.highlight_re.search(x)
-                    else x for x in self.provider.highlight_re.split(value) if x
-                ]
+            # stored titles are labeled when they're fetched, so the ones that
+            # didn't match any rule don't need to be scanned again
+            rules = self.provider.rules
+            if rules and (
+                    row.get("label")
+                    or value != row.get("title")
+                    or not self.provider.LABEL_ON_FETCH
+            ):
+                markup = rules.highlight(value)
                 if len(markup):
                     value = urwid.Text(markup)
 
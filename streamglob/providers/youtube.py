@@ -32,6 +32,7 @@ from ..widgets import *
 from .. import config
 from .. import model
 from .. import session
+from ..debounce import debouncer
 
 from .filters import *
 
@@ -525,7 +526,6 @@ class YouTubeDataTable(MultiSourceListingMixin, CachedFeedProviderDataTable):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.storyboard_lock = asyncio.Lock()
-        self.storyboard_tasks = []
 
     @property
     def thumbnails(self):
@@ -563,10 +563,7 @@ class YouTubeDataTable(MultiSourceListingMixin, CachedFeedProviderDataTable):
         super().reset(*args, **kwargs)
 
     def cancel_pending_tasks(self):
-        while len(self.storyboard_tasks):
-            task = self.storyboard_tasks.pop()
-            if not task.cancelled:
-                task.cancel()
+        debouncer.cancel(self)
 
     def on_activate(self):
         self.reset()
@@ -0,0 +1,214 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import re
+import collections
+
+REGEX_SPECIALS = set(".^$*+?{}[]\\|()")
+
+# constructs that change meaning or stop compiling when a pattern is combined
+# with others: named groups and references to them, backreferences,
+# conditionals and global inline flags
+UNCOMBINABLE_RE = re.compile(r"\(\?P[<=]|\(\?\(|\\\d|\(\?[aiLmsux]+\)")
+
+
+class KeywordMatcher(object):
+    """
+    Aho-Corasick automaton that finds every keyword occurring in a string in
+    a single pass, however many keywords there are.
+    """
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for keyword, value in keywords:
+            node = 0
+            for ch in keyword:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][ch] = nxt
+                node = nxt
+            self.out[node].append(value)
+
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                f = self.goto[f].get(ch, 0)
+                self.fail[nxt] = f if f != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def __bool__(self):
+        return len(self.goto) > 1
+
+    def search(self, text):
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class RuleSet(object):
+    """
+    Label rules, mapping case-insensitive patterns to labels, compiled for
+    matching many titles at once.  Rules that are plain keywords are found
+    with a KeywordMatcher, and the rest with a single combined regex, so a
+    title is scanned once or twice no matter how many rules there are.  As
+    with matching each rule in turn, a title gets the label of the first rule
+    that matches it.
+    """
+
+    def __init__(self, rules, attrs=None):
+
+        self.rules = list(rules.items())
+        self.attrs = attrs or {}
+        self.patterns = []
+
+        keywords = []
+        combined = []
+        self.separate = []
+
+        for i, (pattern, label) in enumerate(self.rules):
+            try:
+                self.patterns.append(re.compile(pattern, re.IGNORECASE))
+            except re.error as e:
+                logger.error(f"invalid rule {pattern}: {e}")
+                self.patterns.append(None)
+                continue
+            if not REGEX_SPECIALS & set(pattern):
+                keywords.append((pattern.lower(), i))
+            elif UNCOMBINABLE_RE.search(pattern):
+                self.separate.append(i)
+            else:
+                combined.append(i)
+
+        self.keywords = KeywordMatcher(keywords)
+        self.combined = combined
+        self.combined_re = self.join(combined)
+        self.highlight_re = self.join(
+            [i for i, p in enumerate(self.patterns)
+             if p and i not in self.separate]
+        )
+
+    def join(self, indexes):
+        if not indexes:
+            return None
+        return re.compile(
+            "|".join(f"(?P<r{i}>{self.rules[i][0]})" for i in indexes),
+            re.IGNORECASE
+        )
+
+    @staticmethod
+    def rule_index(match):
+        return int(match.lastgroup[1:])
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    @property
+    def fingerprint(self):
+        return repr(self.rules)
+
+    def match(self, text):
+        """
+        Return the index of the first rule that matches `text`, or None.
+        """
+        if not text or not self.rules:
+            return None
+
+        found = self.keywords.search(text.lower()) if self.keywords else set()
+        best = min(found) if found else len(self.rules)
+
+        if self.combined_re:
+            seen = set()
+            for m in self.combined_re.finditer(text):
+                seen.add(self.rule_index(m))
+            if seen:
+                best = min(best, min(seen))
+                # a match can hide an overlapping match for an earlier rule
+                for i in self.combined:
+                    if i >= best:
+                        break
+                    if i not in seen and self.patterns[i].search(text):
+                        best = i
+                        break
+
+        for i in self.separate:
+            if i >= best:
+                break
+            if self.patterns[i].search(text):
+                best = i
+                break
+
+        return best if best < len(self.rules) else None
+
+    def label(self, text):
+        i = self.match(text)
+        return self.rules[i][1] if i is not None else None
+
+    def label_all(self, texts):
+        return [self.label(text) for text in texts]
+
+    def spans(self, text):
+        """
+        Return (start, end, rule index) for the non-overlapping parts of
+        `text` that match a rule, in order, preferring the leftmost match.
+        """
+        found = []
+        if self.highlight_re:
+            found += [
+                (m.start(), m.end(), self.rule_index(m))
+                for m in self.highlight_re.finditer(text)
+                if m.end() > m.start()
+            ]
+        for i in self.separate:
+            found += [
+                (m.start(), m.end(), i)
+                for m in self.patterns[i].finditer(text)
+                if m.end() > m.start()
+            ]
+        if not self.separate:
+            return found
+
+        spans = []
+        pos = 0
+        for start, end, i in sorted(found, key=lambda s: (s[0], s[2])):
+            if start >= pos:
+                spans.append((start, end, i))
+                pos = end
+        return spans
+
+    def highlight(self, text):
+        """
+        Return urwid markup for `text` with the parts that match a rule shown
+        in the attribute for that rule's label.
+        """
+        markup = []
+        pos = 0
+        for start, end, i in self.spans(text):
+            if start > pos:
+                markup.append(text[pos:start])
+            attr = self.attrs.get(self.rules[i][1])
+            markup.append((attr, text[start:end]) if attr else text[start:end])
+            pos = end
+        if pos < len(text):
+            markup.append(text[pos:])
+        return markup
@@ -0,0 +1,54 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import time
+import contextlib
+import collections
+
+# imported before anything heavy so module imports can be timed too
+STARTED = time.perf_counter()
+
+
+class StartupProfile(object):
+    """
+    Records how long each phase of startup takes, split into imports and
+    initialization, for the `--profile-startup` report.
+    """
+
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.phases = []
+        self.finished = None
+
+    def record(self, category, name, elapsed):
+        self.phases.append((category, name, elapsed))
+
+    @contextlib.contextmanager
+    def phase(self, name, category="init"):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, time.perf_counter() - started)
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    def report(self):
+        totals = collections.defaultdict(float)
+        lines = []
+        for category, name, elapsed in self.phases:
+            totals[category] += elapsed
+            lines.append(f"{category:>8} {elapsed*1000:9.1f}ms  {name}")
+        lines.append("")
+        for category, elapsed in totals.items():
+            lines.append(f"{category:>8} {elapsed*1000:9.1f}ms  total")
+        if self.finished is not None:
+            lines.append(
+                f"{'startup':>8} {(self.finished - self.started)*1000:9.1f}ms  until the UI starts"
+            )
+        return "\n".join(lines)
+
+
+profile = StartupProfile()
@@ -4,30 +4,136 @@ import os
 import asyncio
 from datetime import datetime, timedelta
 from orderedattrdict import AttrDict
-import dataclasses
 import itertools
+import collections
+import heapq
+from urllib.parse import urlparse
 import textwrap
 import tempfile
 import traceback
 import re
+import json
 
 from . import player
 from .state import *
 from .exceptions import *
 from .widgets import Observable
-from . import utils
 from . import config
 from . import model
-from . import player
+from . import postprocessing
+from . import playlist
+from . import overlay
+from . import autodownload
+from pony.orm import db_session
 
 task_manager_task = None
 
-class TaskList(list):
+class TaskList(object):
+    """
+    Insertion-ordered collection of tasks keyed by task ID, so that moving a
+    task between lists doesn't require a scan.
+    """
+
+    def __init__(self, tasks=None):
+        self._tasks = {}
+        for task in tasks or []:
+            self.append(task)
+
+    def append(self, task):
+        self._tasks[task.task_id] = task
+
+    def remove(self, task):
+        self._tasks.pop(task.task_id, None)
+
+    def remove_by_id(self, task_id):
+        self._tasks.pop(task_id, None)
+
+    def pop(self):
+        return self._tasks.pop(next(iter(self._tasks)))
+
+    def __contains__(self, task):
+        return task.task_id in self._tasks
+
+    def __iter__(self):
+        return iter(list(self._tasks.values()))
+
+    def __len__(self):
+        return len(self._tasks)
+
+class TaskQueue(object):
+    """
+    Priority queue of pending tasks.  Tasks are kept in a separate heap for
+    each scheduling class (provider and host), so the most urgent task that
+    isn't held back by a per-class limit can be found by looking only at the
+    head of each heap.  Removed and reprioritized tasks are discarded lazily.
+    """
+
+    def __init__(self, key=None):
+        self.key = key or (lambda task: None)
+        self._heaps = collections.defaultdict(list)
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def append(self, task):
+        self.remove(task)
+        key = self.key(task)
+        # higher priorities first, then first in, first out
+        entry = [-(task.priority or 0), next(self._counter), task]
+        self._entries[task.task_id] = (key, entry)
+        heapq.heappush(self._heaps[key], entry)
+
+    def remove(self, task):
+        self.remove_by_id(task.task_id)
 
     def remove_by_id(self, task_id):
-        for i, t in enumerate(self):
-            if t.task_id == task_id:
-                del self[i]
+        item = self._entries.pop(task_id, None)
+        if item:
+            item[1][-1] = None
+
+    def get(self, task_id):
+        item = self._entries.get(task_id)
+        return item[1][-1] if item else None
+
+    def reprioritize(self, task, priority):
+        task.priority = priority
+        self.append(task)
+
+    def head(self, key):
+        heap = self._heaps.get(key)
+        while heap and heap[0][-1] is None:
+            heapq.heappop(heap)
+        if not heap:
+            self._heaps.pop(key, None)
+            return None
+        return heap[0]
+
+    def pop(self, eligible=None):
+        best = None
+        for key in list(self._heaps):
+            entry = self.head(key)
+            if entry is None or (eligible and not eligible(key)):
+                continue
+            if best is None or entry[:2] < best[1][:2]:
+                best = (key, entry)
+        if not best:
+            return None
+        (key, entry) = best
+        heapq.heappop(self._heaps[key])
+        task = entry[-1]
+        del self._entries[task.task_id]
+        return task
+
+    def __contains__(self, task):
+        return task.task_id in self._entries
+
+    def __iter__(self):
+        return iter([
+            entry[-1] for (key, entry)
+            in sorted(self._entries.values(), key=lambda item: item[1][:2])
+        ])
+
+    def __len__(self):
+        return len(self._entries)
 
 BLANK_IMAGE_URI = """\
 data://image/png;base64,\
@@ -37,10 +143,136 @@ AAC0lEQVR42mNk+A8AAQUBAScY42YAAAAASUVORK5CYII=\
 
 FAILED_TO_OPEN_RE=re.compile("Failed to open (.*)\\.")
 
+class TaskStore(object):
+    """
+    Keeps a copy of the download queue in the database so that it can be
+    restored after a restart.  Changes are collected and written together in
+    one transaction after `FLUSH_DELAY` seconds, so the scheduler never waits
+    on the database.
+    """
+
+    FLUSH_DELAY = 1
+
+    def __init__(self):
+        self._pending = {}
+        self._flush_handle = None
+
+    def save(self, task, status=None):
+        if status:
+            task.status = status
+        self._pending[task.task_id] = (task, False)
+        self.schedule_flush()
+
+    def delete(self, task):
+        self._pending[task.task_id] = (task, True)
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        if not self._flush_handle:
+            self._flush_handle = state.event_loop.call_later(
+                self.FLUSH_DELAY, self.flush
+            )
+
+    def flush(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        (pending, self._pending) = (self._pending, {})
+        if not pending:
+            return
+        try:
+            with db_session:
+                for (task, deleted) in pending.values():
+                    try:
+                        self.write(task, deleted)
+                    except (TypeError, ValueError) as e:
+                        logger.warning(f"couldn't save task {task.title}: {e}")
+        except Exception:
+            logger.error(traceback.format_exc())
+
+    def write(self, task, deleted=False):
+
+        entity = (
+            model.DownloadMediaTask.get(media_task_id=task.media_task_id)
+            if task.media_task_id
+            else None
+        )
+        if deleted:
+            if entity:
+                entity.delete()
+            return
+
+        sources = [
+            model.MediaSource.get(media_source_id=s.media_source_id)
+            for s in task.sources
+            if getattr(s, "media_source_id", None)
+        ]
+        if len(sources) != len(task.sources) or not all(sources):
+            # sources that were never stored can't be restored
+            return
+
+        listing_id = getattr(task.listing, "media_listing_id", None)
+        values = dict(
+            title=task.title,
+            provider=task.provider,
+            provider_id=task.provider_id,
+            task_id=task.task_id,
+            args=list(task.args),
+            kwargs=dict(task.kwargs),
+            priority=task.priority,
+            status=task.status,
+            started=task.started,
+            dest=task.dest,
+            postprocessors=list(task.postprocessors),
+            stage_results=list(task.stage_results),
+            staging_dir=task.staging_dir,
+            sources=sources,
+            listing=(
+                model.MediaListing.get(media_listing_id=listing_id)
+                if listing_id
+                else None
+            )
+        )
+        # fail here rather than when the transaction is committed
+        json.dumps([values["args"], values["kwargs"]])
+
+        if entity:
+            entity.set(**values)
+        else:
+            entity = model.DownloadMediaTask(**values)
+            entity.flush()
+            task.media_task_id = entity.media_task_id
+
+    @db_session
+    def load(self):
+        tasks = []
+        for entity in model.DownloadMediaTask.select().order_by(
+                model.DownloadMediaTask.media_task_id
+        ):
+            task = entity.detach()
+            # the detached task shares its Json values with the entity, which
+            # can't be changed once the session is over
+            task.args = list(entity.args)
+            task.kwargs = dict(entity.kwargs)
+            task.postprocessors = list(entity.postprocessors)
+            task.stage_results = list(entity.stage_results)
+            task.sources = [
+                s.detach()
+                for s in entity.sources.order_by(model.MediaSource.rank)
+            ]
+            task.listing = entity.listing.detach() if entity.listing else None
+            task.reset()
+            task.result = state.event_loop.create_future()
+            tasks.append(task)
+        return tasks
+
+
 class TaskManager(Observable):
 
-    QUEUE_INTERVAL = 1
+    PROGRESS_INTERVAL = 1
     DEFAULT_MAX_CONCURRENT_TASKS = 20
+    DEFAULT_MAX_TASKS_PER_HOST = 4
+    DEFAULT_HISTORY = 100
 
     def __init__(self):
 
@@ -48,19 +280,54 @@ class TaskManager(Observable):
         self.preview_task = None
         self._preview_player = state.event_loop.create_future()
         self._preview_player_lock = asyncio.Lock()
+        self._preview_standby = None
+        self._preview_standby_program = None
+        self.playlist = playlist.PlaylistSync()
+        self.overlay = overlay.Overlay()
+        self.playlist_files = []
         self.to_play = TaskList()
-        self.to_download = TaskList()
+        self.to_download = TaskQueue(key=self.task_class)
         self.playing = TaskList()
         self.active = TaskList()
         self.postprocessing = TaskList()
-        self.done = TaskList()
+        self.failed = TaskList()
+        self.done = collections.deque(maxlen=self.history)
         self.current_task_id = 0
-        self.started = asyncio.Condition()
+        self.run_task = None
+        self.progress_task = None
+        self.running = set()
+        self._wakeup = asyncio.Event()
+        self.store = TaskStore()
+        self.postprocessor = postprocessing.PostprocessingExecutor()
+        self.auto_downloader = autodownload.AutoDownloader(self)
 
     @property
     def max_concurrent_tasks(self):
         return config.settings.tasks.max or self.DEFAULT_MAX_CONCURRENT_TASKS
 
+    @property
+    def max_tasks_per_host(self):
+        return config.settings.tasks.max_per_host or self.DEFAULT_MAX_TASKS_PER_HOST
+
+    def provider_config(self, provider):
+        return config.settings.tasks.providers[provider or ""]
+
+    @staticmethod
+    def task_host(task):
+        try:
+            url = getattr(task.sources[0], "url", None)
+        except (IndexError, TypeError):
+            return None
+        return urlparse(url).netloc if url else None
+
+    def task_class(self, task):
+        # config is keyed by the provider's identifier, not its display name
+        return (task.provider_id, self.task_host(task))
+
+    @property
+    def history(self):
+        return config.settings.tasks.history or self.DEFAULT_HISTORY
+
     @property
     def preview_player(self):
         return self._preview_player.result()
@@ -72,8 +339,10 @@ class TaskManager(Observable):
         #EXTINF:1,{title}
         {locator}
         """)
+        self.remove_playlist_files()
         with tempfile.NamedTemporaryFile(suffix=".m3u8", delete=False) as m3u:
-            m3u.write(f"#EXTM3U\n".encode("utf-8"))
+            self.playlist_files.append(m3u.name)
+            m3u.write("#EXTM3U\n".encode("utf-8"))
             for item in items:
                 m3u.write(ITEM_TEMPLATE.format(
                     title=(item.title or "(no title)").strip(),
@@ -99,6 +368,15 @@ class TaskManager(Observable):
             )
         return listing
 
+    def remove_playlist_files(self, keep=1):
+        # the player only needs the most recent playlist file
+        while len(self.playlist_files) > keep:
+            filename = self.playlist_files.pop(0)
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
     def empty_listing(self, title):
         return self.make_playlist(
             title,
@@ -112,6 +390,64 @@ class TaskManager(Observable):
         )
 
 
+    @property
+    def preview_standby_enabled(self):
+        return config.settings.profile.preview.standby is not False
+
+    def start_preview_standby(self):
+        if self._preview_standby or not self.preview_standby_enabled:
+            return
+        self._preview_standby = state.event_loop.create_task(
+            self.spawn_preview_standby()
+        )
+
+    async def spawn_preview_standby(self):
+        """
+        Start an idle preview player in the background, so the next preview,
+        or a restart after the preview player exits, doesn't have to wait for
+        one to start up.
+        """
+        try:
+            program = next(player.Player.get(config.settings.profile.preview.player))
+        except (SGException, StopIteration, TypeError) as e:
+            logger.warning(f"no preview player: {e}")
+            return None
+        if not program.supports_idle:
+            return None
+        task = model.PlayMediaTask.attr_class(title="preview", sources=[])
+        task.program.set_result(program)
+        self._preview_standby_program = program
+        try:
+            proc = await program.run_idle()
+        except SGException as e:
+            logger.warning(f"couldn't start preview player: {e}")
+            return None
+        task.proc.set_result(proc)
+        task.pid = proc.pid
+        task.started = datetime.now()
+        logger.debug(f"preview player standing by: {task.pid}")
+        return task
+
+    async def take_preview_standby(self):
+        if not self._preview_standby:
+            return None
+        (standby, self._preview_standby) = (self._preview_standby, None)
+        task = await standby
+        self._preview_standby_program = None
+        if not task or task.proc.result().returncode is not None:
+            return None
+        return task
+
+    def stop_preview_standby(self):
+        if not self._preview_standby:
+            return
+        (standby, self._preview_standby) = (self._preview_standby, None)
+        standby.cancel()
+        # the process may have started even if the task hasn't finished
+        proc = getattr(self._preview_standby_program, "proc", None)
+        if proc and proc.returncode is None:
+            proc.terminate()
+
     async def preview(self, listing, caller, **kwargs):
 
         if listing:
@@ -127,8 +463,12 @@ class TaskManager(Observable):
         task.args = (config.settings.profile.preview.player, None)
 
         async def start_player():
-            self.preview_task = task
-            await self.start_task(self.preview_task)
+            standby = await self.take_preview_standby()
+            if standby:
+                self.preview_task = standby
+            else:
+                self.preview_task = task
+                await self.start_task(self.preview_task)
             self._preview_player.set_result(await self.preview_task.program)
             await self.preview_task.proc
 
@@ -141,7 +481,8 @@ class TaskManager(Observable):
             async def wait_for_player_exit(proc):
                 await proc.wait()
                 logger.error("player exit, restarting")
-                await asyncio.sleep(1)
+                if not self._preview_standby:
+                    await asyncio.sleep(1)
                 self.preview_task = None
                 self._preview_player = asyncio.Future()
                 # FIXME
@@ -180,8 +521,15 @@ class TaskManager(Observable):
             self.preview_player.controller.listen_for(
                 "log-message", on_log_message
             )
+            self.preview_player.controller.listen_for(
+                "video-reconfig", self.overlay.on_video_reconfig
+            )
 
             self.preview_task.result.add_done_callback(on_player_done)
+            if standby:
+                await load_sources()
+            # get the next one ready in case this one exits
+            self.start_preview_standby()
 
         async def load_sources():
             await self.preview_task.load_sources(task.sources, **kwargs)
@@ -197,58 +545,150 @@ class TaskManager(Observable):
 
         self.current_task_id += 1
         task.task_id = self.current_task_id
-        # task.args = (player_spec, downloader_spec)
-        # task.kwargs = kwargs
-        # task.program = state.event_loop.create_future()
-        # task.proc = state.event_loop.create_future()
-        # task.result = state.event_loop.create_future()
         self.to_play.append(task)
+        self.wakeup()
         return task
 
-    def download(self, task, **kwargs):
+    def download(self, task, priority=None, **kwargs):
 
         logger.info(f"download task: {task}")
         logger.info(f"download listing: {task.listing}")
         self.current_task_id += 1
         task.task_id = self.current_task_id
-        # task.args = (downloader_spec, *task.args)
-        # task.kwargs = kwargs
-        # task.program = state.event_loop.create_future()
-        # task.proc = state.event_loop.create_future()
-        # task.result = state.event_loop.create_future()
+        if priority is not None:
+            task.priority = priority
+        elif not task.priority:
+            task.priority = self.provider_config(task.provider_id).priority or 0
         self.to_download.append(task)
+        self.store.save(task, "pending")
+        self.wakeup()
         return task
 
-    async def run(self):
-        while True:
-            self.worker_task = state.event_loop.create_task(self.worker())
-            self.poller_task = state.event_loop.create_task(self.poller())
-            for result in await asyncio.gather(
-                    self.worker_task, self.poller_task, return_exceptions=True
-            ):
-                if isinstance(result, Exception):
-                    logger.error("Exception: ", exc_info=result)
+    def wakeup(self):
+        self._wakeup.set()
+
+    def move(self, task, src, dst):
+        src.remove(task)
+        dst.append(task)
+        self.changed()
 
-            logger.trace("sleeping")
-            await asyncio.sleep(self.QUEUE_INTERVAL)
+    def changed(self):
+        if state.get("tasks_view"):
+            state.tasks_view.refresh()
 
+    def progress_changed(self):
+        if state.get("tasks_view"):
+            state.tasks_view.update_progress()
 
-    async def start(self):
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.schedule()
+            except Exception as e:
+                logger.error("Exception: ", exc_info=e)
+
+    def schedule(self):
+
+        while len(self.to_play):
+            task = self.to_play.pop()
+            self.playing.append(task)
+            self.launch(self.run_play_task(task))
+
+        providers = collections.Counter()
+        hosts = collections.Counter()
+        for task in self.active:
+            (provider, host) = self.task_class(task)
+            providers[provider] += 1
+            hosts[host] += 1
+
+        def eligible(task_class):
+            (provider, host) = task_class
+            limit = self.provider_config(provider).max
+            if limit and providers[provider] >= limit:
+                return False
+            if host and hosts[host] >= self.max_tasks_per_host:
+                return False
+            return True
+
+        while len(self.active) < self.max_concurrent_tasks and len(self.to_download):
+            task = self.to_download.pop(eligible)
+            if not task:
+                break
+            (provider, host) = self.task_class(task)
+            providers[provider] += 1
+            hosts[host] += 1
+            self.active.append(task)
+            self.launch(self.run_download_task(task))
+
+        self.changed()
+
+    def reprioritize(self, task_id, delta):
+        task = self.to_download.get(task_id)
+        if not task:
+            return
+        self.to_download.reprioritize(task, (task.priority or 0) + delta)
+        self.store.save(task)
+        self.changed()
+
+    def restore(self):
+        for task in self.store.load():
+            if task.dest and os.path.exists(task.dest):
+                # finished, but the store didn't get to delete it
+                logger.info(f"not restoring finished task: {task.title}")
+                self.current_task_id += 1
+                task.task_id = self.current_task_id
+                self.store.delete(task)
+                continue
+            logger.info(f"restoring {task.status} task: {task.title}")
+            if task.status in ["processing", "processing failed"]:
+                self.current_task_id += 1
+                task.task_id = self.current_task_id
+                self.postprocessing.append(task)
+                self.launch(self.resume_postprocessing(task))
+                continue
+            if task.status in ["downloading", "piping", "failed"] and len(task.stage_results):
+                # the last stage result is the interrupted or failed download
+                partial = task.stage_results.pop()
+                if task.status != "piping":
+                    task.resume = True
+                elif os.path.exists(partial):
+                    os.remove(partial)
+            self.download(task)
+
+    def launch(self, coro):
+        task = state.event_loop.create_task(coro)
+        self.running.add(task)
+
+        def on_done(f):
+            self.running.discard(f)
+            if not f.cancelled() and f.exception():
+                logger.error("Exception: ", exc_info=f.exception())
+        task.add_done_callback(on_done)
+
+    async def start(self, restore=False):
         logger.debug("task_manager starting")
+        if restore:
+            self.restore()
         self.run_task = state.event_loop.create_task(self.run())
-        self.started.notify_all()
+        self.auto_downloader.start()
+        self.wakeup()
 
     async def stop(self):
         logger.debug("task_manager stopping")
+        self.store.flush()
         self.run_task.cancel()
+        self.auto_downloader.stop()
+        for task in list(self.running):
+            task.cancel()
+        if self.progress_task:
+            self.progress_task.cancel()
+        self.stop_preview_standby()
+        self.remove_playlist_files(keep=0)
 
     async def join(self):
-        async with self.started:
-            await self.started.wait()
-            asyncio.run(
-                self.worker_task,
-                self.poller_task
-            )
+        await self.run_task
 
     async def start_task(self, task):
         logger.debug(f"task: {task}")
@@ -256,23 +696,26 @@ class TaskManager(Observable):
             run_task = player.Player.play(task, *task.args, **task.kwargs)
 
         elif isinstance(task, (model.DownloadMediaTask, model.DownloadMediaTask.attr_class)):
-            try:
-                outfile = task.stage_outfile
-                run_task = player.Downloader.download(task, outfile, *task.args, **task.kwargs)
-                task.stage_results.append(outfile)
-            except SGFileExists as e:
-                logger.warn(e)
-                return
+            run_task = self.start_download(task)
         else:
             logger.error(f"not implemented: {task}")
             raise NotImplementedError
 
         try:
             proc = await run_task
+        except SGFileExists as e:
+            logger.warn(e)
+            task.result.set_result(e)
+            return
         except Exception as e:
             task.result.set_result(e)
             logger.error(traceback.format_exc())
             return
+        if proc is None:
+            # the downloader couldn't find a stream
+            logger.warning(f"couldn't start {task.title}")
+            task.result.set_result(SGException(f"couldn't start {task.title}"))
+            return
         task.proc.set_result(proc)
         # logger.debug(f"proc: {task.proc}")
         task.pid = proc.pid
@@ -281,109 +724,157 @@ class TaskManager(Observable):
         task.started = datetime.now()
         task.elapsed = timedelta(0)
 
-    async def worker(self):
-
-        logger.trace("worker")
-        async def get_tasks():
-            while True:
-                if len(self.to_play):
-                    yield self.to_play.pop(0)
-                elif len(self.active) < self.max_concurrent_tasks and len(self.to_download):
-                    yield self.to_download.pop(0)
-                else:
-                    return
-        async for task in get_tasks():
-            await self.start_task(task)
-            if isinstance(task, model.PlayMediaTask.attr_class):
-                self.playing.append(task)
-            elif isinstance(task, model.DownloadMediaTask.attr_class):
-                self.active.append(task)
-            else:
-                logger.error(type(task))
-                raise NotImplementedError
-
-
-    async def poller(self):
-
-        (playing_done, playing) = utils.partition(
-            lambda t: t.proc.result().returncode is None,
-            self.playing)
-
-        playing_done = TaskList(playing_done)
+    async def start_download(self, task):
+        if task.dest and os.path.exists(task.dest):
+            raise SGFileExists(f"File {task.dest} already exists")
+        if self.postprocessor.can_pipe_download(task):
+            (proc, outfile) = await self.postprocessor.pipe_download(
+                task, *task.args, **task.kwargs
+            )
+        else:
+            outfile = task.stage_outfile
+            proc = await player.Downloader.download(
+                task, outfile, *task.args, resume=task.resume, **task.kwargs
+            )
+        task.stage_results.append(outfile)
+        return proc
 
-        for task in playing_done:
-            task.finalize()
+    async def run_play_task(self, task):
 
-        self.playing = TaskList(playing)
+        try:
+            await self.start_task(task)
+            if task.proc.done():
+                await task.proc.result().wait()
+                task.finalize()
+        finally:
+            self.finish(task, self.playing)
 
-        (complete, active) = utils.partition(
-            lambda t: t.proc.done() and t.proc.result().returncode is None,
-            self.active)
+    async def run_download_task(self, task):
 
-        (done, to_postprocess) = utils.partition(
-            lambda t: len(t.postprocessors) > 0,
-            complete)
+        src = self.active
+        try:
+            await self.start_task(task)
+            if not task.proc.done():
+                # failed to start; result has already been set
+                if isinstance(task.result.result(), SGFileExists):
+                    self.finish(task, src)
+                else:
+                    self.fail(task, src, task.result.result())
+                return
 
-        to_postprocess = list(to_postprocess)
-        for task in to_postprocess:
-            task.reset()
+            task.resume = False
+            # partially postprocessed output can't be resumed
+            self.store.save(task, "piping" if task.piped_stages else "downloading")
+            self.update_progress()
+            returncode = await task.proc.result().wait()
 
-        (postprocessing_done, postprocessing) = utils.partition(
-            lambda t: len(t.postprocessors) > 0,
-            itertools.chain(self.postprocessing, to_postprocess))
+            if returncode:
+                self.fail(task, src, f"exit status {returncode}")
+                return
 
-        postprocessing_list = TaskList(postprocessing)
+            if task.piped_stages:
+                # these postprocessors already ran on the download as it arrived
+                del task.postprocessors[:task.piped_stages]
+                task.piped_stages = 0
+
+            if len(task.postprocessors):
+                task.reset()
+                self.move(task, self.active, self.postprocessing)
+                self.store.save(task, "processing")
+                self.wakeup()
+                src = self.postprocessing
+                await self.postprocess(task)
+
+            self.complete(task, src)
+        except asyncio.CancelledError:
+            # shutting down, so leave the task in the store to be resumed
+            raise
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            if task in src:
+                self.fail(task, src, e)
+
+    def fail(self, task, src, error):
+        """
+        Stop a download that failed without moving it to its destination,
+        leaving it in the store to be retried next time.
+        """
+        logger.warning(f"download of {task.title} failed: {error}")
+        if task.piped_stages and len(task.stage_results):
+            # partially postprocessed output can't be resumed
+            partial = task.stage_results.pop()
+            if os.path.exists(partial):
+                os.remove(partial)
+        if not task.result.done():
+            task.result.set_result(error)
+        # a failed postprocessing stage is retried from its input, not by
+        # downloading again
+        self.store.save(
+            task,
+            "processing failed" if src is self.postprocessing else "failed"
+        )
+        if task.started:
+            task.elapsed = datetime.now() - task.started
+        src.remove(task)
+        self.failed.append(task)
+        self.changed()
+        self.wakeup()
 
-        active_list = TaskList(active)
-        done_list = TaskList(itertools.chain(done, postprocessing_done))
+    async def resume_postprocessing(self, task):
+        self.update_progress()
+        try:
+            await self.postprocess(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            self.fail(task, self.postprocessing, e)
+            return
+        self.complete(task, self.postprocessing)
 
-        for task in done_list:
-            logger.debug(f"finalizing {task} {type(task)} {task.__class__.mro()}")
+    def complete(self, task, src):
+        logger.debug(f"finalizing {task} {type(task)} {task.__class__.mro()}")
+        try:
             task.finalize()
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            self.fail(task, src, e)
+            return
+        self.finish(task, src)
 
-        self.active = active_list
-        self.postprocessing = postprocessing_list
-        self.done += done_list
-
-        for task in self.playing + self.active:
-            prog = await task.program
-            task.elapsed = datetime.now() - task.started
-            if hasattr(prog, "update_progress"):
-                await prog.update_progress()
-            if hasattr(prog.source, "update_progress"):
-                await prog.source.update_progress()
+    async def postprocess(self, task):
+        await self.postprocessor.run(task, on_stage=self.store.save)
 
-        for task in self.postprocessing:
+    def finish(self, task, src):
+        if task.started:
             task.elapsed = datetime.now() - task.started
-            if task.program.done():
-                program = task.program.result()
-                proc = task.proc.result()
-                if proc.returncode is not None:
-                    logger.debug("postprocessor done: {task.stage_outfile}")
-                    if not os.path.isfile(task.stage_outfile):
-                        logger.warn(f"processing stage {task.stage} failed")
-                        task.postprocessors = []
-                    task.stage_results.append(task.stage_outfile)
-                    task.postprocessors.pop(0)
-                    if len(task.postprocessors):
-                        task.reset()
-                else:
-                    logger.debug(f"postprocessor still running: {task.program}")
-            elif len(task.postprocessors) > 0:
-                pp = task.postprocessors[0]
-
-                logger.info(task.listing)
-                proc = await player.Postprocessor.process(
-                    task, pp,
-                    task.stage_infile,
-                    task.stage_outfile,
-                )
+        src.remove(task)
+        if isinstance(task, model.DownloadMediaTask.attr_class):
+            self.store.delete(task)
+        self.done.append(task)
+        self.changed()
+        self.wakeup()
+
+    def update_progress(self):
+        if not self.progress_task:
+            self.progress_task = state.event_loop.create_task(
+                self.progress_loop()
+            )
 
-                task.proc.set_result(proc)
-                task.pid = proc.pid
+    async def progress_loop(self):
+        # only runs while there are downloads or postprocessors whose
+        # progress needs to be displayed
+        try:
+            while len(self.active) or len(self.postprocessing):
+                now = datetime.now()
+                for task in itertools.chain(self.active, self.postprocessing):
+                    if task.started:
+                        task.elapsed = now - task.started
+                self.progress_changed()
+                await asyncio.sleep(self.PROGRESS_INTERVAL)
+        finally:
+            self.progress_task = None
 
-        if state.get("tasks_view"):
-            state.tasks_view.refresh()
 
 def main():
 
@@ -0,0 +1,228 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import asyncio
+import hashlib
+import collections
+
+from pony.orm import db_session, select, commit
+
+from .state import *
+from . import config
+from . import model
+
+SEPARATOR = "\N{VERTICAL LINE}"
+
+
+def digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class TranslationBackend(object):
+
+    async def translate(self, texts, src, dest):
+        """
+        Return the translations of `texts` from `src` to `dest`, in order.
+        """
+        raise NotImplementedError
+
+
+class GoogleTranslationBackend(TranslationBackend):
+
+    def __init__(self):
+        self._translator = None
+
+    @property
+    def translator(self):
+        if not self._translator:
+            from pygoogletranslation import Translator
+            self._translator = Translator(sleep=1)
+        return self._translator
+
+    def translate_sync(self, texts, src, dest):
+        # bulk translation doesn't work, so we send the texts as one string
+        # with a separator that survives translation
+        translated = self.translator.translate(
+            SEPARATOR.join(t.replace(SEPARATOR, "|") for t in texts),
+            src=src,
+            dest=dest
+        ).text.split(SEPARATOR)
+        if len(translated) != len(texts):
+            raise ValueError(
+                f"expected {len(texts)} translations, got {len(translated)}"
+            )
+        return [t.strip() for t in translated]
+
+    async def translate(self, texts, src, dest):
+        return await state.event_loop.run_in_executor(
+            None, self.translate_sync, texts, src, dest
+        )
+
+
+BACKENDS = {
+    "google": GoogleTranslationBackend
+}
+
+
+class Translator(object):
+    """
+    Translates text through a pluggable backend, caching translations in the
+    database keyed by the text's hash and the source and destination
+    languages, so a text is only ever sent to the backend once.
+
+    Uncached texts are queued, and a background worker sends them to the
+    backend in chunks of up to `MAX_CHUNK_ITEMS` texts and `MAX_CHUNK_CHARS`
+    characters.  Concurrent requests for the same text share one
+    translation.
+    """
+
+    MAX_CHUNK_ITEMS = 50
+    MAX_CHUNK_CHARS = 4000
+    BATCH_DELAY = 0.1
+    LOOKUP_CHUNK_SIZE = 500
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self.cache = {}
+        self.pending = {}
+        self.queue = collections.deque()
+        self.wakeup = asyncio.Event()
+        self.worker = None
+
+    @property
+    def backend(self):
+        if not self._backend:
+            name = config.settings.profile.translation.backend or "google"
+            self._backend = BACKENDS[name]()
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
+    def cached(self, texts, src, dest):
+        """
+        Return a dict of the translations of `texts` that are already cached.
+        """
+        keys = {digest(t): t for t in texts}
+        found = {
+            keys[d]: self.cache[(d, src, dest)]
+            for d in keys if (d, src, dest) in self.cache
+        }
+        missing = [d for d in keys if keys[d] not in found]
+        with db_session:
+            for i in range(0, len(missing), self.LOOKUP_CHUNK_SIZE):
+                chunk = missing[i:i+self.LOOKUP_CHUNK_SIZE]
+                for e in select(
+                        e for e in model.TranslationEntry
+                        if e.digest in chunk and e.src == src and e.dest == dest
+                ):
+                    self.cache[(e.digest, src, dest)] = e.text
+                    found[keys[e.digest]] = e.text
+        return found
+
+    def store(self, translations, src, dest):
+        with db_session:
+            for text, translated in translations:
+                d = digest(text)
+                self.cache[(d, src, dest)] = translated
+                if not model.TranslationEntry.get(digest=d, src=src, dest=dest):
+                    model.TranslationEntry(
+                        digest=d, src=src, dest=dest, text=translated
+                    )
+            commit()
+
+    async def translate(self, texts, src="auto", dest="en"):
+        """
+        Return the translations of `texts`, in order.  Texts that can't be
+        translated are returned as None.
+        """
+        found = self.cached(texts, src, dest)
+        futures = {}
+        for text in texts:
+            if text in found or text in futures:
+                continue
+            key = (digest(text), src, dest)
+            if key not in self.pending:
+                self.pending[key] = state.event_loop.create_future()
+                self.queue.append((text, src, dest))
+            futures[text] = self.pending[key]
+
+        if futures:
+            self.start()
+            self.wakeup.set()
+            for text, future in futures.items():
+                try:
+                    found[text] = await asyncio.shield(future)
+                except Exception as e:
+                    logger.warning(f"couldn't translate {text}: {e}")
+        return [found.get(text) for text in texts]
+
+    def start(self):
+        if not self.worker or self.worker.done():
+            self.worker = state.event_loop.create_task(self.run())
+
+    def stop(self):
+        if self.worker:
+            self.worker.cancel()
+
+    def chunks(self):
+        """
+        Take the queued texts as chunks that share a source and destination
+        language and fit within the chunk limits.
+        """
+        groups = collections.defaultdict(list)
+        while self.queue:
+            text, src, dest = self.queue.popleft()
+            groups[(src, dest)].append(text)
+
+        for (src, dest), texts in groups.items():
+            chunk = []
+            size = 0
+            for text in texts:
+                if chunk and (
+                        len(chunk) >= self.MAX_CHUNK_ITEMS
+                        or size + len(text) > self.MAX_CHUNK_CHARS
+                ):
+                    yield (chunk, src, dest)
+                    chunk = []
+                    size = 0
+                chunk.append(text)
+                size += len(text) + 1
+            if chunk:
+                yield (chunk, src, dest)
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            await asyncio.sleep(self.BATCH_DELAY)
+            for chunk, src, dest in list(self.chunks()):
+                try:
+                    translated = await self.backend.translate(chunk, src, dest)
+                    # without one translation per text we can't tell which
+                    # is which, so none of them can be trusted
+                    if len(translated) != len(chunk):
+                        raise ValueError(
+                            f"expected {len(chunk)} translations, got {len(translated)}"
+                        )
+                    self.store(zip(chunk, translated), src, dest)
+                    result = dict(zip(chunk, translated))
+                    error = None
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"translation failed: {e}")
+                    result = {}
+                    error = e
+                for text in chunk:
+                    future = self.pending.pop((digest(text), src, dest), None)
+                    if not future or future.done():
+                        continue
+                    if text in result:
+                        future.set_result(result[text])
+                    else:
+                        future.set_exception(error or KeyError(text))
+
+
+translator = Translator()
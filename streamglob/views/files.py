@@ -13,6 +13,7 @@ from watchdog.events import FileSystemEventHandler
 from .. import model
 from ..utils import strip_emoji
 from .. import config
+from ..debounce import debouncer
 from ..widgets import *
 from ..providers.widgets import *
 from .. import providers
@@ -111,7 +112,7 @@ class FilesView(SynchronizedPlayerMixin, PlayListingMixin, StreamglobView):
     def on_focus(self, source, selection):
 
         if isinstance(selection, FileNode):
-            state.event_loop.create_task(self.preview_all())
+            debouncer.schedule((self, "preview"), self.preview_all)
 
     def monitor_path(self, path):
         # FIXME: broken -- spurious updates when files haven't changed
@@ -16,23 +16,23 @@ class ProviderToolbar(urwid.WidgetWrap):
     signals = ["provider_change", "profile_change", "view_change"] # "preview_change"
     def __init__(self, default_provider):
 
-        def format_provider(n, p):
-            return p.NAME if p.config_is_valid else f"* {p.NAME}"
-
-        def providers_sort_key(p):
-            k, v = p
-            # providers = list(config.settings.profile.providers.keys())
-            # if k in providers:
-            # raise Exception(v)
-            if v.config_is_valid:
-                return (0, str(v.NAME))
-            else:
-                return (1, str(v.NAME))
+        def is_valid(n):
+            # providers aren't loaded until they're used, so we only know
+            # whether their configuration is valid once they have been
+            return (not providers.PROVIDERS.is_loaded(n)
+                    or providers.PROVIDERS[n].config_is_valid)
+
+        def format_provider(n):
+            title = providers.PROVIDERS.title(n)
+            return title if is_valid(n) else f"* {title}"
+
+        def providers_sort_key(n):
+            return (0 if is_valid(n) else 1, str(providers.PROVIDERS.title(n)))
 
         self.provider_dropdown = BaseDropdown(AttrDict(
-            [(format_provider(n, p), n)
-              for n, p in sorted(
-                      providers.PROVIDERS.items(),
+            [(format_provider(n), n)
+              for n in sorted(
+                      providers.PROVIDERS.keys(),
                       key = providers_sort_key
               )]
         ) , label="Provider", default=default_provider, margin=1)
@@ -1,3 +1,5 @@
+import weakref
+
 import urwid
 from panwid.datatable import *
 from panwid.progressbar import *
@@ -9,9 +11,24 @@ from ..widgets import *
 
 class TaskWidget(urwid.WidgetWrap):
 
+    # progress is redrawn by invalidating live widgets, which urwid only
+    # renders if they're on screen
+    instances = weakref.WeakSet()
+
     def __init__(self, task):
 
         self.task = task
+        self.status_text = urwid.Text("", align="right")
+        self.progress_bar = ProgressBar(
+            width=20,
+            maximum=0,
+            value=0,
+            progress_color="light blue",
+            remaining_color="dark blue"
+        )
+        self.progress_state = None
+        self.update_progress()
+        self.instances.add(self)
         self.pile = urwid.Pile([
             ("pack", line)
             for line in self.display_lines
@@ -35,7 +52,7 @@ class TaskWidget(urwid.WidgetWrap):
             ("pack", self.provider),
             ("weight", 1, urwid.Padding(self.title)),
             (18, urwid.Padding(
-                urwid.Text(self.status, align="right"),
+                self.status_text,
                 right=1)),
             ("pack", self.progress_bar),
             # ("pack", self.elapsed)
@@ -54,15 +71,22 @@ class TaskWidget(urwid.WidgetWrap):
             ("weight", 1, self.pad_text(self.task.dest))
         ])
 
-    @property
-    def progress_bar(self):
-        return ProgressBar(
-                width=20,
-                maximum=self.size_total,
-                value=self.size_downloaded,
-                progress_color="light blue",
-                remaining_color="dark blue"
-            )
+    def update_progress(self):
+        progress = self.progress
+        progress_state = (
+            self.task.status,
+            progress.dled, progress.total, progress.pct, progress.status
+        ) if progress else (self.task.status,)
+        if progress_state == self.progress_state:
+            return
+        self.progress_state = progress_state
+        self.status_text.set_text(self.status)
+        self.progress_bar.maximum = self.size_total
+        self.progress_bar.set_value(self.size_downloaded)
+
+    def render(self, size, focus=False):
+        self.update_progress()
+        return super().render(size, focus)
 
     @property
     def provider(self):
@@ -76,6 +100,8 @@ class TaskWidget(urwid.WidgetWrap):
     def status(self):
         if self.task.status == "downloading":
             return self.progress.status or self.task.status
+        elif self.task.status == "pending" and self.task.priority:
+            return f"{self.task.status} ({self.task.priority:+d})"
         else:
             return self.task.status
 
@@ -147,9 +173,10 @@ def format_task(task):
 @keymapped()
 class TaskTable(BaseDataTable):
 
-    # KEYMAP = {
-    #     "ctrl r": "reset"
-    # }
+    KEYMAP = {
+        "+": ("change_priority", [1]),
+        "-": ("change_priority", [-1]),
+    }
 
     index = "task_id"
 
@@ -164,6 +191,7 @@ class TaskTable(BaseDataTable):
         to_download="pending",
         active="downloading",
         postprocessing="processing",
+        failed="failed",
         done="done"
     )
 
@@ -177,6 +205,11 @@ class TaskTable(BaseDataTable):
     def toggle_details(self):
         self.selection.toggle_details()
 
+    def change_priority(self, delta):
+        if not self.selection:
+            return
+        state.task_manager.reprioritize(self.selection.data.task_id, delta)
+
     def get_tasks(self):
 
         for task_list, status in self.STATUS_MAP.items():
@@ -205,7 +238,24 @@ class TasksView(StreamglobView):
         self.pile = urwid.Pile([
             ("weight", 1, self.table)
         ])
+        self.rendered = False
         super().__init__(self.pile)
 
     def refresh(self):
         self.table.refresh()
+
+    def render(self, size, focus=False):
+        self.rendered = True
+        return super().render(size, focus)
+
+    def update_progress(self):
+        for widget in list(TaskWidget.instances):
+            widget._invalidate()
+        # invalidating the task widgets makes the next draw render the view if
+        # it's on screen, so if it wasn't rendered since the last update it's
+        # hidden and there's nothing to redraw
+        if not self.rendered:
+            return
+        self.rendered = False
+        if state.get("loop"):
+            state.loop.draw_screen()
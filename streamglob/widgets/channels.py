@@ -8,6 +8,7 @@ from functools import partial
 
 import urwid
 import yaml
+from orderedattrdict import AttrDict
 from pony.orm import *
 from panwid.autocomplete import AutoCompleteMixin
 from panwid.highlightable import HighlightableTextMixin
@@ -149,11 +150,11 @@ class ListingCountMixin(object):
 
     @property
     def listing_count(self):
-        return self.channel.listing_count if self.channel else None
+        return self.state.listing_count if self.state else None
 
     @property
     def unread_count(self):
-        return self.channel.unread_count if self.channel else None
+        return self.state.unread_count if self.state else None
 
     @property
     def count_attr(self):
@@ -204,22 +205,20 @@ class ChannelWidget(ListingCountMixin,
                     MarkableMixin,
                     ChannelTreeWidget):
 
-    @property
-    def channel(self):
-        with db_session:
-            return model.MediaChannel.get(
-                provider_id=self.provider.IDENTIFIER,
-                locator=self.get_node().locator
-            )
-
     @property
     def provider(self):
         return self.get_node().get_parent().tree.provider
 
+    @property
+    def state(self):
+        return self.get_node().get_parent().tree.states.get(self.get_node().locator)
+
     @property
     def attr(self):
-        tail = self.channel.attrs.get("tail_fetched") if self.channel else None
-        if self.unread_count and tail:
+        tail = self.state.attrs.get("tail_fetched") if self.state else None
+        if self.state and self.state.error:
+            return "browser error"
+        elif self.unread_count and tail:
             return "browser head_tail"
         elif self.unread_count:
             return "browser head"
@@ -308,6 +307,7 @@ class ChannelGroupWidget(AggregateListingCountMixin, MarkableMixin, ChannelTreeW
 class ChannelPropertiesMixin(object):
 
     async def refresh(self):
+        self.get_parent().tree.states.invalidate()
         node = self
         while node:
             widget = node.get_widget(reload=True)
@@ -538,6 +538,48 @@ class MyTreeListBox(urwid.TreeListBox):
             )
         return self._rows_max
 
+class ChannelStates(object):
+    """
+    A snapshot of the listing counts, attributes and update errors of a
+    provider's channels, loaded with one query for all of them.  The channel
+    tree reads from this when rendering instead of querying each channel, and
+    invalidates it when channels are updated.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.states = None
+
+    @db_session
+    def load(self):
+        feed_class = self.provider.FEED_CLASS
+        listing_class = self.provider.LISTING_CLASS
+        provider_id = self.provider.IDENTIFIER
+        self.states = {
+            locator: AttrDict(
+                attrs=attrs or {},
+                error=(attrs or {}).get("error"),
+                listing_count=listing_count,
+                unread_count=unread_count
+            )
+            for (locator, attrs, listing_count, unread_count) in select(
+                (c.locator, c.attrs,
+                 count(l for l in listing_class if l.channel == c),
+                 count(l for l in listing_class if l.channel == c and l.read is None))
+                for c in feed_class if c.provider_id == provider_id
+            )
+        }
+        logger.debug(f"loaded state for {len(self.states)} channels")
+
+    def get(self, locator):
+        if self.states is None:
+            self.load()
+        return self.states.get(locator)
+
+    def invalidate(self):
+        self.states = None
+
+
 @keymapped()
 class ChannelTreeBrowser(AutoCompleteMixin, urwid.WidgetWrap):
 
@@ -554,6 +596,8 @@ class ChannelTreeBrowser(AutoCompleteMixin, urwid.WidgetWrap):
 
     def __init__(self, data, provider, label="channels"):
         self.provider = provider
+        self.states = ChannelStates(provider)
+        self._nodes = None
         self.tree = ChannelGroupNode(self, data, key=label)
         self.listbox = MyTreeListBox(MyTreeWalker(self.tree))
         self.scrollbar = StreamglobScrollBar(self.listbox)
@@ -641,8 +685,28 @@ class ChannelTreeBrowser(AutoCompleteMixin, urwid.WidgetWrap):
                 self.listbox.focus_position = node
         self.update_selection()
 
+    @property
+    def nodes(self):
+        if self._nodes is None:
+            self._nodes = {}
+            for node in self.tree.get_nodes():
+                self._nodes.setdefault(node.identifier, node)
+        return self._nodes
+
     def find_node(self, identifier):
-        return self.tree.find_node(identifier)
+        return self.nodes.get(identifier)
+
+    def refresh(self):
+        self.states.invalidate()
+        self.listbox._invalidate()
+
+    def reload(self):
+        """
+        Rebuild the node index and channel states after channels have been
+        added or removed.
+        """
+        self._nodes = None
+        self.refresh()
 
     def update_selection(self):
         self._emit("change", self.selected_items)
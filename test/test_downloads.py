@@ -0,0 +1,82 @@
+import unittest
+import os
+import tempfile
+
+try:
+    from streamglob import downloads
+except ImportError:
+    downloads = None
+
+
+@unittest.skipIf(downloads is None, "dependencies aren't installed")
+class TestURITokens(unittest.TestCase):
+
+    def test_tokens(self):
+        self.assertEqual(
+            list(downloads.uri_tokens("show.uri=abc=.mp4")), ["abc"]
+        )
+        # every "=" after the prefix could end the token
+        self.assertEqual(
+            list(downloads.uri_tokens("uri=a=b=.x=y.mp4")),
+            ["a", "a=b", "a=b=.x"]
+        )
+        self.assertEqual(list(downloads.uri_tokens("no token.mp4")), [])
+
+    def test_token_escapes_slashes(self):
+        self.assertEqual(downloads.uri_token("yt/abc/def"), "yt+abc+def")
+
+
+@unittest.skipIf(downloads is None, "dependencies aren't installed")
+class TestDownloadIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        os.mkdir(os.path.join(self.root, "sub"))
+        self.path = os.path.join(self.root, "sub", "video.uri=yt+abc=.mp4")
+        open(self.path, "w").close()
+        self.index = downloads.DownloadIndex()
+
+    def tearDown(self):
+        if self.index._observer:
+            self.index._observer.stop()
+        if self.index._executor:
+            self.index._executor.shutdown()
+        self.tempdir.cleanup()
+
+    def wait(self):
+        self.index.executor.submit(lambda: None).result()
+
+    def test_lookup_waits_for_scan(self):
+        # the first lookup only starts the scan
+        self.assertIsNone(self.index.lookup(self.root, "yt/abc"))
+        self.wait()
+        self.assertTrue(self.index.is_ready(os.path.join(self.root, "sub")))
+        self.assertEqual(self.index.lookup(self.root, "yt/abc"), self.path)
+        self.assertIsNone(self.index.lookup(self.root, "yt/other"))
+
+    def test_start(self):
+        self.index.start([self.root])
+        self.wait()
+        self.assertEqual(self.index.lookup(self.root, "yt/abc"), self.path)
+
+    def test_add_and_remove(self):
+        self.index.start([self.root])
+        self.wait()
+        other = os.path.join(self.root, "other.uri=yt+def=.mp4")
+        open(other, "w").close()
+        self.index.add(other)
+        self.assertEqual(self.index.lookup(self.root, "yt/def"), other)
+        self.index.remove(os.path.join(self.root, "sub"))
+        self.assertIsNone(self.index._paths.get("yt+abc"))
+
+    def test_missing_file_is_dropped(self):
+        self.index.start([self.root])
+        self.wait()
+        os.remove(self.path)
+        self.assertIsNone(self.index.lookup(self.root, "yt/abc"))
+        self.assertNotIn(self.path, self.index._tokens)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,243 @@
+import unittest
+import asyncio
+import os
+import tempfile
+from datetime import timedelta
+
+try:
+    from streamglob import hls
+except ImportError:
+    hls = None
+
+try:
+    from aiohttp import web
+    from streamglob import player
+except ImportError:
+    player = None
+
+
+MASTER = """\
+#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360
+low/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=3000000,RESOLUTION=1280x720,FRAME-RATE=30.000
+720/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720
+720b/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=6000000,RESOLUTION=1280x720,FRAME-RATE=59.940
+720p60/index.m3u8
+"""
+
+MEDIA = """\
+#EXTM3U
+#EXT-X-TARGETDURATION:10
+#EXT-X-MEDIA-SEQUENCE:100
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:10.0,
+seg100.ts
+#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x000102030405060708090a0b0c0d0e0f
+#EXTINF:9.5,
+seg101.ts
+#EXT-X-KEY:METHOD=NONE
+#EXTINF:4.5,
+https://cdn.example.com/seg102.ts
+#EXT-X-ENDLIST
+"""
+
+
+@unittest.skipIf(hls is None, "dependencies aren't installed")
+class TestPlaylistParsing(unittest.TestCase):
+
+    BASE = "https://example.com/stream/master.m3u8"
+
+    def test_master_variants(self):
+        self.assertTrue(hls.is_master(MASTER))
+        variants = hls.parse_master(MASTER, self.BASE)
+        self.assertEqual(
+            [(v.uri, v.bandwidth, v.height, v.name) for v in variants],
+            [
+                ("https://example.com/stream/low/index.m3u8", 800000, 360, "360p"),
+                ("https://example.com/stream/720/index.m3u8", 3000000, 720, "720p"),
+                ("https://example.com/stream/720b/index.m3u8", 2500000, 720, "720p_alt"),
+                ("https://example.com/stream/720p60/index.m3u8", 6000000, 720, "720p60"),
+            ]
+        )
+
+    def test_select_variant(self):
+        variants = hls.parse_master(MASTER, self.BASE)
+        self.assertEqual(hls.select_variant(variants).name, "720p60")
+        self.assertEqual(hls.select_variant(variants, "worst").name, "360p")
+        self.assertEqual(hls.select_variant(variants, "720p_alt").bandwidth, 2500000)
+        self.assertEqual(hls.select_variant(variants, "1080p").name, "720p60")
+
+    def test_media_playlist(self):
+        self.assertFalse(hls.is_master(MEDIA))
+        playlist = hls.parse_media(MEDIA, self.BASE)
+        self.assertTrue(playlist.ended)
+        self.assertEqual(playlist.target_duration, 10)
+        self.assertEqual(playlist.init_uri, "https://example.com/stream/init.mp4")
+        self.assertEqual(
+            [(s.uri, s.duration, s.sequence) for s in playlist.segments],
+            [
+                ("https://example.com/stream/seg100.ts", 10.0, 100),
+                ("https://example.com/stream/seg101.ts", 9.5, 101),
+                ("https://cdn.example.com/seg102.ts", 4.5, 102),
+            ]
+        )
+        (first, second, third) = playlist.segments
+        self.assertIsNone(first.key)
+        self.assertEqual(second.key.method, "AES-128")
+        self.assertEqual(second.key.uri, "https://example.com/stream/key.bin")
+        self.assertEqual(second.key.iv, bytes(range(16)))
+        self.assertIsNone(third.key)
+
+    def test_start_index(self):
+        playlist = hls.parse_media(MEDIA, self.BASE)
+
+        def start(offset):
+            return hls.HLSFetcher(None, None, None, offset=offset).start_index(playlist)
+
+        self.assertEqual(start(None), 0)
+        self.assertEqual(start(timedelta(seconds=12)), 1)
+        self.assertEqual(start(timedelta(seconds=60)), 3)
+        # from the live edge
+        self.assertEqual(start(timedelta(seconds=-3)), 2)
+        self.assertEqual(start(timedelta(seconds=-5)), 1)
+        self.assertEqual(start(timedelta(seconds=-20)), 0)
+
+        playlist.ended = False
+        self.assertEqual(start(None), 0)
+
+
+class StubResponse(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    async def read(self):
+        return self.data
+
+
+class SlowSession(object):
+    """
+    Serves a three-segment playlist whose later segments take a while, and
+    counts segment fetches that are started and finished.
+    """
+
+    PLAYLIST = "#EXTINF:1,\n0.ts\n#EXTINF:1,\n1.ts\n#EXTINF:1,\n2.ts\n#EXT-X-ENDLIST\n"
+
+    def __init__(self):
+        self.started = 0
+        self.finished = 0
+
+    def get(self, url):
+        if url.endswith(".m3u8"):
+            return StubResponse(self.PLAYLIST.encode("utf-8"))
+        return self.segment(url)
+
+    def segment(self, url):
+        session = self
+
+        class SlowResponse(StubResponse):
+
+            async def read(self):
+                session.started += 1
+                try:
+                    if not url.endswith("0.ts"):
+                        await asyncio.sleep(10)
+                    return b"data"
+                finally:
+                    session.finished += 1
+
+        return SlowResponse(None)
+
+
+@unittest.skipIf(hls is None, "dependencies aren't installed")
+class TestHLSFetcher(unittest.TestCase):
+
+    def test_failed_write_waits_for_fetches(self):
+        session = SlowSession()
+
+        async def write(data):
+            raise BrokenPipeError
+
+        async def run():
+            fetcher = hls.HLSFetcher(session, "https://example.com/x.m3u8", write)
+            with self.assertRaises(BrokenPipeError):
+                await fetcher.run()
+            return (session.started, session.finished)
+
+        (started, finished) = asyncio.run(run())
+        self.assertEqual(started, 3)
+        self.assertEqual(finished, 3)
+
+
+@unittest.skipIf(player is None, "dependencies aren't installed")
+class TestHLSDownloader(unittest.TestCase):
+
+    HEADERS = {"Authorization": "Bearer token"}
+    COOKIES = {"session": "abc"}
+
+    async def handle(self, request):
+        self.requests.append(request.path)
+        if (request.headers.get("Authorization") != "Bearer token"
+            or request.cookies.get("session") != "abc"):
+            raise web.HTTPForbidden()
+        name = request.match_info["name"]
+        if name == "index.m3u8":
+            return web.Response(
+                text="#EXTINF:1,\n0.ts\n#EXTINF:1,\n1.ts\n#EXT-X-ENDLIST\n"
+            )
+        return web.Response(body=name.encode("utf-8"))
+
+    def download(self, **kwargs):
+        self.requests = []
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/{name}", self.handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                downloader = player.HLSDownloader("hls")
+                downloader.source = [f"http://127.0.0.1:{port}/index.m3u8"]
+                downloader.process_args(None, self.outfile)
+                proc = await downloader.run(**kwargs)
+                return await proc.wait()
+            finally:
+                await runner.cleanup()
+
+        return asyncio.run(run())
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.outfile = os.path.join(self.tempdir.name, "out.ts")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_auth_reaches_segment_requests(self):
+        returncode = self.download(headers=self.HEADERS, cookies=self.COOKIES)
+        self.assertEqual(returncode, 0)
+        self.assertEqual(self.requests, ["/index.m3u8", "/0.ts", "/1.ts"])
+        with open(self.outfile, "rb") as f:
+            self.assertEqual(f.read(), b"0.ts1.ts")
+
+    def test_missing_auth_fails(self):
+        self.assertNotEqual(self.download(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import asyncio
+import os
+import tempfile
+from unittest import mock
+
+try:
+    from streamglob import config
+    from streamglob import linkcheck
+except ImportError:
+    linkcheck = None
+
+
+CONFIG = """\
+profiles:
+    default:
+        linkcheck:
+            ttl: 100
+            error_ttl: 10
+"""
+
+
+def setUpModule():
+    if linkcheck is None:
+        return
+    with tempfile.TemporaryDirectory() as tempdir:
+        config_file = os.path.join(tempdir, "config.yaml")
+        with open(config_file, "w") as f:
+            f.write(CONFIG)
+        config.load(config_file)
+
+
+class StubSource(object):
+
+    def __init__(self, url, alive=True):
+        self.url = url
+        self.alive = alive
+        self.checks = 0
+
+    async def check(self):
+        self.checks += 1
+        await asyncio.sleep(0)
+        if isinstance(self.alive, Exception):
+            raise self.alive
+        return self.alive
+
+
+@unittest.skipIf(linkcheck is None, "dependencies aren't installed")
+class TestLinkChecker(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(
+            linkcheck.time, "monotonic", lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check(self, checker, *sources, force=False):
+
+        async def run():
+            return await checker.check_many(sources, force=force)
+
+        return asyncio.run(run())
+
+    def test_results_cached_for_ttl(self):
+        checker = linkcheck.LinkChecker()
+        source = StubSource("https://example.com/a", alive=False)
+        self.assertEqual(self.check(checker, source), [False])
+        self.assertTrue(checker.is_dead(source))
+
+        self.now += 99
+        self.assertEqual(self.check(checker, source), [False])
+        self.assertEqual(source.checks, 1)
+
+        self.now += 2
+        self.assertIsNone(checker.status(source))
+        self.check(checker, source)
+        self.assertEqual(source.checks, 2)
+
+    def test_errors_cached_for_error_ttl(self):
+        checker = linkcheck.LinkChecker()
+        source = StubSource("https://example.com/b", alive=OSError("timeout"))
+        self.assertEqual(self.check(checker, source), [None])
+        self.assertFalse(checker.is_dead(source))
+
+        self.now += 5
+        self.check(checker, source)
+        self.assertEqual(source.checks, 1)
+
+        self.now += 6
+        self.check(checker, source)
+        self.assertEqual(source.checks, 2)
+
+    def test_force_and_invalidate(self):
+        checker = linkcheck.LinkChecker()
+        source = StubSource("https://example.com/c")
+        self.check(checker, source)
+        self.check(checker, source, force=True)
+        self.assertEqual(source.checks, 2)
+        checker.invalidate([source])
+        self.assertIsNone(checker.status(source))
+
+    def test_concurrent_checks_shared(self):
+        checker = linkcheck.LinkChecker()
+        source = StubSource("https://example.com/d")
+        self.assertEqual(self.check(checker, source, source, source), [True] * 3)
+        self.assertEqual(source.checks, 1)
+
+    def test_purge(self):
+        checker = linkcheck.LinkChecker()
+        self.check(
+            checker,
+            StubSource("https://example.com/e"),
+            StubSource("https://example.com/f", alive=OSError("refused"))
+        )
+        self.now += 50
+        checker.purge()
+        self.assertEqual(list(checker._results), ["https://example.com/e"])
+
+    def test_sources_without_url(self):
+        checker = linkcheck.LinkChecker()
+        self.assertEqual(self.check(checker, StubSource(None)), [True])
+        self.assertIsNone(checker.status(StubSource(None)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+
+from orderedattrdict import AttrDict
+
+try:
+    from streamglob import model
+except ImportError:
+    model = None
+
+
+# the task and listing tables as the first release created them
+OLD_SCHEMA = """\
+CREATE TABLE "MediaTask" (
+  "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+  "title" TEXT NOT NULL,
+  "provider" TEXT NOT NULL,
+  "task_id" INTEGER,
+  "args" JSON NOT NULL,
+  "kwargs" JSON NOT NULL,
+  "classtype" TEXT NOT NULL,
+  "pid" INTEGER,
+  "started" DATETIME,
+  "elapsed" INTERVAL,
+  "dest" TEXT,
+  "postprocessors" JSON,
+  "stage_results" JSON
+);
+CREATE TABLE "MediaListing" (
+  "media_listing_id" INTEGER PRIMARY KEY AUTOINCREMENT,
+  "provider_id" TEXT NOT NULL,
+  "attrs" JSON NOT NULL,
+  "task" INTEGER REFERENCES "MediaTask" ("id") ON DELETE SET NULL,
+  "downloaded" DATETIME,
+  "viewed" DATETIME,
+  "classtype" TEXT NOT NULL,
+  "content" TEXT,
+  "channel" INTEGER,
+  "title" TEXT,
+  "is_inflated" BOOLEAN
+);
+CREATE INDEX "idx_medialisting__task" ON "MediaListing" ("task");
+INSERT INTO "MediaTask" ("title", "provider", "args", "kwargs", "classtype")
+    VALUES ('task', 'Provider', '[]', '{}', 'DownloadMediaTask');
+INSERT INTO "MediaListing" ("provider_id", "attrs", "task", "classtype")
+    VALUES ('provider', '{}', 1, 'MediaListing');
+"""
+
+
+@unittest.skipIf(model is None, "dependencies aren't installed")
+class TestMigrate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if not model.db.provider:
+            model.init(":memory:")
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tempdir.name, "old.sqlite")
+        conn = sqlite3.connect(self.filename)
+        conn.executescript(OLD_SCHEMA)
+        conn.close()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.filename)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def columns(self, table):
+        return [row[1] for row in self.query(f'PRAGMA table_info("{table}")')]
+
+    def test_columns_match_mapping(self):
+        model.migrate(self.filename)
+        for table in ["MediaTask", "MediaListing"]:
+            expected = [
+                c.name for c in model.db.schema.tables[table].column_list
+            ]
+            self.assertEqual(
+                [c for c in expected if c not in self.columns(table)], []
+            )
+
+    def test_contents_kept(self):
+        model.migrate(self.filename)
+        self.assertEqual(
+            self.query(
+                'SELECT "media_task_id", "title", "listing", "priority", "status" '
+                'FROM "MediaTask"'
+            ),
+            [(1, "task", 1, 0, "")]
+        )
+        self.assertEqual(
+            self.query('SELECT "label", "task" FROM "MediaListing"'),
+            [("", None)]
+        )
+        self.assertIn(
+            ("idx_mediatask__listing",),
+            self.query("SELECT name FROM sqlite_master WHERE type = 'index'")
+        )
+
+    def test_migrate_twice(self):
+        model.migrate(self.filename)
+        model.migrate(self.filename)
+        self.assertEqual(len(self.query('SELECT * FROM "MediaTask"')), 1)
+
+
+@unittest.skipIf(model is None, "dependencies aren't installed")
+class TestFilenameTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.listing = AttrDict(
+            provider="yt", safe_title="A Title", sources=[None, None]
+        )
+        self.source = AttrDict(rank=1, uri="yt/abc", ext="mp4")
+
+    def test_format(self):
+        template = model.FilenameTemplate(
+            "/out", "{listing.title}.{index}of{num:02d}.{uri}.{ext}"
+        )
+        self.assertTrue(template.has_uri)
+        self.assertTrue(template.has_ext)
+        self.assertEqual(
+            template.format(self.source, self.listing),
+            "/out/A Title.2of02.uri=yt+abc=.mp4"
+        )
+
+    def test_glob(self):
+        template = model.FilenameTemplate(
+            "/out", "{listing.title}.{index}.{uri}.{ext}"
+        )
+        self.assertEqual(
+            template.format(self.source, self.listing, glob=True),
+            "/out/A Title.2.*.*"
+        )
+
+    def test_provider_fields_translated(self):
+        template = model.FilenameTemplate(None, "{{literal}}.{channel}.{ext}")
+        self.assertFalse(template.has_uri)
+        self.assertEqual(
+            template.format(
+                self.source, self.listing,
+                translate=lambda s: s.replace("{channel}", "news")
+            ),
+            "./{literal}.news.mp4"
+        )
+        self.assertEqual(
+            template.format(self.source, self.listing, glob=True),
+            "./{literal}.*.*"
+        )
+
+    def test_normalization(self):
+        template = model.FilenameTemplate("/out", "{listing.title}", "NFD")
+        self.listing.safe_title = "caf\u00e9"
+        self.assertEqual(
+            template.format(self.source, self.listing), "/out/cafe\u0301"
+        )
+
+    def test_invalid_templates(self):
+        with self.assertRaises(model.SGInvalidFilenameTemplate):
+            model.FilenameTemplate("/out", "{channel.name}")
+        with self.assertRaises(model.SGInvalidFilenameTemplate):
+            model.FilenameTemplate("/out", "{listing.title")
+
+
+if __name__ == "__main__":
+    unittest.main()
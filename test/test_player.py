@@ -0,0 +1,123 @@
+import unittest
+import asyncio
+import json
+import os
+import re
+import tempfile
+
+try:
+    from aiohttp import web
+    from streamglob import player
+except ImportError:
+    player = None
+
+
+DATA = bytes(range(256)) * 40
+
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d+)")
+
+
+@unittest.skipIf(player is None, "dependencies aren't installed")
+class TestHTTPDownloader(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.outfile = os.path.join(self.tempdir.name, "out.bin")
+        self.ranges = []
+        self.ranged = True
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    async def handle(self, request):
+        m = RANGE_RE.match(request.headers.get("Range", ""))
+        if not (m and self.ranged):
+            return web.Response(body=DATA)
+        (start, end) = (int(m.group(1)), int(m.group(2)))
+        self.ranges.append((start, end))
+        return web.Response(
+            status=206,
+            body=DATA[start:end+1],
+            headers={"Content-Range": f"bytes {start}-{end}/{len(DATA)}"}
+        )
+
+    def download(self, resume=False, **kwargs):
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/file", self.handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.url = f"http://127.0.0.1:{port}/file"
+            try:
+                downloader = player.HTTPDownloader("http", **kwargs)
+                downloader.source = [self.url]
+                downloader.process_args(None, self.outfile)
+                if resume:
+                    self.write_state(downloader)
+                    downloader.resume()
+                proc = await downloader.run()
+                return await proc.wait()
+            finally:
+                await runner.cleanup()
+
+        returncode = asyncio.run(run())
+        with open(self.outfile, "rb") as f:
+            return (returncode, f.read())
+
+    def write_state(self, downloader):
+        # the first half of each segment has already been written
+        segments = downloader.split(len(DATA))
+        with open(self.outfile, "wb") as f:
+            f.truncate(len(DATA))
+            for segment in segments:
+                half = (segment[1] - segment[0] + 1) // 2
+                f.seek(segment[0])
+                f.write(DATA[segment[0]:segment[0]+half])
+                segment[2] = half
+        with open(downloader.state_file, "w") as f:
+            json.dump(dict(url=self.url, size=len(DATA), segments=segments), f)
+
+    def test_split(self):
+        downloader = player.HTTPDownloader("http", connections=3, min_segment_size=100)
+        self.assertEqual(
+            downloader.split(1000),
+            [[0, 332, 0], [333, 665, 0], [666, 999, 0]]
+        )
+        # never smaller than the minimum segment size
+        self.assertEqual(downloader.split(150), [[0, 149, 0]])
+
+    def test_ranged_download(self):
+        (returncode, data) = self.download(connections=4, min_segment_size=1000)
+        self.assertEqual(returncode, 0)
+        self.assertEqual(data, DATA)
+        # the probe, then one request per segment
+        self.assertEqual(
+            sorted(self.ranges),
+            [(0, 0), (0, 2559), (2560, 5119), (5120, 7679), (7680, 10239)]
+        )
+        self.assertFalse(os.path.exists(self.outfile + ".sgdl"))
+
+    def test_unranged_download(self):
+        self.ranged = False
+        (returncode, data) = self.download(connections=4, min_segment_size=1000)
+        self.assertEqual(returncode, 0)
+        self.assertEqual(data, DATA)
+
+    def test_resume(self):
+        (returncode, data) = self.download(
+            resume=True, connections=2, min_segment_size=1000
+        )
+        self.assertEqual(returncode, 0)
+        self.assertEqual(data, DATA)
+        # only the unwritten halves are fetched
+        self.assertEqual(
+            sorted(self.ranges), [(0, 0), (2560, 5119), (7680, 10239)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+import asyncio
+
+from orderedattrdict import AttrDict
+
+try:
+    from streamglob import playlist
+except ImportError:
+    playlist = None
+
+
+def make_items(row_num, count):
+    return [AttrDict(row_num=row_num, index=i) for i in range(count)]
+
+
+@unittest.skipIf(playlist is None, "dependencies aren't installed")
+class TestPlayItems(unittest.TestCase):
+
+    def setUp(self):
+        self.items = playlist.PlayItems()
+        for row_num, count in enumerate([2, 1, 3]):
+            self.items.add_row((row_num, count), make_items(row_num, count))
+
+    def test_indexing(self):
+        self.assertEqual(len(self.items), 6)
+        self.assertEqual(self.items.row_positions(1), range(2, 3))
+        self.assertEqual(self.items.row_positions(3), range(0))
+        self.assertEqual(
+            [self.items.row_of(pos) for pos in range(6)], [0, 0, 1, 2, 2, 2]
+        )
+
+    def test_truncate(self):
+        self.items.truncate(1)
+        self.assertEqual(len(self.items), 2)
+        self.assertEqual(self.items.row_keys, [(0, 2)])
+        self.items.truncate(5)
+        self.assertEqual(len(self.items), 2)
+
+    def test_replace_row_same_size(self):
+        replacement = make_items(1, 1)
+        self.items.replace_row(1, (1, 1), replacement)
+        self.assertIs(self.items[2], replacement[0])
+        self.assertEqual(self.items.row_positions(2), range(3, 6))
+
+    def test_replace_row_shifts_later_rows(self):
+        self.items.replace_row(0, (0, 4), make_items(0, 4))
+        self.assertEqual(len(self.items), 8)
+        self.assertEqual(self.items.row_keys, [(0, 4), (1, 1), (2, 3)])
+        self.assertEqual(self.items.row_positions(1), range(4, 5))
+        self.assertEqual(self.items.row_positions(2), range(5, 8))
+        self.assertEqual(
+            [self.items.row_of(pos) for pos in range(8)], [0, 0, 0, 0, 1, 2, 2, 2]
+        )
+
+        self.items.replace_row(0, (0, 1), make_items(0, 1))
+        self.assertEqual(self.items.row_positions(1), range(1, 2))
+        self.assertEqual(self.items.row_positions(2), range(2, 5))
+
+
+class StubPlayer(object):
+    """
+    Applies playlist commands to a list of locators the way mpv applies them
+    to its playlist.
+    """
+
+    def __init__(self, playlist):
+        self.playlist = list(playlist)
+        self.commands = []
+
+    async def command(self, name, *args):
+        self.commands.append((name, *args))
+        if name == "get_property":
+            return len(self.playlist)
+        elif name == "loadfile":
+            self.playlist.append(args[0])
+        elif name == "playlist-remove":
+            del self.playlist[args[0]]
+        elif name == "playlist-move":
+            (src, dst) = args
+            # the entry at `src` takes the place of the one at `dst`
+            self.playlist.insert(dst, self.playlist[src])
+            del self.playlist[src + 1 if src >= dst else src]
+
+
+def entries(*keys):
+    return [((key, 0), f"{key}.mp4") for key in keys]
+
+
+@unittest.skipIf(playlist is None, "dependencies aren't installed")
+class TestPlaylistSync(unittest.TestCase):
+
+    def assertDiffApplies(self, old, new):
+        player = StubPlayer([locator for key, locator in old])
+        commands = playlist.PlaylistSync.diff(old, new)
+        asyncio.run(self.apply(player, commands))
+        self.assertEqual(player.playlist, [locator for key, locator in new])
+        return commands
+
+    async def apply(self, player, commands):
+        for command in commands:
+            await player.command(*command)
+
+    def test_unchanged(self):
+        self.assertEqual(
+            self.assertDiffApplies(entries(1, 2, 3), entries(1, 2, 3)), []
+        )
+
+    def test_append_page(self):
+        commands = self.assertDiffApplies(entries(1, 2), entries(1, 2, 3, 4))
+        self.assertEqual(
+            commands,
+            [("loadfile", "3.mp4", "append"), ("loadfile", "4.mp4", "append")]
+        )
+
+    def test_remove_and_reorder(self):
+        self.assertDiffApplies(entries(1, 2, 3, 4), entries(4, 2))
+        self.assertDiffApplies(entries(1, 2, 3), entries(3, 1, 2))
+        self.assertDiffApplies(entries(1, 2, 3), entries(5, 3, 4, 1))
+
+    def test_replaced_locator(self):
+        old = entries(1, 2, 3)
+        new = list(old)
+        new[1] = (new[1][0], "repaired.mp4")
+        commands = self.assertDiffApplies(old, new)
+        # the replacement is added before the old entry is removed
+        self.assertEqual(commands[-1], ("playlist-remove", 1))
+        self.assertEqual(
+            self.assertDiffApplies(entries(1), [((1, 0), "repaired.mp4")]),
+            [("loadfile", "repaired.mp4", "append"), ("playlist-remove", 0)]
+        )
+
+    def test_sync(self):
+        sync = playlist.PlaylistSync()
+        owner = object()
+        player = StubPlayer(["1.mp4", "2.mp4"])
+        items = [
+            AttrDict(media_listing_id=key, index=0, locator=f"{key}.mp4")
+            for key in (1, 2)
+        ]
+        sync.loaded(owner, player, items)
+        items.append(AttrDict(media_listing_id=3, index=0, locator="3.mp4"))
+        self.assertTrue(asyncio.run(sync.sync(owner, player, items)))
+        self.assertEqual(player.playlist, ["1.mp4", "2.mp4", "3.mp4"])
+
+        # another view's items, or a player whose playlist has changed under
+        # us, need a reload
+        self.assertFalse(asyncio.run(sync.sync(object(), player, items)))
+        player.playlist.pop()
+        self.assertFalse(asyncio.run(sync.sync(owner, player, items)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import asyncio
+import os
+import tempfile
+
+from orderedattrdict import AttrDict
+
+try:
+    from streamglob import postprocessing
+    from streamglob.exceptions import SGException
+except ImportError:
+    postprocessing = None
+
+
+class ExitedProcess(object):
+
+    def __init__(self, returncode):
+        self.returncode = returncode
+
+    async def wait(self):
+        return self.returncode
+
+
+class StubExecutor(postprocessing.PostprocessingExecutor if postprocessing else object):
+    """
+    Runs each stage by writing its output file and exiting with the next of
+    `returncodes`, instead of running a postprocessor.
+    """
+
+    def __init__(self, returncodes, write=True):
+        super().__init__()
+        self.returncodes = list(returncodes)
+        self.write = write
+
+    @property
+    def max_workers(self):
+        return 1
+
+    @staticmethod
+    def is_streaming(spec):
+        return False
+
+    async def start_group(self, task, group, infile, outfile):
+        if self.write:
+            with open(outfile, "w") as f:
+                f.write(f"{group} of {infile}")
+        return [ExitedProcess(self.returncodes.pop(0))]
+
+
+class StageTask(AttrDict):
+
+    @property
+    def stage(self):
+        return len(self.stage_results)
+
+    @property
+    def stage_infile(self):
+        return self.stage_results[-1]
+
+    @property
+    def stage_outfile(self):
+        return os.path.join(self.tempdir, f"{self.stage}.tmp")
+
+    def reset(self):
+        pass
+
+
+@unittest.skipIf(postprocessing is None, "dependencies aren't installed")
+class TestPostprocessingExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        download = os.path.join(self.tempdir.name, "0.tmp")
+        open(download, "w").close()
+        self.task = StageTask(
+            title="task",
+            tempdir=self.tempdir.name,
+            postprocessors=["first", "second"],
+            stage_results=[download],
+            stage_times=None
+        )
+        self.stages = []
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def run_stages(self, executor):
+        asyncio.run(
+            executor.run(self.task, on_stage=lambda t: self.stages.append(t.stage))
+        )
+
+    def test_stages_chain(self):
+        self.run_stages(StubExecutor([0, 0]))
+        self.assertEqual(self.task.postprocessors, [])
+        self.assertEqual(self.stages, [2, 3])
+        self.assertTrue(self.task.stage_results[-1].endswith("2.tmp"))
+
+    def test_nonzero_exit_fails(self):
+        with self.assertRaises(SGException):
+            self.run_stages(StubExecutor([0, 1]))
+        # the failed stage is left to be retried, and its output is removed
+        self.assertEqual(self.task.postprocessors, ["second"])
+        self.assertEqual(len(self.task.stage_results), 2)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tempdir.name, "2.tmp"))
+        )
+
+    def test_missing_output_fails(self):
+        with self.assertRaises(SGException):
+            self.run_stages(StubExecutor([0], write=False))
+        self.assertEqual(self.task.postprocessors, ["first", "second"])
+        self.assertEqual(len(self.task.stage_results), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
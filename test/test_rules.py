@@ -0,0 +1,77 @@
+import unittest
+
+try:
+    from streamglob import rules
+except ImportError:
+    rules = None
+
+
+@unittest.skipIf(rules is None, "dependencies aren't installed")
+class TestKeywordMatcher(unittest.TestCase):
+
+    def test_overlapping_keywords(self):
+        matcher = rules.KeywordMatcher(
+            [("he", 0), ("she", 1), ("his", 2), ("hers", 3)]
+        )
+        self.assertEqual(matcher.search("ushers"), {0, 1, 3})
+        self.assertEqual(matcher.search("this"), {2})
+        self.assertEqual(matcher.search("nothing"), set())
+        self.assertFalse(rules.KeywordMatcher([]))
+
+
+@unittest.skipIf(rules is None, "dependencies aren't installed")
+class TestRuleSet(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = rules.RuleSet({
+            "goal": "highlight",
+            r"\bfull game\b": "replay",
+            r"(\w+) vs\.? \1": "mirror",
+            "game": "game",
+            "[invalid": "broken"
+        }, attrs={"highlight": "hl", "replay": "rp"})
+
+    def test_first_rule_wins(self):
+        self.assertEqual(self.rules.label("Full Game: late GOAL"), "highlight")
+        self.assertEqual(self.rules.label("FULL GAME replay"), "replay")
+        self.assertEqual(self.rules.label("game recap"), "game")
+        self.assertIsNone(self.rules.label("interview"))
+        self.assertIsNone(self.rules.label(None))
+
+    def test_separate_rules(self):
+        # backreferences can't be combined with the other rules
+        self.assertEqual(self.rules.separate, [2])
+        self.assertEqual(self.rules.label("Kings vs Kings game"), "mirror")
+        self.assertEqual(self.rules.label("Kings vs Jets game"), "game")
+
+    def test_overlapping_combined_match(self):
+        ruleset = rules.RuleSet({"b.d": "first", "ab": "second"})
+        # the combined regex matches "ab" for the second rule, which hides
+        # the overlapping "bcd" for the first
+        self.assertEqual(ruleset.label("abcd"), "first")
+        self.assertEqual(ruleset.label("abce"), "second")
+
+    def test_label_all(self):
+        self.assertEqual(
+            self.rules.label_all(["goal", "recap", "game"]),
+            ["highlight", None, "game"]
+        )
+
+    def test_highlight(self):
+        self.assertEqual(
+            self.rules.highlight("Full Game: Goal"),
+            [("rp", "Full Game"), ": ", ("hl", "Goal")]
+        )
+        self.assertEqual(
+            self.rules.highlight("a game"), ["a ", "game"]
+        )
+
+    def test_highlight_separate(self):
+        self.assertEqual(
+            self.rules.spans("Kings vs Kings goal"),
+            [(0, 14, 2), (15, 19, 0)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,406 @@
+import unittest
+import asyncio
+import os
+import tempfile
+
+from orderedattrdict import AttrDict
+from pony.orm import db_session, commit
+
+try:
+    from streamglob import config
+    from streamglob import model
+    from streamglob import tasks
+except ImportError:
+    tasks = None
+
+
+CONFIG = """\
+profiles:
+    default: {}
+tasks:
+    max: 10
+    max_per_host: 2
+    providers:
+        instagram:
+            max: 1
+            priority: -1
+"""
+
+
+def setUpModule():
+    if tasks is None:
+        return
+    with tempfile.TemporaryDirectory() as tempdir:
+        config_file = os.path.join(tempdir, "config.yaml")
+        with open(config_file, "w") as f:
+            f.write(CONFIG)
+        config.load(config_file)
+
+
+def make_task(task_id, priority=0, provider_id=None, url=None):
+    return AttrDict(
+        task_id=task_id,
+        title=f"task {task_id}",
+        started=None,
+        priority=priority,
+        provider="Provider",
+        provider_id=provider_id,
+        sources=[AttrDict(url=url)] if url else [],
+        listing=None
+    )
+
+
+@unittest.skipIf(tasks is None, "dependencies aren't installed")
+class TestTaskQueue(unittest.TestCase):
+
+    def drain(self, queue, eligible=None):
+        popped = []
+        while True:
+            task = queue.pop(eligible)
+            if not task:
+                return popped
+            popped.append(task.task_id)
+
+    def test_priority_then_fifo(self):
+        queue = tasks.TaskQueue()
+        for task_id, priority in [(1, 0), (2, 5), (3, 0), (4, 5), (5, -1)]:
+            queue.append(make_task(task_id, priority))
+        self.assertEqual([t.task_id for t in queue], [2, 4, 1, 3, 5])
+        self.assertEqual(self.drain(queue), [2, 4, 1, 3, 5])
+
+    def test_remove_and_reprioritize(self):
+        queue = tasks.TaskQueue()
+        queued = [make_task(i) for i in range(1, 5)]
+        for task in queued:
+            queue.append(task)
+        queue.remove(queued[0])
+        queue.reprioritize(queued[3], 1)
+        self.assertEqual(len(queue), 3)
+        self.assertNotIn(queued[0], queue)
+        self.assertEqual(self.drain(queue), [4, 2, 3])
+
+    def test_ineligible_classes_are_skipped(self):
+        queue = tasks.TaskQueue(key=lambda task: task.provider_id)
+        queue.append(make_task(1, 5, "a"))
+        queue.append(make_task(2, 0, "b"))
+        queue.append(make_task(3, 1, "a"))
+        self.assertEqual(self.drain(queue, lambda key: key != "a"), [2])
+        self.assertEqual(self.drain(queue), [1, 3])
+
+
+class StubTaskManager(tasks.TaskManager if tasks else object):
+
+    def launch(self, coro):
+        # only scheduling is under test, so don't run the tasks
+        coro.close()
+
+
+@unittest.skipIf(tasks is None, "dependencies aren't installed")
+class TestTaskManagerLimits(unittest.TestCase):
+
+    def schedule(self, queued):
+
+        async def run():
+            manager = StubTaskManager()
+            for task in queued:
+                manager.download(task)
+            manager.schedule()
+            if manager.store._flush_handle:
+                manager.store._flush_handle.cancel()
+            return manager
+
+        return asyncio.run(run())
+
+    def test_provider_priority_from_config(self):
+        task = make_task(None, provider_id="instagram")
+        self.schedule([task])
+        self.assertEqual(task.priority, -1)
+
+    def test_per_provider_limit(self):
+        manager = self.schedule([
+            make_task(None, provider_id="instagram", url=f"https://ig{i}/x")
+            for i in range(3)
+        ] + [
+            make_task(None, provider_id="youtube", url=f"https://yt{i}/x")
+            for i in range(3)
+        ])
+        active = [t.provider_id for t in manager.active]
+        self.assertEqual(active.count("instagram"), 1)
+        self.assertEqual(active.count("youtube"), 3)
+        self.assertEqual(len(manager.to_download), 2)
+
+    def test_per_host_limit(self):
+        manager = self.schedule([
+            make_task(None, provider_id="youtube", url="https://same/x")
+            for i in range(3)
+        ] + [
+            make_task(None, provider_id="youtube", url="https://other/x")
+        ])
+        hosts = [manager.task_host(t) for t in manager.active]
+        self.assertEqual(hosts.count("same"), 2)
+        self.assertEqual(hosts.count("other"), 1)
+        self.assertEqual(len(manager.to_download), 1)
+
+    def test_highest_priority_scheduled_first(self):
+        queued = [
+            make_task(None, priority=i, provider_id="instagram", url=f"https://ig{i}/x")
+            for i in range(3)
+        ]
+        manager = self.schedule(queued)
+        self.assertEqual([t.priority for t in manager.active], [2])
+
+
+class CountingTaskManager(StubTaskManager):
+
+    def __init__(self):
+        super().__init__()
+        self.schedules = 0
+
+    def schedule(self):
+        self.schedules += 1
+        super().schedule()
+
+
+@unittest.skipIf(tasks is None, "dependencies aren't installed")
+class TestTaskManagerWakeups(unittest.TestCase):
+
+    def test_scheduled_when_woken(self):
+
+        async def run():
+            manager = CountingTaskManager()
+            runner = asyncio.create_task(manager.run())
+            try:
+                await asyncio.sleep(0)
+                # idle until there's something to do
+                self.assertEqual(manager.schedules, 0)
+
+                for i in range(3):
+                    manager.download(
+                        make_task(None, provider_id="instagram", url=f"https://ig{i}/x")
+                    )
+                await asyncio.sleep(0)
+                # the wakeups from queueing are handled in one pass
+                self.assertEqual(manager.schedules, 1)
+                self.assertEqual([t.task_id for t in manager.active], [1])
+
+                # finishing the active download makes room for the next
+                manager.finish(next(iter(manager.active)), manager.active)
+                await asyncio.sleep(0)
+                self.assertEqual(manager.schedules, 2)
+                self.assertEqual([t.task_id for t in manager.active], [2])
+                self.assertEqual(len(manager.to_download), 1)
+            finally:
+                runner.cancel()
+                manager.store._flush_handle.cancel()
+
+        asyncio.run(run())
+
+
+class UnreachableTaskManager(StubTaskManager):
+
+    async def start_download(self, task):
+        raise OSError("network is unreachable")
+
+
+class BrokenPostprocessorTaskManager(StubTaskManager):
+
+    async def postprocess(self, task):
+        raise tasks.SGException("stage 1 exited with [1]")
+
+
+@unittest.skipIf(tasks is None, "dependencies aren't installed")
+class TestTaskManagerFailures(unittest.TestCase):
+
+    def test_failed_start_is_kept(self):
+
+        async def run():
+            manager = UnreachableTaskManager()
+            task = model.DownloadMediaTask.attr_class(
+                title="unreachable", sources=[], task_id=1
+            )
+            manager.active.append(task)
+            await manager.run_download_task(task)
+            manager.store._flush_handle.cancel()
+            return (manager, task)
+
+        (manager, task) = asyncio.run(run())
+        self.assertIn(task, manager.failed)
+        self.assertEqual(len(manager.active), 0)
+        self.assertEqual(task.status, "failed")
+        # saved, not deleted, so it's retried after a restart
+        self.assertEqual(manager.store._pending[task.task_id], (task, False))
+
+    def test_failed_postprocessing_is_kept(self):
+
+        async def run():
+            manager = BrokenPostprocessorTaskManager()
+            task = model.DownloadMediaTask.attr_class(
+                title="broken", sources=[], task_id=1,
+                postprocessors=["broken"], stage_results=["0.tmp"]
+            )
+            manager.postprocessing.append(task)
+            await manager.resume_postprocessing(task)
+            if manager.progress_task:
+                manager.progress_task.cancel()
+            manager.store._flush_handle.cancel()
+            return (manager, task)
+
+        (manager, task) = asyncio.run(run())
+        self.assertIn(task, manager.failed)
+        self.assertEqual(len(manager.postprocessing), 0)
+        # not moved to the destination, and retried from the failed stage
+        self.assertEqual(task.stage_results, ["0.tmp"])
+        self.assertEqual(task.status, "processing failed")
+
+
+@unittest.skipIf(tasks is None, "dependencies aren't installed")
+class TestTaskStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if not model.db.provider:
+            model.init(":memory:")
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        with db_session:
+            model.DownloadMediaTask.select().delete(bulk=True)
+
+    @db_session
+    def make_source(self, task_id):
+        source = model.MediaSource(
+            provider_id="test", url=f"https://example.com/{task_id}.mp4"
+        )
+        commit()
+        return source.detach()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def path(self, name, create=False):
+        path = os.path.join(self.tempdir.name, name)
+        if create:
+            open(path, "w").close()
+        return path
+
+    def make_task(self, task_id, status, **kwargs):
+        if "sources" not in kwargs:
+            kwargs["sources"] = [self.make_source(task_id)]
+        task = model.DownloadMediaTask.attr_class(
+            title=f"task {task_id}", task_id=task_id,
+            provider="Test", provider_id="test",
+            dest=self.path(f"{task_id}.mp4"), **kwargs
+        )
+        task.status = status
+        return task
+
+    def restore(self, *queued):
+
+        async def run():
+            store = tasks.TaskStore()
+            for task_id, status, kwargs in queued:
+                store.save(self.make_task(task_id, status, **kwargs))
+            store.flush()
+            manager = StubTaskManager()
+            manager.restore()
+            manager.store.flush()
+            return manager
+
+        return asyncio.run(run())
+
+    def test_restore(self):
+        manager = self.restore(
+            (1, "pending", dict(priority=2)),
+            (2, "downloading", dict(
+                stage_results=[self.path("2.part", create=True)]
+            )),
+            (3, "piping", dict(
+                stage_results=[self.path("3.part", create=True)],
+                postprocessors=["remux"]
+            )),
+            (4, "processing failed", dict(
+                stage_results=[self.path("4.part")],
+                postprocessors=["remux"]
+            ))
+        )
+        restored = {t.title: t for t in manager.to_download}
+        self.assertEqual(
+            sorted(restored), ["task 1", "task 2", "task 3"]
+        )
+        self.assertEqual(restored["task 1"].priority, 2)
+        self.assertEqual(restored["task 1"].provider_id, "test")
+        self.assertEqual(
+            [s.url for s in restored["task 1"].sources],
+            ["https://example.com/1.mp4"]
+        )
+
+        # an interrupted download is resumed
+        self.assertTrue(restored["task 2"].resume)
+        self.assertEqual(restored["task 2"].stage_results, [])
+        self.assertTrue(os.path.exists(self.path("2.part")))
+
+        # but one that was being postprocessed as it arrived starts over
+        self.assertFalse(restored["task 3"].resume)
+        self.assertFalse(os.path.exists(self.path("3.part")))
+
+        # postprocessing picks up from the last stage
+        self.assertEqual(
+            [t.title for t in manager.postprocessing], ["task 4"]
+        )
+        self.assertEqual(
+            next(iter(manager.postprocessing)).stage_results, [self.path("4.part")]
+        )
+
+    def test_finished_task_not_restored(self):
+        self.restore((1, "downloading", {}), (2, "processing", {}))
+        open(self.path("1.mp4"), "w").close()
+        manager = self.restore()
+        self.assertEqual([t.title for t in manager.to_download], [])
+        self.assertEqual([t.title for t in manager.postprocessing], ["task 2"])
+        with db_session:
+            self.assertEqual(
+                [t.title for t in model.DownloadMediaTask.select()], ["task 2"]
+            )
+
+    def test_unstored_sources_not_saved(self):
+        unstored = model.MediaSource.attr_class(provider_id="test")
+        manager = self.restore((1, "pending", dict(sources=[unstored])))
+        self.assertEqual(len(manager.to_download), 0)
+
+
+@unittest.skipIf(tasks is None, "dependencies aren't installed")
+class TestDownloadTaskFinalize(unittest.TestCase):
+
+    def test_finalize_without_dest(self):
+
+        async def run():
+            task = model.DownloadMediaTask.attr_class(title="no dest", sources=[])
+            task.finalize()
+
+        asyncio.run(run())
+
+    def test_finalize_moves_staged_output(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            dest = os.path.join(tempdir, "out", "video.mp4")
+
+            async def run():
+                task = model.DownloadMediaTask.attr_class(
+                    title="video", sources=[], dest=dest
+                )
+                staged = task.stage_outfile
+                with open(staged, "w") as f:
+                    f.write("video")
+                task.stage_results.append(staged)
+                task.finalize()
+                return staged
+
+            staged = asyncio.run(run())
+            # staged beside the destination
+            self.assertTrue(staged.startswith(os.path.dirname(dest)))
+            self.assertFalse(os.path.exists(staged))
+            with open(dest) as f:
+                self.assertEqual(f.read(), "video")
+
+
+if __name__ == "__main__":
+    unittest.main()
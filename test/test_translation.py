@@ -0,0 +1,101 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+try:
+    from streamglob import model
+    from streamglob import translation
+except ImportError:
+    translation = None
+
+
+class StubBackend(translation.TranslationBackend if translation else object):
+
+    def __init__(self, drop=0):
+        self.drop = drop
+        self.calls = []
+
+    async def translate(self, texts, src, dest):
+        self.calls.append(list(texts))
+        translated = [f"{dest}:{text}" for text in texts]
+        if self.drop:
+            translated = translated[:-self.drop]
+        return translated
+
+
+class StubGoogleTranslator(object):
+
+    def translate(self, text, src, dest):
+        # lose one of the separators
+        return SimpleNamespace(
+            text=text.replace(translation.SEPARATOR, " ", 1)
+        )
+
+
+@unittest.skipIf(translation is None, "dependencies aren't installed")
+class TestTranslator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if not model.db.provider:
+            model.init(":memory:")
+
+    def run_translator(self, backend, texts, src="auto", dest="en", **limits):
+
+        async def run():
+            translator = translation.Translator(backend=backend)
+            translator.BATCH_DELAY = 0
+            for name, value in limits.items():
+                setattr(translator, name, value)
+            try:
+                return await translator.translate(texts, src=src, dest=dest)
+            finally:
+                translator.stop()
+
+        return asyncio.run(run())
+
+    def test_chunks_by_item_count(self):
+        backend = StubBackend()
+        texts = [f"item {i}" for i in range(7)]
+        result = self.run_translator(backend, texts, dest="c1", MAX_CHUNK_ITEMS=3)
+        self.assertEqual(result, [f"c1:{t}" for t in texts])
+        self.assertEqual([len(c) for c in backend.calls], [3, 3, 1])
+
+    def test_chunks_by_size(self):
+        backend = StubBackend()
+        texts = ["a" * 10, "b" * 10, "c" * 10]
+        self.run_translator(backend, texts, dest="c2", MAX_CHUNK_CHARS=25)
+        self.assertEqual(backend.calls, [texts[:2], texts[2:]])
+
+    def test_cache_hits(self):
+        texts = ["one", "two", "one"]
+        backend = StubBackend()
+        first = self.run_translator(backend, texts, dest="c3")
+        self.assertEqual(first, ["c3:one", "c3:two", "c3:one"])
+        self.assertEqual(backend.calls, [["one", "two"]])
+
+        # a new translator only has the database cache to go on
+        backend = StubBackend()
+        second = self.run_translator(backend, texts + ["three"], dest="c3")
+        self.assertEqual(second, first + ["c3:three"])
+        self.assertEqual(backend.calls, [["three"]])
+
+    def test_mismatched_count_rejected(self):
+        texts = ["left", "right"]
+        result = self.run_translator(StubBackend(drop=1), texts, dest="c4")
+        self.assertEqual(result, [None, None])
+
+        google = translation.GoogleTranslationBackend()
+        google._translator = StubGoogleTranslator()
+        with self.assertRaises(ValueError):
+            google.translate_sync(texts, "auto", "c4")
+
+        # nothing was cached, so the texts are sent again
+        backend = StubBackend()
+        result = self.run_translator(backend, texts, dest="c4")
+        self.assertEqual(result, ["c4:left", "c4:right"])
+        self.assertEqual(backend.calls, [texts])
+
+
+if __name__ == "__main__":
+    unittest.main()